@@ -0,0 +1,105 @@
+#asyncio facade over Database
+#
+# Database calls block on file I/O and JSON encoding, so AsyncDatabase runs
+# each one on a bounded thread pool and the event loop only awaits it. The
+# pool caps how many threads touch the disk however many requests are in
+# flight. Writes to a table are coalesced: changes that arrive while a
+# flush of that table is running are applied together by the next one and
+# share its single save (one log append and fsync in WAL mode).
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from db import Database
+from planner import execute
+from sql import parse
+
+# threads doing blocking database work for an AsyncDatabase
+IO_THREADS = 8
+
+
+class AsyncDatabase:
+    """Awaitable versions of the Database calls that block.
+
+    Wraps `db` (or a new Database(**options)) and runs its calls on
+    `executor`, by default a pool of IO_THREADS threads of its own.
+    """
+
+    def __init__(self, db=None, executor=None, **options):
+        self.db = Database(**options) if db is None else db
+        self._own_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(IO_THREADS, thread_name_prefix="aiodb")
+        # (table, base_dir) -> [(change, future)] waiting for the next flush;
+        # a key is present while a flusher task runs for it
+        self._queues = {}
+        self.writes = 0
+        self.flushes = 0
+
+    async def run(self, fn, *args, **kwargs):
+        """fn(*args, **kwargs) on the thread pool; for several calls that belong together."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(fn, *args, **kwargs))
+
+    async def load(self, name, base_dir=None):
+        return await self.run(self.db.load, name, base_dir=base_dir)
+
+    async def open(self, base_dir=None):
+        return await self.run(self.db.open, base_dir)
+
+    async def refresh(self, name, base_dir=None):
+        return await self.run(self.db.refresh, name, base_dir=base_dir)
+
+    async def save(self, name, base_dir=None):
+        return await self.run(self.db.save, name, base_dir=base_dir)
+
+    async def checkpoint(self, base_dir=None):
+        return await self.run(self.db.checkpoint, base_dir)
+
+    async def select(self, name, where=None, **kwargs):
+        return await self.run(lambda: self.db.tables[name].select(where, **kwargs))
+
+    async def execute(self, statement, params=()):
+        # a SQL statement, as the REPL runs it
+        return await self.run(lambda: execute(self.db, parse(statement, params)))
+
+    async def write(self, name, change, base_dir=None):
+        """Apply change(table) all-or-nothing and save the table; returns what change returned.
+
+        The change runs on a pool thread, together with the other writes
+        to the table that were waiting for the same flush. If it raises,
+        only its own changes are rolled back, and the exception is raised
+        here.
+        """
+        key = (name, base_dir)
+        future = asyncio.get_running_loop().create_future()
+        if key not in self._queues:
+            self._queues[key] = []
+            asyncio.ensure_future(self._flush(key))
+        self._queues[key].append((change, future))
+        self.writes += 1
+        return await future
+
+    async def _flush(self, key):
+        name, base_dir = key
+        while self._queues[key]:
+            batch, self._queues[key] = self._queues[key], []
+            try:
+                outcomes = await self.run(self.db.apply_all, name, [change for change, _ in batch], base_dir=base_dir)
+            except Exception as e:
+                outcomes = [(False, e)] * len(batch)
+            else:
+                self.flushes += 1
+            for (_, future), (ok, result) in zip(batch, outcomes):
+                if future.cancelled():
+                    continue
+                if ok:
+                    future.set_result(result)
+                else:
+                    future.set_exception(result)
+        del self._queues[key]
+
+    def close(self):
+        # the pool is shut down only if this facade created it
+        if self._own_executor:
+            self.executor.shutdown(wait=True)
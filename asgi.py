@@ -0,0 +1,170 @@
+#ASGI serving mode for the web app
+#
+# Run it with any ASGI server, e.g. `uvicorn asgi:app --workers 2`. One
+# event loop per process then serves many concurrent clients:
+#   - Writes to the JSON rows API (POST/PATCH/DELETE) are applied through
+#     aiodb.AsyncDatabase. Concurrent batches on a table share one flush
+#     and one save.
+#   - Every other request (pages, API reads) runs the Flask app from
+#     webapp.py on a thread pool of its own, streaming its response back as
+#     it is produced. A response holds its thread until the client has
+#     taken the last chunk, so slow readers never hold up write flushes.
+# Blocking file I/O and JSON encoding never run on the event loop.
+
+import asyncio
+import io
+import json
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import datatypes
+import webapp
+from aiodb import IO_THREADS, AsyncDatabase
+
+API_ROWS = re.compile(r"/api/db/([^/]+)/tables/([^/]+)/rows")
+
+executor = ThreadPoolExecutor(IO_THREADS, thread_name_prefix="asgi")
+# threads running the Flask app, one per response being streamed
+STREAM_THREADS = 16
+stream_executor = ThreadPoolExecutor(STREAM_THREADS, thread_name_prefix="asgi-stream")
+# dbname -> AsyncDatabase over webapp's Database for it, so both paths share one
+databases = {}
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+    body = await read_body(receive)
+    match = API_ROWS.fullmatch(scope["path"])
+    if match and scope["method"] in webapp.API_WRITES:
+        await write_rows(scope, send, body, *match.groups())
+    else:
+        await run_wsgi(scope, send, body)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            # waiting for the pools' work to finish blocks, so not on the loop
+            loop = asyncio.get_running_loop()
+            for pool in (stream_executor, executor):
+                await loop.run_in_executor(None, pool.shutdown, True)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def in_pool(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+
+async def database(dbname):
+    if dbname not in databases:
+        # webapp catalogs the directory's tables, which reads from disk
+        d = await in_pool(webapp.get_db_instance, dbname)
+        databases.setdefault(dbname, AsyncDatabase(d, executor))
+    return databases[dbname]
+
+
+async def write_rows(scope, send, body, dbname, table):
+    """The JSON rows API's batch writes, as webapp.api_write_rows does them, but coalesced."""
+    found = await in_pool(webapp.api_table, dbname, table)
+    if found is None:
+        return await send_json(send, 404, {"error": "Table not found"})
+    try:
+        rows = await in_pool(json.loads, body)
+    except ValueError:
+        rows = None
+    if not isinstance(rows, list):
+        return await send_json(send, 400, {"error": "Expected a JSON array"})
+    change, status = webapp.API_WRITES[scope["method"]]
+    adb = await database(dbname)
+    try:
+        result = await adb.write(table, lambda t: change(t, rows), base_dir=found[2])
+    except ValueError as e:
+        return await send_json(send, 400, {"error": str(e)})
+    await send_json(send, status, result)
+
+
+async def send_json(send, status, value):
+    body = json.dumps(value, default=datatypes.to_json).encode()
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+
+def wsgi_environ(scope, body):
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        # WSGI carries the raw bytes of the path as latin-1 text
+        "PATH_INFO": scope["path"].encode().decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", ()):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = "HTTP_" + name
+        value = value.decode("latin-1")
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+
+async def run_wsgi(scope, send, body):
+    """Serve the request with the Flask app on a stream_executor thread.
+
+    The whole response is produced on that one thread (Flask's request
+    context and table read locks belong to it), each chunk being sent from
+    the event loop before the next is produced.
+    """
+    loop = asyncio.get_running_loop()
+    environ = wsgi_environ(scope, body)
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response["start"] = {"type": "http.response.start", "status": int(status.split(" ", 1)[0]),
+                             "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]}
+
+    def emit(message):
+        asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+    def respond():
+        result = webapp.app(environ, start_response)
+        try:
+            emit(response["start"])
+            for chunk in result:
+                if chunk:
+                    emit({"type": "http.response.body", "body": chunk, "more_body": True})
+            emit({"type": "http.response.body", "body": b""})
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+
+    await loop.run_in_executor(stream_executor, respond)
@@ -0,0 +1,133 @@
+#Query result cache
+#
+# Results are cached under a key naming the query (a Table.select call, or
+# a bound SELECT statement) and stored with the tables they read and each
+# table's version. Every mutation bumps a table's version, and a reloaded
+# table is a new object, so an entry is served only while all of its tables
+# are exactly as they were when it was computed. Rows that go through the
+# cache are FrozenRows, shared by every caller that gets them, whether or
+# not the result fit.
+
+import sys, threading, weakref
+from collections import OrderedDict
+
+# default bytes of cached results per Database
+RESULT_CACHE_BYTES = 16 << 20
+
+
+def estimate_size(rows):
+    # rough bytes held by a list of row dicts, from a sample of them
+    if not rows:
+        return sys.getsizeof(rows)
+    sample = rows[:: max(1, len(rows) // 100)]
+    per_row = sum(sys.getsizeof(r) + sum(sys.getsizeof(v) for v in r.values()) for r in sample) / len(sample)
+    return sys.getsizeof(rows) + int(per_row * len(rows))
+
+
+def freeze(value):
+    # a hashable form of a query argument: lists (e.g. where clauses read back from JSON) become tuples
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+class FrozenRow(dict):
+    """A cached result row: a dict that refuses changes; dict(row) is a copy that does not."""
+
+    __slots__ = ()
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Cached result rows are read-only; copy one with dict(row)")
+
+    __setitem__ = __delitem__ = __ior__ = clear = pop = popitem = setdefault = update = _read_only
+
+
+class ResultCache:
+    """LRU cache of query results, kept under a budget of `max_bytes`.
+
+    Lookups name the tables the query reads; an entry computed from other
+    table objects or versions is dropped as a miss. Results are frozen
+    into FrozenRows, and one that fits is stored; every caller, the one
+    that computed it included, gets a new list of those same rows.
+    """
+
+    def __init__(self, max_bytes=RESULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # key -> (rows, [(table ref, version)], size), least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, tables):
+        """The cached rows of `key` if computed from `tables` as they are now, else None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not self._current(entry[1], tables):
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return list(entry[0])
+
+    def put(self, key, versions, rows):
+        """Freeze `rows`, cache them if they fit, and return a new list of the frozen rows.
+
+        versions: what versioned() returned before the rows were computed.
+        """
+        size = estimate_size(rows)
+        rows = [r if isinstance(r, FrozenRow) else FrozenRow(r) for r in rows]
+        # results over budget are not kept, but frozen all the same, so a
+        # caller gets the same kind of rows whatever the result's size
+        if size > self.max_bytes:
+            return rows
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (rows, versions, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+        return list(rows)
+
+    def cached(self, key, tables, compute):
+        """The rows of `key`: from the cache, or compute() them and cache them."""
+        try:
+            hash(key)
+        except TypeError:
+            return compute()
+        rows = self.get(key, tables)
+        if rows is not None:
+            return rows
+        # versions are taken first: a write meanwhile leaves the entry stale, never wrong
+        versions = self.versioned(tables)
+        return self.put(key, versions, compute())
+
+    @staticmethod
+    def versioned(tables):
+        return [(weakref.ref(t), t.version) for t in tables]
+
+    @staticmethod
+    def _current(versions, tables):
+        return len(versions) == len(tables) and all(
+            ref() is t and t.version == version for (ref, version), t in zip(versions, tables))
+
+    def _drop(self, key):
+        self.size -= self._entries.pop(key)[2]
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "entries": len(self._entries), "bytes": self.size}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+            self.hits = self.misses = self.evictions = 0
@@ -0,0 +1,167 @@
+#Column storage for columnar tables
+
+from array import array
+
+import datatypes
+
+
+class Column:
+    """Values of one column: dictionary-encoded strings plus a validity bitmap.
+
+    Strings are stored as codes into `dictionary`. The first non-string
+    value switches the column to a plain `values` list. NULLs are cleared
+    bits in `validity` rather than stored values.
+    """
+
+    def __init__(self):
+        self.codes = array("I")
+        self.dictionary = []
+        self.encoding = {}
+        self.values = None
+        self.validity = bytearray()
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def is_valid(self, i):
+        return self.validity[i >> 3] & (1 << (i & 7))
+
+    def _set_valid(self, i, valid):
+        if valid:
+            self.validity[i >> 3] |= 1 << (i & 7)
+        else:
+            self.validity[i >> 3] &= ~(1 << (i & 7)) & 0xFF
+
+    def code(self, value):
+        # dictionary code of a string, or None if it never occurs
+        if self.values is not None:
+            return None
+        return self.encoding.get(value)
+
+    def _encode(self, value):
+        code = self.encoding.get(value)
+        if code is None:
+            code = self.encoding[value] = len(self.dictionary)
+            self.dictionary.append(value)
+        return code
+
+    def _to_plain(self):
+        self.values = [self.get(i) for i in range(self.size)]
+        self.codes = array("I")
+        self.dictionary = []
+        self.encoding = {}
+
+    def _accepts(self, value):
+        if value is not None and self.values is None and not isinstance(value, str):
+            self._to_plain()
+
+    def append(self, value):
+        self._accepts(value)
+        if self.values is not None:
+            self.values.append(value)
+        else:
+            self.codes.append(0 if value is None else self._encode(value))
+        if self.size % 8 == 0:
+            self.validity.append(0)
+        self.size += 1
+        self._set_valid(self.size - 1, value is not None)
+
+    def set(self, i, value):
+        self._accepts(value)
+        if self.values is not None:
+            self.values[i] = value
+        else:
+            self.codes[i] = 0 if value is None else self._encode(value)
+        self._set_valid(i, value is not None)
+
+    def pop(self):
+        # drop the last value; its dictionary entry stays
+        self.size -= 1
+        if self.values is not None:
+            self.values.pop()
+        else:
+            self.codes.pop()
+        if self.size % 8 == 0:
+            self.validity.pop()
+
+    def get(self, i):
+        if not self.validity[i >> 3] & (1 << (i & 7)):
+            return None
+        if self.values is not None:
+            return self.values[i]
+        return self.dictionary[self.codes[i]]
+
+    def _empty(self):
+        return Column()
+
+    def take(self, positions):
+        # a new column holding the given rows, in order
+        out = self._empty()
+        for i in positions:
+            out.append(self.get(i))
+        return out
+
+    def nbytes(self):
+        size = len(self.validity) + self.codes.itemsize * len(self.codes)
+        if self.values is not None:
+            size += 8 * len(self.values)
+        size += sum(len(s) + 49 for s in self.dictionary)
+        return size
+
+
+class TypedColumn(Column):
+    """Values of a typed column packed in an array (e.g. "q" for INTEGER).
+
+    NULLs hold 0 in the array and a cleared bit in `validity`. `encode` /
+    `decode`, when given, convert between values and what the array
+    holds, e.g. a TIMESTAMP and its microseconds since the epoch.
+    """
+
+    def __init__(self, typecode, encode=None, decode=None):
+        super().__init__()
+        self.values = array(typecode)
+        self.encode = encode
+        self.decode = decode
+
+    def _pack(self, value):
+        if value is None:
+            return 0
+        return value if self.encode is None else self.encode(value)
+
+    def append(self, value):
+        self.values.append(self._pack(value))
+        if self.size % 8 == 0:
+            self.validity.append(0)
+        self.size += 1
+        self._set_valid(self.size - 1, value is not None)
+
+    def set(self, i, value):
+        self.values[i] = self._pack(value)
+        self._set_valid(i, value is not None)
+
+    def get(self, i):
+        if not self.validity[i >> 3] & (1 << (i & 7)):
+            return None
+        if self.decode is None:
+            return self.values[i]
+        return self.decode(self.values[i])
+
+    def _empty(self):
+        return TypedColumn(self.values.typecode, self.encode, self.decode)
+
+    def nbytes(self):
+        return len(self.validity) + self.values.itemsize * len(self.values)
+
+
+def column_for(kind=None):
+    # an empty column for a column type; TEXT and untyped columns are dictionary-encoded
+    if kind == "INTEGER":
+        return TypedColumn("q")
+    if kind == "REAL":
+        return TypedColumn("d")
+    if kind == "BOOLEAN":
+        return TypedColumn("b", decode=bool)
+    if kind == "TIMESTAMP":
+        return TypedColumn("q", datatypes.to_micros, datatypes.from_micros)
+    return Column()
@@ -0,0 +1,115 @@
+#Column types
+#
+# A typed column stores its values natively: coerce() converts a value
+# once, at insert or update, and where-clause values compared with the
+# column get the same treatment, so comparisons never mix types. Untyped
+# columns keep whatever value they are given.
+
+from datetime import date, datetime, timedelta, timezone
+
+TYPES = ("INTEGER", "REAL", "TEXT", "BOOLEAN", "TIMESTAMP")
+# other spellings accepted in CREATE TABLE
+ALIASES = {
+    "INT": "INTEGER", "BIGINT": "INTEGER", "FLOAT": "REAL", "DOUBLE": "REAL", "VARCHAR": "TEXT",
+    "STRING": "TEXT", "BOOL": "BOOLEAN", "DATETIME": "TIMESTAMP",
+}
+
+_TRUE = {"true", "t", "yes", "y", "on", "1"}
+_FALSE = {"false", "f", "no", "n", "off", "0"}
+_INT64 = 1 << 63
+_EPOCH = datetime(1970, 1, 1)
+
+
+def type_name(name):
+    """The canonical name of a column type, e.g. "int" -> "INTEGER"."""
+    if not isinstance(name, str) or name.upper() not in TYPES + tuple(ALIASES):
+        raise ValueError(f"Unknown column type: {name}")
+    name = name.upper()
+    return ALIASES.get(name, name)
+
+
+def _integer(v):
+    if isinstance(v, str):
+        v = v.strip()
+        try:
+            v = int(v)
+        except ValueError:
+            v = float(v)
+    if isinstance(v, float):
+        if not v.is_integer():
+            raise ValueError
+        v = int(v)
+    if not isinstance(v, int) or not -_INT64 <= v < _INT64:
+        raise ValueError
+    return v
+
+
+def _real(v):
+    if isinstance(v, (str, int, float)):
+        return float(v)
+    raise ValueError
+
+
+def _text(v):
+    if isinstance(v, bool):
+        return "true" if v else "false"
+    if isinstance(v, (str, int, float)):
+        return str(v)
+    raise ValueError
+
+
+def _boolean(v):
+    if isinstance(v, int) and v in (0, 1):
+        return bool(v)
+    if isinstance(v, str) and v.strip().lower() in _TRUE | _FALSE:
+        return v.strip().lower() in _TRUE
+    raise ValueError
+
+
+def _timestamp(v):
+    if isinstance(v, str):
+        v = datetime.fromisoformat(v.strip())
+    elif isinstance(v, (int, float)):
+        v = _EPOCH + timedelta(seconds=v)
+    elif isinstance(v, date) and not isinstance(v, datetime):
+        v = datetime(v.year, v.month, v.day)
+    if not isinstance(v, datetime):
+        raise ValueError
+    # stored naive, in UTC
+    if v.tzinfo is not None:
+        v = v.astimezone(timezone.utc).replace(tzinfo=None)
+    return v
+
+
+_COERCE = {"INTEGER": _integer, "REAL": _real, "TEXT": _text, "BOOLEAN": _boolean, "TIMESTAMP": _timestamp}
+
+
+def coerce(kind, value, column=None):
+    """`value` as a value of the column type `kind`; None stays NULL."""
+    if value is None:
+        return None
+    try:
+        # bools are ints to Python, but not numbers to a typed column
+        if isinstance(value, bool) and kind in ("INTEGER", "REAL", "TIMESTAMP"):
+            raise ValueError
+        return _COERCE[kind](value)
+    except (TypeError, ValueError, OverflowError):
+        where = f" for {column}" if column else ""
+        raise ValueError(f"Invalid {kind} value{where}: {value!r}")
+
+
+def to_json(value):
+    # json.dumps default= hook: TIMESTAMPs are written as ISO 8601 text
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def to_micros(value):
+    # a TIMESTAMP as microseconds since the epoch, for typed arrays and binary files
+    delta = value - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def from_micros(n):
+    return _EPOCH + timedelta(microseconds=n)
@@ -1,19 +1,936 @@
 #Core DB Engine
 
-import json, os
+import heapq
+import json, math, os, sys, threading, time
+from bisect import bisect_right
+from collections import Counter, OrderedDict
+from collections.abc import Mapping, MutableMapping
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from itertools import compress, count, islice
+
+from cache import RESULT_CACHE_BYTES, ResultCache, freeze
+from columnar import column_for
+from index import HashIndex, INDEX_TYPES, sort_key
+from locks import ChangeCounter, FileLock, RWLock
+from wal import WAL_FILE, WriteAheadLog
+import datatypes
+import loader
+import storage
+import vector
 
 DATA_DIR = "data"
 os.makedirs(DATA_DIR, exist_ok=True)
 
+# table file extension per storage format
+TABLE_EXTS = {"json": ".json", "binary": ".tbl"}
+# per-directory schemas of the saved tables, so a catalog needs no table file
+MANIFEST_FILE = "_catalog.json"
+# shared mode: the advisory lock file and change counter of a directory
+LOCK_FILE = "_db.lock"
+COUNTER_FILE = "_version"
+
+
+def table_path(name, base):
+    # path of the table file in whichever format it was saved, or None
+    for ext in (".tbl", ".json"):
+        path = f"{base}/{name}{ext}"
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def table_names(base):
+    # tables stored in a database directory, in any format
+    if not os.path.isdir(base):
+        return []
+    names = []
+    for fname in sorted(os.listdir(base)):
+        stem, ext = os.path.splitext(fname)
+        if ext in (".json", ".tbl") and fname != MANIFEST_FILE and stem not in names:
+            names.append(stem)
+    return names
+
+
+def _file_stamp(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _log_stamp(base):
+    path = os.path.join(base, WAL_FILE)
+    return _file_stamp(path) if os.path.exists(path) else None
+
+
+def _schema_of(header):
+    keys = ("name", "columns", "types", "primary_key", "unique_keys", "indexes", "engine", "row_count")
+    return {k: header.get(k) for k in keys}
+
+
+def _index_names(schema):
+    names = [spec["name"] for spec in schema.get("indexes") or []]
+    if schema.get("primary_key"):
+        names.append(f"{schema['name']}_pkey")
+    names += [f"{schema['name']}_{uk}_key" for uk in schema.get("unique_keys") or []]
+    return names
+
+
+def _read_manifest(base):
+    try:
+        with open(os.path.join(base, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _update_manifest(base, name, entry):
+    manifest = _read_manifest(base)
+    if entry is None:
+        if manifest.pop(name, None) is None:
+            return
+    else:
+        manifest[name] = entry
+    path = os.path.join(base, MANIFEST_FILE)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(f"{path}.tmp", path)
+
+
+RANGE_OPS = ("<", "<=", ">", ">=", "BETWEEN")
+WHERE_OPS = ("=", "!=") + RANGE_OPS
+LOGICAL_OPS = ("AND", "OR", "NOT")
+AGGREGATES = ("COUNT", "SUM", "AVG", "MIN", "MAX")
+# rows sampled per table for distinct-value estimates
+STATS_SAMPLE = 1000
+# records validated and inserted per write lock by bulk_insert
+BULK_BATCH = 10000
+# numbers the Table objects of this process; a reloaded table is a new one
+_serials = count(1)
+
+
+def split_where(where):
+    # accepted forms: (col, value), (col, op, value), (col, "BETWEEN", (lo, hi))
+    if isinstance(where, (list, tuple)):
+        if len(where) == 2:
+            return where[0], "=", where[1]
+        if len(where) == 3 and where[1] in WHERE_OPS:
+            if where[1] != "BETWEEN" or (isinstance(where[2], (list, tuple)) and len(where[2]) == 2):
+                return where[0], where[1], where[2]
+    raise ValueError("where must be a (column, value) or (column, op, value) tuple")
+
+
+def is_compound(where):
+    # ("AND", w1, w2, ...), ("OR", w1, w2, ...) or ("NOT", w), nesting freely
+    if not (isinstance(where, (list, tuple)) and where and where[0] in LOGICAL_OPS):
+        return False
+    if len(where) < 2 or (where[0] == "NOT" and len(where) != 2):
+        raise ValueError(f"Invalid {where[0]} clause")
+    return True
+
+
+def where_leaves(where):
+    # the simple (col, op, value) comparisons of a where clause, validated
+    if is_compound(where):
+        for w in where[1:]:
+            yield from where_leaves(w)
+    else:
+        yield split_where(where)
+
+
+def _matcher(op, val, typed=False):
+    # typed: the column's values and `val` are of one type, so they compare
+    # natively, NULL (None) still sorting first
+    if op == "=":
+        return lambda v: v == val
+    if op == "!=":
+        return lambda v: v != val
+    if typed and val is not None and (op != "BETWEEN" or None not in val):
+        if op == "BETWEEN":
+            lo, hi = val
+            return lambda v: v is not None and lo <= v <= hi
+        if op == "<":
+            return lambda v: v is None or v < val
+        if op == "<=":
+            return lambda v: v is None or v <= val
+        if op == ">":
+            return lambda v: v is not None and v > val
+        return lambda v: v is not None and v >= val
+    if op == "BETWEEN":
+        lo, hi = sort_key(val[0]), sort_key(val[1])
+        return lambda v: lo <= sort_key(v) <= hi
+    key = sort_key(val)
+    if op == "<":
+        return lambda v: sort_key(v) < key
+    if op == "<=":
+        return lambda v: sort_key(v) <= key
+    if op == ">":
+        return lambda v: sort_key(v) > key
+    return lambda v: sort_key(v) >= key
+
+
+def row_predicate(where, getter, types=()):
+    # test of a where clause on one row; getter(col) reads a column from it.
+    # Comparisons on `types` columns must have values coerced by coerce_where
+    if is_compound(where):
+        parts = [row_predicate(w, getter, types) for w in where[1:]]
+        if where[0] == "AND":
+            return lambda h: all(p(h) for p in parts)
+        if where[0] == "OR":
+            return lambda h: any(p(h) for p in parts)
+        return lambda h: not parts[0](h)
+    col, op, val = split_where(where)
+    test = _matcher(op, val, col in types)
+    get = getter(col)
+    return lambda h: test(get(h))
+
+
+def coerce_where(where, types):
+    # the where clause with the values compared with typed columns (types:
+    # column -> type) converted to the column's type
+    if not types or not where:
+        return where
+    if is_compound(where):
+        return (where[0], *(coerce_where(w, types) for w in where[1:]))
+    col, op, val = split_where(where)
+    kind = types.get(col)
+    if kind is None:
+        return where
+    if op == "BETWEEN":
+        return (col, op, tuple(_where_value(kind, v, col) for v in val))
+    return (col, op, _where_value(kind, val, col))
+
+
+def _where_value(kind, val, col):
+    # an INTEGER column still compares numerically with a number that is not
+    # one (id < 2.5, id = 1e30): such values are left as REALs
+    try:
+        return datatypes.coerce(kind, val, col)
+    except ValueError as e:
+        error = e
+    if kind == "INTEGER":
+        try:
+            return datatypes.coerce("REAL", val, col)
+        except ValueError:
+            pass
+    raise error
+
+
+def range_bounds(op, val):
+    # SortedIndex.irange arguments for a range operator
+    if op == "BETWEEN":
+        return {"lo": val[0], "hi": val[1]}
+    if op == "<":
+        return {"hi": val, "hi_inclusive": False}
+    if op == "<=":
+        return {"hi": val}
+    if op == ">":
+        return {"lo": val, "lo_inclusive": False}
+    if op == ">=":
+        return {"lo": val}
+    return {"lo": val, "hi": val}
+
+
+class RowView(Mapping):
+    """Read-only view of some columns of one table row.
+
+    Values are read from the table on access, so a view only stays valid
+    until the table is next modified; `dict(view)` keeps a copy.
+    """
+
+    __slots__ = ("_getters", "_handle")
+
+    def __init__(self, getters, handle):
+        # getters: column -> handle reader, shared by every view of a query
+        self._getters = getters
+        self._handle = handle
+
+    def __getitem__(self, column):
+        return self._getters[column](self._handle)
+
+    def __iter__(self):
+        return iter(self._getters)
+
+    def __len__(self):
+        return len(self._getters)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class Snapshot:
+    """A table as of its last committed version, readable while writers go on.
+
+    Only opening one waits for an in-flight write; rows are then read
+    without locks. Writers keep the row versions they replace until every
+    snapshot that may see them is closed and vacuum reclaims them, so
+    close the snapshot (or use it in a `with` block) when done.
+    """
+
+    def __init__(self, table):
+        self.table = table
+        with table.lock.read():
+            table._ensure_rows()
+            self.version = table._committed
+            self._handles = table._snapshot_handles()
+            with table._snap_lock:
+                table._readers[self.version] = table._readers.get(self.version, 0) + 1
+        self._open = True
+
+    def close(self):
+        t = self.table
+        with t._snap_lock:
+            if self._open:
+                self._open = False
+                t._readers[self.version] -= 1
+                if not t._readers[self.version]:
+                    del t._readers[self.version]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        # a forgotten snapshot would keep its versions from vacuum forever
+        if getattr(self, "_open", False):
+            self.close()
+
+    def rows(self, where=None, columns=None):
+        """Yield the rows matching `where` as dicts of `columns` (default: all)."""
+        t = self.table
+        if not self._open:
+            raise ValueError("Snapshot is closed")
+        wanted = list(t._view_getters(columns))
+        needed = set(wanted)
+        if where:
+            needed.update(leaf[0] for leaf in where_leaves(where))
+            t._view_getters(needed)
+            where = coerce_where(where, t.types)
+        # requested columns first, in order
+        getters = {c: t._getter(c) for c in wanted + sorted(needed - set(wanted))}
+        test = None if not where else row_predicate(where, lambda c: lambda r: r.get(c), t.types)
+        return self._rows(getters, test, wanted)
+
+    def _rows(self, getters, test, wanted):
+        t, version = self.table, self.version
+        for h in self._handles:
+            ident = t._ident(h)
+            stamp = t._xmin.get(ident, 0)
+            row = None
+            if stamp <= version:
+                # copy, then check no writer changed the row meanwhile:
+                # writers keep the old version before restamping the row
+                if t._alive(h):
+                    row = {c: get(h) for c, get in getters.items()}
+                if t._xmin.get(ident, 0) != stamp:
+                    stamp = None
+            else:
+                stamp = None
+            if stamp is None:
+                row = None
+                for xmin, xmax, old in t._versions.get(ident, ()):
+                    if xmin <= version < xmax:
+                        row = {c: old.get(c) for c in getters}
+                        break
+            if row is not None and (test is None or test(row)):
+                yield row if len(row) == len(wanted) else {c: row[c] for c in wanted}
+
+    def select(self, where=None, columns=None):
+        return list(self.rows(where, columns))
+
+
+def _reader(method):
+    # run a Table method under the table's read lock
+    @wraps(method)
+    def locked(self, *args, **kwargs):
+        with self.lock.read():
+            return method(self, *args, **kwargs)
+    return locked
+
+
+def _writer(method):
+    # run a mutating Table method under the table's write lock
+    @wraps(method)
+    def locked(self, *args, **kwargs):
+        with self._writing():
+            return method(self, *args, **kwargs)
+    return locked
+
+
+def _synchronized(method):
+    # run a Database method under the database lock
+    @wraps(method)
+    def locked(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return locked
+
+
+def _outside_transactions(method):
+    # ... once any transaction of another thread has ended
+    @wraps(method)
+    def locked(self, *args, **kwargs):
+        with self._lock:
+            self._wait_for_transaction()
+            return method(self, *args, **kwargs)
+    return locked
+
+
 class Table:
-    def __init__(self, name, columns, primary_key=None, unique_keys=None):
+    engine = "row"
+    # row handles are the row dicts themselves, told apart by identity
+    _ident = id
+    # cache.ResultCache for select() results, set by the Database holding the table
+    result_cache = None
+
+    def __init__(self, name, columns, primary_key=None, unique_keys=None, types=None):
         self.name = name
         self.columns = columns
+        # column -> type of the typed columns (datatypes.TYPES); their values
+        # are coerced on the way in, other columns keep what they are given
+        self.types = {c: datatypes.type_name(k) for c, k in (types or {}).items()}
+        unknown = [c for c in self.types if c not in columns]
+        if unknown:
+            raise ValueError(f"Unknown columns: {unknown}")
         self.primary_key = primary_key
         self.unique_keys = unique_keys or []
-        self.rows = []
+        self._rows = []
+        # row source still to be decoded (lazy load of a binary table file)
+        self._source = None
         self.indexes = {}
+        # bumped by every mutation; (serial, version) names one state of the
+        # table in this process, and `modified` is when it was reached
+        self.version = 0
+        self.serial = next(_serials)
+        self.modified = time.time()
+        # column name -> vector.Vector, dropped on every mutation
+        self._vectors = {}
+        # the version a query last found column vectors missing at
+        self._vectors_wanted = None
+        # planner statistics and the version they were sampled at
+        self._stats = None
+        self._stats_version = 0
+        # mutations since the last save, kept only for write-ahead logging
+        self.journal = None
+        # many readers or one writer at a time
+        self.lock = RWLock()
+        # guards decoding of lazily loaded rows, which readers may trigger
+        self._load_lock = threading.Lock()
+        # undo entries of the open transaction (None outside one), the thread
+        # owning it, and the condition other writers wait on until it ends:
+        # the database's, or else the table's own `_tx_ended`
+        self._undo = None
+        self._tx_owner = None
+        self._tx_gate = None
+        self._tx_ended = threading.Condition()
+        # multi-version reads: the last committed version, and open
+        # snapshots as version they read at -> count. While any snapshot or
+        # transaction is open, writers stamp each row they create or change
+        # (row ident -> version its contents date from) and keep the
+        # versions they replace (row ident -> [(xmin, xmax, row)])
+        self._committed = 0
+        self._readers = {}
+        self._snap_lock = threading.Lock()
+        self._xmin = {}
+        self._versions = {}
+        # rows deleted by the open transaction, which snapshots still see
+        self._gone = []
+        # constraint indexes: one hash index per primary / unique key
+        self._pk_index = None
+        self._unique_indexes = {}
+        if primary_key:
+            self._pk_index = HashIndex(primary_key, unique=True, ident=self._ident)
+            self.indexes[f"{name}_pkey"] = self._pk_index
+        for uk in self.unique_keys:
+            self._unique_indexes[uk] = HashIndex(uk, unique=True, ident=self._ident)
+            self.indexes[f"{name}_{uk}_key"] = self._unique_indexes[uk]
+
+    @property
+    def rows(self):
+        self._ensure_rows()
+        return self._rows
+
+    @rows.setter
+    def rows(self, rows):
+        self._source = None
+        self._rows = rows
+        self._vectors = {}
+
+    def _ensure_rows(self):
+        if self._source is None:
+            return
+        with self._load_lock:
+            if self._source is not None:
+                source = self._source
+                self._store(source)
+                source.close()
+                self._source = None
+                self.rebuild_indexes()
+
+    def row_count(self):
+        # known from the file header while rows are still undecoded
+        if self._source is not None:
+            return len(self._source)
+        return len(self._rows)
+
+    # storage primitives; ColumnarTable overrides them with positional row ids
+
+    def _store(self, rows):
+        self._rows = list(rows)
+        self._vectors = {}
+
+    def _handles(self):
+        return self._rows
+
+    def _getter(self, column):
+        return lambda r: r.get(column)
+
+    def _row(self, handle):
+        return handle
+
+    def _materialize(self, handles):
+        return handles
+
+    def _record(self, handle):
+        return handle.copy()
+
+    def _append(self, record):
+        row = record.copy()
+        self._created(id(row))
+        self._rows.append(row)
+        return row
+
+    def _assign(self, handle, updates):
+        handle.update(updates)
+
+    def _unappend(self, handle):
+        # undo the latest _append
+        self._rows.pop()
+
+    def _discard(self, handles):
+        # returns what _undiscard needs to put the rows back
+        rows = self._rows
+        gone = {id(r) for r in handles}
+        self._rows = [r for r in rows if id(r) not in gone]
+        if self._undo is not None:
+            self._gone.extend(handles)
+        return rows
+
+    def _undiscard(self, handles, saved):
+        self._rows = saved
+
+    def _alive(self, handle):
+        return True
+
+    def _snapshot_handles(self):
+        # rows a snapshot walks: deletes replace the list, appends are stamped
+        return self._rows + self._gone if self._gone else self._rows
+
+    def _maybe_compact(self):
+        pass
+
+    def _filter(self, column, op, val):
+        test = _matcher(op, val, column in self.types)
+        return (r for r in self._rows if test(r.get(column)))
+
+    def _vector(self, column):
+        vec = self._vectors.get(column)
+        if vec is None:
+            vec = self._vectors[column] = vector.from_values([r.get(column) for r in self._rows])
+        return vec
+
+    def _positions(self, mask):
+        rows = self._rows
+        return [rows[i] for i in vector.positions(mask)]
+
+    @_writer
+    def create_index(self, name, column, kind="hash"):
+        if name in self.indexes:
+            raise ValueError(f"Index already exists: {name}")
+        if column not in self.columns:
+            raise ValueError(f"Unknown column: {column}")
+        if kind not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type: {kind}")
+        idx = INDEX_TYPES[kind](column, ident=self._ident)
+        # a lazily loaded table fills its indexes once rows are decoded
+        if self._source is None:
+            get = self._getter(column)
+            try:
+                idx.add_many((get(h), h) for h in self._handles())
+            except TypeError:
+                raise ValueError(f"Column {column} holds values a hash index cannot store")
+        self.indexes[name] = idx
+        self._track(("index", name, None))
+        self._log({"op": "create_index", "name": name, "column": column, "kind": kind})
+
+    @_writer
+    def drop_index(self, name):
+        if name not in self.indexes:
+            raise ValueError(f"Index does not exist: {name}")
+        if self.indexes[name] is self._pk_index or self.indexes[name] in self._unique_indexes.values():
+            raise ValueError(f"Cannot drop constraint index: {name}")
+        self._track(("index", name, self.indexes[name]))
+        del self.indexes[name]
+        self._log({"op": "drop_index", "name": name})
+
+    def _log(self, entry):
+        self.version += 1
+        self.modified = time.time()
+        self._vectors = {}
+        if self._undo is None:
+            self._commit_version()
+        if self.journal is not None:
+            self.journal.append(entry)
+            self._track(("log", entry))
+
+    def _commit_version(self):
+        # make the current version the one new snapshots read
+        self._committed = self.version
+        self._gone = []
+        if not self._readers and (self._xmin or self._versions):
+            self._xmin, self._versions = {}, {}
+
+    def _keeping(self):
+        # whether writes must keep versions: a snapshot or transaction is open
+        return bool(self._readers) or self._undo is not None
+
+    def _created(self, ident):
+        # before a new row becomes visible: stamp it with the version being written
+        if self._keeping():
+            self._xmin[ident] = self.version + 1
+
+    def _supersede(self, handle):
+        # before a row is changed or deleted: keep its current version
+        if self._keeping():
+            ident = self._ident(handle)
+            self._versions.setdefault(ident, []).append(
+                (self._xmin.get(ident, 0), self.version + 1, self._record(handle)))
+            self._xmin[ident] = self.version + 1
+
+    def snapshot(self):
+        """A Snapshot of the last committed version, read without blocking writers."""
+        return Snapshot(self)
+
+    def vacuum(self):
+        """Reclaim row versions no open snapshot can see any more; returns how many were dropped."""
+        with self.lock.write():
+            with self._snap_lock:
+                horizon = min(self._readers, default=self._committed)
+            horizon = min(horizon, self._committed)
+            versions = {}
+            dropped = 0
+            for ident, kept in self._versions.items():
+                kept = [v for v in kept if v[1] > horizon]
+                dropped += len(self._versions[ident]) - len(kept)
+                if kept:
+                    versions[ident] = kept
+            self._versions = versions
+            self._xmin = {i: v for i, v in self._xmin.items() if v > horizon}
+            self._maybe_compact()
+            return dropped
 
+    @contextmanager
+    def _writing(self):
+        # the write lock, taken only while no other thread's transaction is
+        # open, so that a transaction's changes are never interleaved
+        me = threading.get_ident()
+        while not self.lock.is_writer():
+            gate = self._tx_gate or self._tx_ended
+            if self._tx_owner not in (None, me):
+                with gate:
+                    while self._tx_owner not in (None, me):
+                        gate.wait()
+            self.lock.acquire_write()
+            if self._tx_owner in (None, me):
+                break
+            self.lock.release_write()
+        else:
+            self.lock.acquire_write()
+        try:
+            yield
+        finally:
+            self.lock.release_write()
+
+    def _track(self, entry):
+        # remember how to undo a change made by the transaction's own thread
+        if self._undo is not None and self._tx_owner == threading.get_ident():
+            self._undo.append(entry)
+
+    def _reading(self, make):
+        # iterate make() under the read lock, held until exhausted or closed
+        with self.lock.read():
+            yield from make()
+
+    def begin(self, gate=None):
+        """Start a transaction owned by this thread, so rollback() can revert its changes.
+
+        Until it ends, writers on other threads wait on the `gate`
+        condition, or else the table's own, which is notified when the
+        transaction ends.
+        """
+        if self._undo is not None:
+            raise ValueError(f"Table {self.name} is already in a transaction")
+        self._undo = []
+        self._tx_owner = threading.get_ident()
+        self._tx_gate = gate
+
+    def commit(self):
+        self._undo = self._tx_owner = self._tx_gate = None
+        self._commit_version()
+        with self._tx_ended:
+            self._tx_ended.notify_all()
+
+    def rollback(self):
+        """Revert every change since begin(), newest first."""
+        if self._undo is None:
+            raise ValueError(f"Table {self.name} is not in a transaction")
+        with self.lock.write():
+            undo = self._undo
+            for entry in reversed(undo):
+                self._revert(entry)
+            if undo:
+                self.version += 1
+                self.modified = time.time()
+                self._vectors = {}
+            self.commit()
+
+    def _revert(self, entry):
+        op = entry[0]
+        if op == "insert":
+            handle = entry[1]
+            self._index_remove(handle)
+            self._unappend(handle)
+        elif op == "insert_many":
+            for handle in reversed(entry[1]):
+                self._index_remove(handle)
+                self._unappend(handle)
+        elif op == "update":
+            _, handle, old = entry
+            self._index_remove(handle, old)
+            self._assign(handle, old)
+            self._index_add(handle, old)
+        elif op == "delete":
+            _, handles, saved = entry
+            self._undiscard(handles, saved)
+            for h in handles:
+                self._index_add(h)
+        elif op == "log":
+            # drop the journal entry so the change is never persisted
+            for i in range(len(self.journal) - 1, -1, -1):
+                if self.journal[i] is entry[1]:
+                    del self.journal[i]
+                    break
+        else:
+            # "index": the index registered under a name before, if any
+            _, name, idx = entry
+            if idx is None:
+                del self.indexes[name]
+            else:
+                self.indexes[name] = idx
+
+    def replay(self, entry):
+        # re-apply a journal entry; ops are deterministic and only
+        # successful ones are logged
+        op = entry["op"]
+        try:
+            if op == "insert":
+                self.insert(entry["row"])
+            elif op == "insert_many":
+                self.bulk_insert(entry["rows"])
+            elif op == "update":
+                self.update(entry["where"], entry["updates"])
+            elif op == "delete":
+                self.delete(entry["where"])
+            elif op == "create_index":
+                self.create_index(entry["name"], entry["column"], entry["kind"])
+            elif op == "drop_index":
+                self.drop_index(entry["name"])
+        except ValueError:
+            pass
+
+    def _coerce(self, record):
+        # the record with the values of typed columns converted to their types
+        if not self.types:
+            return record
+        record = dict(record)
+        for c, kind in self.types.items():
+            if c in record:
+                record[c] = datatypes.coerce(kind, record[c], c)
+        return record
+
+    def _where(self, where):
+        # a where clause checked against the columns and coerced to their types
+        if where:
+            unknown = [leaf[0] for leaf in where_leaves(where) if leaf[0] not in self.columns]
+            if unknown:
+                raise ValueError(f"Unknown columns: {unknown}")
+        return coerce_where(where, self.types)
+
+    def _check_order(self, order_by):
+        if order_by is not None and order_by not in self.columns:
+            raise ValueError(f"Unknown column: {order_by}")
+
+    def _check_hashable(self, record):
+        # values of hash-indexed columns (keys included) become dict keys
+        for idx in self.indexes.values():
+            if idx.kind == "hash" and idx.column in record:
+                try:
+                    hash(record[idx.column])
+                except TypeError:
+                    raise ValueError(f"Invalid value for indexed column {idx.column}: {record[idx.column]!r}")
+
+    def index_definitions(self):
+        # secondary indexes only; constraint indexes follow from the schema
+        constraint = [self._pk_index, *self._unique_indexes.values()]
+        return [
+            {"name": n, "column": idx.column, "type": idx.kind}
+            for n, idx in self.indexes.items()
+            if not any(idx is c for c in constraint)
+        ]
+
+    def schema(self):
+        return {
+            "name": self.name,
+            "columns": self.columns,
+            "types": self.types,
+            "primary_key": self.primary_key,
+            "unique_keys": self.unique_keys,
+            "indexes": self.index_definitions(),
+            "engine": self.engine,
+            "row_count": self.row_count(),
+        }
+
+    def memory_estimate(self):
+        # rough bytes held by decoded rows, from a sample of them
+        if self._source is not None or not self._rows:
+            return 0
+        sample = self._rows[:: max(1, len(self._rows) // 100)]
+        per_row = sum(sys.getsizeof(r) + sum(sys.getsizeof(v) for v in r.values()) for r in sample) / len(sample)
+        return int(per_row * len(self._rows))
+
+    def _index_on(self, column, ordered=False):
+        for idx in self.indexes.values():
+            if idx.column == column and (not ordered or idx.kind == "sorted"):
+                return idx
+        return None
+
+    def _index_leaf(self, where):
+        # a comparison an index can answer: the whole clause, or one term of an AND
+        if not is_compound(where):
+            leaves = [where]
+        elif where[0] == "AND":
+            leaves = [w for w in where[1:] if not is_compound(w)]
+        else:
+            return None
+        for leaf in leaves:
+            col, op, val = split_where(leaf)
+            if op == "=" and self._index_on(col) is not None:
+                return leaf
+            if op in RANGE_OPS and self._index_on(col, ordered=True) is not None:
+                return leaf
+        return None
+
+    def _predicate(self, where):
+        # row-at-a-time test of a where clause against a row handle
+        return row_predicate(where, self._getter, self.types)
+
+    def _vectorized(self, where=None, column=None):
+        # whether to evaluate with NumPy: only once the vectors of the columns
+        # involved are built. Every write drops them, and they are rebuilt
+        # by the second query since the write, so reads interleaved with
+        # writes stay on the Python path instead of rebuilding each time
+        if vector.np is None or self.row_count() < vector.MIN_ROWS:
+            return False
+        columns = [leaf[0] for leaf in where_leaves(where)] if where else []
+        if column is not None:
+            columns.append(column)
+        if all(c in self._vectors for c in columns) or self._vectors_wanted == self.version:
+            return True
+        self._vectors_wanted = self.version
+        return False
+
+    def _mask(self, where):
+        # boolean array over row positions; only called when _vectorized()
+        if is_compound(where):
+            return vector.combine(where[0], [self._mask(w) for w in where[1:]])
+        col, op, val = split_where(where)
+        return vector.compare(self._vector(col), op, val, _matcher)
+
+    def _find(self, where):
+        # handles of the rows matching a where clause, as a list safe to mutate under
+        return list(self._matches(where))
+
+    def _matches(self, where):
+        # handles of the rows matching a where clause, through an index when
+        # available; the scan fallbacks are lazy
+        self._ensure_rows()
+        leaf = self._index_leaf(where)
+        if leaf is not None:
+            col, op, val = split_where(leaf)
+            if op == "=":
+                handles = self._index_on(col).lookup(val)
+            else:
+                handles = list(self._index_on(col, ordered=True).irange(**range_bounds(op, val)))
+            if leaf is where:
+                return handles
+            return filter(self._predicate(where), handles)
+        if self._vectorized(where):
+            return self._positions(self._mask(where))
+        if is_compound(where):
+            return filter(self._predicate(where), self._handles())
+        return self._filter(*split_where(where))
+
+    def _ordered(self, where, order_by, descending, limit, offset=0):
+        self._ensure_rows()
+        handles = self._handles()
+        stop = None if limit is None else offset + limit
+        idx = self._index_on(order_by, ordered=True)
+        simple = where and not is_compound(where)
+        if simple:
+            col, op, val = split_where(where)
+        # a selective index on the filter beats walking the whole ordered index
+        if idx is not None and where:
+            leaf = self._index_leaf(where)
+            if leaf is not None and leaf[0] != order_by and split_where(leaf)[1] == "=":
+                idx = None
+        if idx is None:
+            if where:
+                handles = self._matches(where)
+            get = self._getter(order_by)
+            key = lambda h: sort_key(get(h))
+            if stop is not None:
+                pick = heapq.nlargest if descending else heapq.nsmallest
+                return pick(stop, handles, key=key)[offset:]
+            return sorted(handles, key=key, reverse=descending)[offset:]
+
+        # walk the index in key order and stop once `limit` rows matched
+        if simple and col == order_by and op != "!=":
+            handles = idx.irange(descending=descending, **range_bounds(op, val))
+        else:
+            handles = idx.irange(descending=descending)
+            if where:
+                handles = filter(self._predicate(where), handles)
+        return list(islice(handles, offset, stop))
+
+    def rebuild_indexes(self):
+        self._ensure_rows()
+        for idx in self.indexes.values():
+            idx.clear()
+            get = self._getter(idx.column)
+            idx.add_many((get(h), h) for h in self._handles())
+
+    def _index_add(self, handle, columns=None):
+        for idx in self.indexes.values():
+            if columns is None or idx.column in columns:
+                idx.add(self._getter(idx.column)(handle), handle)
+
+    def _index_remove(self, handle, columns=None):
+        for idx in self.indexes.values():
+            if columns is None or idx.column in columns:
+                idx.remove(self._getter(idx.column)(handle), handle)
+
+    @_writer
     def insert(self, record):
         # basic validation
         if not isinstance(record, dict):
@@ -27,125 +944,1234 @@ class Table:
         if extra:
             raise ValueError(f"Unknown columns: {extra}")
 
+        record = self._coerce(record)
+        self._check_hashable(record)
+        self._ensure_rows()
+
         # primary key check
         if self.primary_key:
             if self.primary_key not in record:
                 raise ValueError(f"Missing primary key: {self.primary_key}")
-            for r in self.rows:
-                if r.get(self.primary_key) == record.get(self.primary_key):
-                    raise ValueError("Duplicate primary key")
+            if self._pk_index.conflict(record.get(self.primary_key)):
+                raise ValueError("Duplicate primary key")
 
         # unique key check
         for uk in self.unique_keys:
             if uk not in record:
                 raise ValueError(f"Missing unique key: {uk}")
-            for r in self.rows:
-                if r.get(uk) == record.get(uk):
-                    raise ValueError(f"Duplicate unique key: {uk}")
+            if self._unique_indexes[uk].conflict(record.get(uk)):
+                raise ValueError(f"Duplicate unique key: {uk}")
 
         # store a copy to avoid external mutation
-        self.rows.append(record.copy())
+        handle = self._append(record)
+        self._index_add(handle)
+        self._track(("insert", handle))
+        self._log({"op": "insert", "row": record.copy()})
+
+    def bulk_insert(self, records, batch_size=BULK_BATCH):
+        """Insert many records a batch at a time; returns how many were inserted.
+
+        Each batch is validated as a whole (columns, then key constraints
+        against the indexes and within the batch) and inserted under one
+        write lock as one logged change. A bad record fails its batch;
+        earlier batches stay, so use a transaction for all or nothing.
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be positive")
+        records = iter(records)
+        total = 0
+        while True:
+            batch = list(islice(records, batch_size))
+            if not batch:
+                return total
+            self._insert_batch(batch, total)
+            total += len(batch)
+
+    @_writer
+    def _insert_batch(self, batch, start):
+        # record numbers in errors count from 1 over the whole load
+        columns = set(self.columns)
+        for n, record in enumerate(batch, start + 1):
+            if not isinstance(record, dict):
+                raise ValueError(f"Record {n} must be a dict")
+            if record.keys() != columns:
+                missing = [c for c in self.columns if c not in record]
+                if missing:
+                    raise ValueError(f"Record {n}: Missing columns: {missing}")
+                raise ValueError(f"Record {n}: Unknown columns: {[k for k in record if k not in columns]}")
+        if self.types:
+            coerced = []
+            for n, record in enumerate(batch, start + 1):
+                try:
+                    coerced.append(self._coerce(record))
+                except ValueError as e:
+                    raise ValueError(f"Record {n}: {e}")
+            batch = coerced
+        for n, record in enumerate(batch, start + 1):
+            try:
+                self._check_hashable(record)
+            except ValueError as e:
+                raise ValueError(f"Record {n}: {e}")
 
-    def select(self, where=None):
-        if not where:
-            return self.rows
-        return [r for r in self.rows if r.get(where[0]) == where[1]]
+        self._ensure_rows()
+        keys = [(self.primary_key, self._pk_index, "primary key")] if self.primary_key else []
+        keys += [(uk, self._unique_indexes[uk], f"unique key: {uk}") for uk in self.unique_keys]
+        for column, idx, label in keys:
+            seen = set()
+            for n, record in enumerate(batch, start + 1):
+                value = record[column]
+                if value in seen or idx.conflict(value):
+                    raise ValueError(f"Record {n}: Duplicate {label}")
+                seen.add(value)
 
+        handles = [self._append(record) for record in batch]
+        for idx in self.indexes.values():
+            get = self._getter(idx.column)
+            idx.add_many((get(h), h) for h in handles)
+        self._track(("insert_many", handles))
+        # the journal keeps its own copies, as insert does
+        self._log({"op": "insert_many", "rows": batch if self.journal is None else [r.copy() for r in batch]})
+
+    def select(self, where=None, order_by=None, descending=False, limit=None, offset=0):
+        """Rows matching `where`, optionally ordered and paged.
+
+        Filtered or limited results are served from the database's result
+        cache while the table is unchanged since they were computed; with a
+        cache, their rows are read-only (cache.FrozenRow) even when too big
+        to keep. Whole-table reads are never cached.
+        """
+        cache = self.result_cache
+        if cache is None or (not where and limit is None):
+            # a whole table is cheap to read and costly to keep
+            return self._select(where, order_by, descending, limit, offset)
+        key = ("select", self.name, freeze(where), order_by, descending, limit, offset)
+        return cache.cached(key, [self], lambda: self._select(where, order_by, descending, limit, offset))
+
+    @_reader
+    def _select(self, where, order_by, descending, limit, offset):
+        where = self._where(where)
+        self._check_order(order_by)
+        if order_by is not None:
+            return self._materialize(self._ordered(where, order_by, descending, limit, offset))
+        if where:
+            handles = self._find(where)
+        else:
+            self._ensure_rows()
+            handles = self._handles()
+        if limit is not None or offset:
+            handles = list(islice(handles, offset, None if limit is None else offset + limit))
+        return self._materialize(handles)
+
+    def _view_getters(self, columns=None):
+        # column -> handle reader for the views of `columns` (default: all)
+        if columns is None:
+            columns = self.columns
+        unknown = [c for c in columns if c not in self.columns]
+        if unknown:
+            raise ValueError(f"Unknown columns: {unknown}")
+        return {c: self._getter(c) for c in columns}
+
+    def _output(self, handles, getters):
+        # rows of the handles: read-only views with getters, else full rows
+        if getters is None:
+            return map(self._row, handles)
+        return (RowView(getters, h) for h in handles)
+
+    def iter_select(self, where=None, columns=None, order_by=None, descending=False, limit=None, offset=0):
+        """Like select, but yield rows on demand as read-only views of `columns` (default: all).
+
+        No row is copied: matches are found as the iterator is consumed
+        (ORDER BY without a usable index still sorts the matching handles
+        first) and each view reads its values from the table. The read
+        lock is held until the iterator is exhausted or closed, so writers
+        wait meanwhile and this thread must not modify the table.
+        """
+        getters = self._view_getters(columns)
+        where = self._where(where)
+        self._check_order(order_by)
+
+        def rows():
+            self._ensure_rows()
+            if order_by is not None:
+                handles = self._ordered(where, order_by, descending, limit, offset)
+            else:
+                handles = self._matches(where) if where else self._handles()
+                if limit is not None or offset:
+                    handles = islice(handles, offset, None if limit is None else offset + limit)
+            return self._output(handles, getters)
+        return self._reading(rows)
+
+    @_reader
+    def aggregate(self, func, column=None, where=None):
+        """COUNT, SUM, AVG, MIN or MAX of a column over the rows matching `where`.
+
+        NULLs are skipped and `column=None` means COUNT(*). Without
+        matching values SUM/AVG/MIN/MAX give None. Large tables are reduced
+        over cached NumPy arrays when NumPy is installed.
+        """
+        func = func.upper()
+        if func not in AGGREGATES:
+            raise ValueError(f"Unknown aggregate: {func}")
+        if column is None and func != "COUNT":
+            raise ValueError(f"{func} needs a column")
+        if column is not None and column not in self.columns:
+            raise ValueError(f"Unknown column: {column}")
+        where = self._where(where)
+        self._ensure_rows()
+        if not (where and self._index_leaf(where)) and self._vectorized(where, column):
+            mask = self._mask(where) if where else None
+            mask = self._live_mask(mask)
+            if column is None:
+                return self.row_count() if mask is None else int(mask.sum())
+            result = vector.reduce(func, self._vector(column), mask)
+            if result is not NotImplemented:
+                return result
+
+        handles = self._find(where) if where else self._handles()
+        if column is None:
+            return len(handles)
+        values = [v for v in map(self._getter(column), handles) if v is not None]
+        if func == "COUNT":
+            return len(values)
+        if not values:
+            return None
+        if func == "MIN":
+            return min(values, key=sort_key)
+        if func == "MAX":
+            return max(values, key=sort_key)
+        try:
+            total = sum(values)
+        except TypeError:
+            raise ValueError(f"{func} needs numeric values: {column}")
+        return total if func == "SUM" else total / len(values)
+
+    def _live_mask(self, mask):
+        return mask
+
+    def full_scan(self, where=None, columns=None):
+        """Iterate the rows matching `where` by a sequential scan, ignoring indexes.
+
+        With `columns`, rows come as read-only views of just those columns.
+        """
+        getters = None if columns is None else self._view_getters(columns)
+        where = self._where(where)
+
+        def rows():
+            self._ensure_rows()
+            if where is None:
+                handles = self._handles()
+            elif self._vectorized(where):
+                handles = self._positions(self._mask(where))
+            else:
+                handles = filter(self._predicate(where), self._handles())
+            return self._output(handles, getters)
+        return self._reading(rows)
+
+    def index_scan(self, name, op=None, val=None, descending=False, columns=None):
+        """Iterate rows through the index `name`: an (op, val) lookup or range, or all rows in index order."""
+        if name not in self.indexes:
+            raise ValueError(f"Index does not exist: {name}")
+        idx = self.indexes[name]
+        if not (op is None or (op == "=" and idx.kind == "hash") or (idx.kind == "sorted" and op in ("=",) + RANGE_OPS)):
+            raise ValueError(f"Index {name} cannot answer {op}")
+        if op is not None:
+            val = coerce_where((idx.column, op, val), self.types)[2]
+        getters = None if columns is None else self._view_getters(columns)
+
+        def rows():
+            self._ensure_rows()
+            if op == "=" and idx.kind == "hash":
+                handles = idx.lookup(val)
+            elif op is None:
+                handles = idx.irange(descending=descending)
+            else:
+                handles = idx.irange(descending=descending, **range_bounds(op, val))
+            return self._output(handles, getters)
+        return self._reading(rows)
+
+    def index_groups(self, name):
+        """Yield (value, row count) for each distinct key of an index, without scanning the table."""
+        if name not in self.indexes:
+            raise ValueError(f"Index does not exist: {name}")
+        idx = self.indexes[name]
+        with self.lock.read():
+            self._ensure_rows()
+            if idx.kind == "hash":
+                for value, found in idx.map.items():
+                    yield value, 1 if idx.unique else len(found)
+                return
+            keys = idx.keys
+            get = self._getter(idx.column)
+            start = 0
+            while start < len(keys):
+                stop = bisect_right(keys, keys[start], start)
+                yield get(idx.rows[start]), stop - start
+                start = stop
+
+    @_reader
+    def stats(self):
+        """Row count and per-column distinct-value estimates, for the query planner.
+
+        Indexed columns report exact counts from the index. The others are
+        estimated from a sample, taken again once a tenth of the table has
+        changed.
+        """
+        self._ensure_rows()
+        n = self.row_count()
+        if self._stats is None or self.version - self._stats_version > n // 10:
+            handles = self._handles()
+            sample = handles[::max(1, n // STATS_SAMPLE)]
+            distinct = {}
+            for c in self.columns:
+                counts = Counter(map(sort_key, map(self._getter(c), sample)))
+                seen = len(counts)
+                once = sum(1 for k in counts.values() if k == 1)
+                # scale up values seen once in the sample (GEE estimator)
+                estimate = seen - once + math.sqrt(n / len(sample)) * once if sample else 0
+                distinct[c] = int(min(n, max(seen, estimate)))
+            self._stats = {"rows": n, "distinct": distinct}
+            self._stats_version = self.version
+        distinct = dict(self._stats["distinct"])
+        for idx in self.indexes.values():
+            distinct[idx.column] = idx.distinct()
+        return {"rows": n, "distinct": distinct}
+
+    def scan(self, offset=0, limit=None, after=None, order_by=None):
+        """Iterate a page of rows without copying the table.
+
+        Rows are read from a snapshot, so a long scan never holds up
+        writers. With `after`, pages by key instead of position: rows whose
+        `order_by` value (default: the primary key) sorts after `after`, in
+        key order, through a sorted index when there is one.
+        """
+        if after is not None:
+            col = order_by or self.primary_key or self.columns[0]
+            return iter(self.select((col, ">", after), order_by=col, limit=limit))
+
+        def rows():
+            with self.snapshot() as snap:
+                stop = None if limit is None else offset + limit
+                yield from islice(snap.rows(), offset, stop)
+        return rows()
+
+    @_writer
     def update(self, where, updates):
-        # where should be a (column, value) tuple
-        if not (isinstance(where, (list, tuple)) and len(where) == 2):
-            raise ValueError("where must be a (column, value) tuple")
-        col, val = where[0], where[1]
+        # validate the where clause before touching any row
+        list(where_leaves(where))
+        where = self._where(where)
 
         # validate update keys
         for k in updates:
             if k not in self.columns:
                 raise ValueError(f"Unknown column in update: {k}")
+        updates = self._coerce(updates)
+        self._check_hashable(updates)
 
-        count = 0
-        for r in self.rows:
-            if r.get(col) == val:
-                new_record = r.copy()
+        # (handle, old values) of the rows changed so far, to undo them if a
+        # later row violates a constraint
+        done = []
+        try:
+            for h in self._find(where):
+                new_record = self._record(h)
+                old = {k: new_record.get(k) for k in updates}
                 new_record.update(updates)
 
                 # primary key check
                 if self.primary_key and self.primary_key in updates:
-                    new_pk = new_record[self.primary_key]
-                    for other in self.rows:
-                        if other is not r and other.get(self.primary_key) == new_pk:
-                            raise ValueError("Duplicate primary key on update")
+                    if self._pk_index.conflict(new_record[self.primary_key], h):
+                        raise ValueError("Duplicate primary key on update")
 
                 # unique keys
                 for uk in self.unique_keys:
                     if uk in updates:
-                        new_uk = new_record.get(uk)
-                        for other in self.rows:
-                            if other is not r and other.get(uk) == new_uk:
-                                raise ValueError(f"Duplicate unique key on update: {uk}")
+                        if self._unique_indexes[uk].conflict(new_record.get(uk), h):
+                            raise ValueError(f"Duplicate unique key on update: {uk}")
 
-                r.update(updates)
-                count += 1
-        return count
+                self._index_remove(h, updates)
+                self._supersede(h)
+                self._assign(h, updates)
+                self._index_add(h, updates)
+                done.append(("update", h, old))
+        except ValueError:
+            for entry in reversed(done):
+                self._revert(entry)
+            raise
+        if done:
+            for entry in done:
+                self._track(entry)
+            self._log({"op": "update", "where": list(where), "updates": dict(updates)})
+        return len(done)
 
+    @_writer
     def delete(self, where):
-        if not (isinstance(where, (list, tuple)) and len(where) == 2):
-            raise ValueError("where must be a (column, value) tuple")
-        self.rows = [r for r in self.rows if r.get(where[0]) != where[1]]
+        where = self._where(where)
+        victims = self._find(where)
+        if not victims:
+            return
+        for h in victims:
+            self._index_remove(h)
+            self._supersede(h)
+        saved = self._discard(victims)
+        self._track(("delete", victims, saved))
+        self._log({"op": "delete", "where": list(where)})
+
+
+class ColumnarTable(Table):
+    """Table storing one Column per column name instead of a dict per row.
+
+    Row handles are positions in the columns. Deleted rows are tombstoned
+    in a liveness bitmap and compacted away once they outnumber live rows.
+    `rows` builds dicts on demand; prefer select/scan for large tables.
+    """
+
+    engine = "columnar"
+    _ident = staticmethod(int)
+
+    def __init__(self, name, columns, primary_key=None, unique_keys=None, types=None):
+        super().__init__(name, columns, primary_key, unique_keys, types)
+        self._reset()
+
+    def _reset(self):
+        # typed columns are packed in typed arrays
+        self._cols = {c: column_for(self.types.get(c)) for c in self.columns}
+        self._live = bytearray()
+        self._dead = 0
+        self._vectors = {}
+
+    @property
+    def rows(self):
+        self._ensure_rows()
+        return self._materialize(self._handles())
+
+    @rows.setter
+    def rows(self, rows):
+        self._source = None
+        self._store(rows)
+
+    def row_count(self):
+        if self._source is not None:
+            return len(self._source)
+        return len(self._live) - self._dead
+
+    def memory_estimate(self):
+        return len(self._live) + sum(col.nbytes() for col in self._cols.values())
+
+    def column(self, name):
+        return self._cols[name]
+
+    def _store(self, rows):
+        self._reset()
+        for r in rows:
+            self._append(r)
+
+    def _handles(self):
+        if not self._dead:
+            return range(len(self._live))
+        return list(compress(range(len(self._live)), self._live))
+
+    def _getter(self, column):
+        return self._cols[column].get
+
+    def _row(self, handle):
+        return {c: col.get(handle) for c, col in self._cols.items()}
+
+    def _materialize(self, handles):
+        return [self._row(h) for h in handles]
+
+    def _record(self, handle):
+        return self._row(handle)
+
+    def _append(self, record):
+        self._created(len(self._live))
+        for c, col in self._cols.items():
+            col.append(record.get(c))
+        self._live.append(1)
+        return len(self._live) - 1
+
+    def _assign(self, handle, updates):
+        for c, v in updates.items():
+            self._cols[c].set(handle, v)
+
+    def _unappend(self, handle):
+        for col in self._cols.values():
+            col.pop()
+        self._live.pop()
+
+    def _discard(self, handles):
+        for h in handles:
+            self._live[h] = 0
+        self._dead += len(handles)
+        self._maybe_compact()
+
+    def _undiscard(self, handles, saved):
+        for h in handles:
+            self._live[h] = 1
+        self._dead -= len(handles)
+
+    def _alive(self, handle):
+        return self._live[handle]
+
+    def _snapshot_handles(self):
+        return range(len(self._live))
+
+    def commit(self):
+        super().commit()
+        self._maybe_compact()
+
+    def _maybe_compact(self):
+        # positions must stay put while a transaction may still undo or a
+        # snapshot may still read them
+        if self._undo is not None or self._readers:
+            return
+        if self._dead > 1024 and self._dead > len(self._live) - self._dead:
+            self._compact()
+
+    def _compact(self):
+        keep = self._handles()
+        self._cols = {c: col.take(keep) for c, col in self._cols.items()}
+        self._live = bytearray(b"\x01" * len(keep))
+        self._dead = 0
+        self._vectors = {}
+        self.rebuild_indexes()
+
+    def _filter(self, column, op, val):
+        col = self._cols[column]
+        if op == "=" and col.values is None and isinstance(val, str):
+            # compare dictionary codes instead of decoding every value
+            code = col.code(val)
+            if code is None:
+                return ()
+            live = self._live
+            return (i for i, c in enumerate(col.codes) if c == code and live[i] and col.is_valid(i))
+        test = _matcher(op, val, column in self.types)
+        get = col.get
+        return (i for i in self._handles() if test(get(i)))
+
+    def _vector(self, column):
+        vec = self._vectors.get(column)
+        if vec is None:
+            vec = self._vectors[column] = vector.from_column(self._cols[column])
+        return vec
+
+    def _positions(self, mask):
+        return vector.positions(mask, self._live if self._dead else None)
+
+    def _live_mask(self, mask):
+        # tombstoned rows still occupy positions in the column arrays
+        if not self._dead:
+            return mask
+        live = vector.bitmap_bytes(self._live)
+        return live if mask is None else mask & live
+
+
+TABLE_ENGINES = {"row": Table, "columnar": ColumnarTable}
+
+
+class TableCatalog(MutableMapping):
+    """Tables of a Database: loaded ones, plus catalogued ones loaded on first access."""
+
+    def __init__(self, db):
+        self._db = db
+        # least recently used first
+        self._loaded = OrderedDict()
+        # name -> (base_dir, schema) of tables not loaded yet
+        self._pending = {}
+
+    def __getitem__(self, name):
+        t = self._loaded.get(name)
+        if t is not None:
+            self._loaded.move_to_end(name)
+            return t
+        with self._db._lock:
+            # another thread may have loaded it meanwhile
+            if name in self._loaded:
+                return self._loaded[name]
+            if name not in self._pending:
+                raise KeyError(name)
+            self._db.load(name, base_dir=self._pending[name][0])
+            return self._loaded[name]
+
+    def __setitem__(self, name, t):
+        self._pending.pop(name, None)
+        t.result_cache = self._db.result_cache
+        self._loaded[name] = t
+        self._loaded.move_to_end(name)
+        self._db._enforce_budget(keep=name)
+        self._db._enroll(t)
+
+    def __delitem__(self, name):
+        if name not in self:
+            raise KeyError(name)
+        self._loaded.pop(name, None)
+        self._pending.pop(name, None)
+
+    def __contains__(self, name):
+        return name in self._loaded or name in self._pending
+
+    def __iter__(self):
+        yield from list(self._loaded)
+        yield from [n for n in self._pending if n not in self._loaded]
+
+    def __len__(self):
+        return len(self._loaded) + len(self._pending)
+
+    def peek(self, name):
+        # the table if it is loaded, without loading it or touching LRU order
+        return self._loaded.get(name)
+
+    def loaded(self):
+        return list(self._loaded.items())
+
+    def pending_in(self, base):
+        # names of the tables catalogued from a directory but not loaded yet
+        return [n for n, (b, _) in self._pending.items() if b == base]
+
+    def schema(self, name):
+        t = self._loaded.get(name)
+        if t is not None:
+            return t.schema()
+        return self._pending[name][1]
+
+    def add_pending(self, name, base, schema):
+        self._loaded.pop(name, None)
+        self._pending[name] = (base, schema)
+
 
 class Database:
-    def __init__(self):
-        self.tables = {}
+    def __init__(self, base_dir=None, wal=False, wal_sync_every=64, checkpoint_bytes=1 << 20, storage="json",
+                 memory_budget=None, vacuum_interval=None, shared=False, result_cache_bytes=RESULT_CACHE_BYTES):
+        if storage not in TABLE_EXTS:
+            raise ValueError(f"Unknown storage format: {storage}")
+        # results of repeated selects and SELECT statements, valid while the
+        # tables they read are unchanged (None: no caching)
+        self.result_cache = ResultCache(result_cache_bytes) if result_cache_bytes else None
+        self.tables = TableCatalog(self)
+        self.base_dir = base_dir
+        # "json" or "binary"; tables in the other format are migrated on load
+        self.storage = storage
+        # write-ahead log mode: save() appends table journals to a
+        # per-directory log and snapshots are only rewritten at checkpoints
+        self.wal = wal
+        self.wal_sync_every = wal_sync_every
+        self.checkpoint_bytes = checkpoint_bytes
+        self._wals = {}
+        self._bases = {}
+        # approximate bytes of row data to keep loaded; cold clean tables
+        # beyond it are evicted back to the catalog (None: no limit)
+        self.memory_budget = memory_budget
+        # table versions as last saved / loaded, to tell clean from dirty
+        self._clean = {}
+        # file stamps (table file, log) as of the last load / save, and the
+        # number of refresh() calls answered from memory because they matched
+        self._stamps = {}
+        self.reloads_avoided = 0
+        # guards the catalog, bookkeeping and files; always taken before a
+        # table lock. Tables guard their rows with their own locks
+        self._lock = threading.RLock()
+        # open transaction: table name -> (version at begin, clean at begin),
+        # version None for tables created in it; None outside a transaction
+        self._tx = None
+        # the thread owning it; other threads' writes wait on _tx_done
+        self._tx_thread = None
+        self._tx_done = threading.Condition(self._lock)
+        # tables saved during the transaction -> directory, written at commit
+        self._tx_saves = {}
+        # seconds between background vacuums of the row versions kept for
+        # snapshots (None: only when vacuum() is called)
+        self._vacuum_stop = threading.Event()
+        if vacuum_interval:
+            threading.Thread(target=self._vacuum_loop, args=(vacuum_interval,), daemon=True).start()
+        # multi-process mode: writes to a directory take its advisory file
+        # lock and bump its change counter; other processes compare the
+        # counter with the value they last saw and catch up only when it moved
+        self.shared = shared
+        self._dir_locks = {}
+        self._counters = {}
+        self._seen = {}
+        # directories catalogued with open(), to pick up tables created elsewhere
+        self._opened = set()
+
+    def _vacuum_loop(self, interval):
+        while not self._vacuum_stop.wait(interval):
+            self.vacuum()
+
+    def vacuum(self):
+        """Reclaim the row versions no open snapshot can see, in every loaded table."""
+        with self._lock:
+            tables = [t for _, t in self.tables.loaded()]
+        return sum(t.vacuum() for t in tables)
+
+    def _base(self, base_dir=None):
+        return base_dir or self.base_dir or DATA_DIR
+
+    def _dir_lock(self, base):
+        if base not in self._dir_locks:
+            os.makedirs(base, exist_ok=True)
+            self._dir_locks[base] = FileLock(os.path.join(base, LOCK_FILE))
+        return self._dir_locks[base]
+
+    def _counter(self, base):
+        if base not in self._counters:
+            os.makedirs(base, exist_ok=True)
+            self._counters[base] = ChangeCounter(os.path.join(base, COUNTER_FILE))
+        return self._counters[base]
+
+    @contextmanager
+    def _shared_dir(self, base, exclusive=False):
+        # the database lock and, in shared mode, the directory's file lock,
+        # after catching up with what other processes wrote
+        with self._lock:
+            if not self.shared:
+                yield
+                return
+            lock = self._dir_lock(base)
+            lock.acquire(exclusive)
+            try:
+                self._catch_up(base)
+                yield
+            finally:
+                lock.release()
+
+    def exclusive(self, base_dir=None):
+        """Hold a directory's write lock across a read-modify-write of its tables.
+
+        In shared mode, tables are first brought up to date with what other
+        processes wrote, and their writes wait until the block ends, so
+        e.g. an insert and its save are checked against the latest rows.
+        """
+        return self._shared_dir(self._base(base_dir), exclusive=True)
+
+    def _changed(self, base):
+        # after writing to a directory: let other processes know
+        if self.shared:
+            self._seen[base] = self._counter(base).bump()
+
+    def _catch_up(self, base):
+        # apply what other processes wrote to a directory since we last looked;
+        # a transaction keeps its view until it ends
+        now = self._counter(base).value
+        if self._seen.get(base) == now or self._tx is not None:
+            return
+        self._seen[base] = now
+        wal = self._wal(base)
+        entries, _ = wal.refresh() if wal is not None else ([], False)
+        reloaded = set()
+        for name, t in self.tables.loaded():
+            if self._bases.get(name) != base:
+                continue
+            path = table_path(name, base)
+            known = self._stamps.get(name, (None,))[0]
+            if path is None:
+                if known is not None:
+                    # dropped by another process
+                    del self.tables[name]
+                    for state in (self._bases, self._clean, self._stamps):
+                        state.pop(name, None)
+                continue
+            # a rewritten snapshot (including a checkpoint) means a reload;
+            # unsaved changes of ours win over it
+            if _file_stamp(path) != known and not self.is_dirty(name):
+                t = self._read_table(name, base)
+                self._attach(t, base)
+                self.tables[name] = t
+                reloaded.add(name)
+        for name in self.tables.pending_in(base):
+            if table_path(name, base) is None:
+                del self.tables[name]
+        for entry in entries:
+            name = entry["table"]
+            t = self.tables.peek(name)
+            if t is None or name in reloaded or self._bases.get(name) != base:
+                continue
+            clean = not self.is_dirty(name)
+            journal, t.journal = t.journal, None
+            try:
+                t.replay(entry)
+            finally:
+                t.journal = journal
+            if clean:
+                self._clean[name] = t.version
+        if base in self._opened:
+            self.open(base)
+
+    def _wal(self, base):
+        # the log for a directory, opened on first use (or if one is on disk)
+        if base not in self._wals:
+            path = os.path.join(base, WAL_FILE)
+            if not self.wal and not os.path.exists(path):
+                return None
+            os.makedirs(base, exist_ok=True)
+            self._wals[base] = WriteAheadLog(path, sync_every=self.wal_sync_every)
+        return self._wals[base]
+
+    def _attach(self, t, base):
+        self._bases[t.name] = base
+        t.journal = [] if self.wal else None
+        self._clean[t.name] = t.version
+        self._stamps[t.name] = self._stamp(t.name, base)
+
+    def _stamp(self, name, base):
+        path = table_path(name, base)
+        return (_file_stamp(path) if path else None, _log_stamp(base))
+
+    def _restamp_log(self, base, before):
+        # our own log appends should not make this process reload its tables
+        after = _log_stamp(base)
+        for name, b in self._bases.items():
+            stamp = self._stamps.get(name)
+            if b == base and stamp is not None and stamp[1] == before:
+                self._stamps[name] = (stamp[0], after)
+
+    @_synchronized
+    def refresh(self, name, base_dir=None):
+        """Return a table, reloading it only if its files changed since it was loaded or saved."""
+        base = self._base(base_dir)
+        t = self.tables.peek(name)
+        if t is not None and self._tx is not None and name in self._tx:
+            # never replace a table with uncommitted changes
+            return t
+        if self.shared and t is not None and self._bases.get(name) == base:
+            # one memory read when no process wrote to the directory
+            if self._seen.get(base) != self._counter(base).value:
+                with self._shared_dir(base):
+                    pass
+            if self.tables.peek(name) is t:
+                self.reloads_avoided += 1
+                return t
+            if name in self.tables:
+                return self.tables[name]
+        if t is not None and self._bases.get(name) == base and self._stamps.get(name) == self._stamp(name, base):
+            self.reloads_avoided += 1
+            return t
+        self.load(name, base_dir=base)
+        return self.tables[name]
+
+    @property
+    def in_transaction(self):
+        # whether this thread has a transaction open
+        return self._tx is not None and self._tx_thread == threading.get_ident()
+
+    def _wait_for_transaction(self):
+        # with the database lock held: until no other thread's transaction is open
+        while self._tx is not None and self._tx_thread != threading.get_ident():
+            self._tx_done.wait()
+
+    @_outside_transactions
+    def begin(self):
+        """Start a transaction: table changes can be rolled back, and saves wait for commit().
+
+        The transaction belongs to the calling thread; writes and saves from
+        other threads wait until it ends.
+        """
+        if self._tx is not None:
+            raise ValueError("Transaction already in progress")
+        self._tx = {}
+        self._tx_thread = threading.get_ident()
+        for _, t in self.tables.loaded():
+            self._enroll(t)
+
+    def _enroll(self, t):
+        # tables loaded or created during a transaction join it
+        if self._tx is not None and t._tx_owner is None:
+            t.begin(self._tx_done)
+            self._tx.setdefault(t.name, (t.version, not self.is_dirty(t.name)))
+
+    def _end_transaction(self):
+        tx, saves = self._tx, self._tx_saves
+        if tx is None or self._tx_thread != threading.get_ident():
+            raise ValueError("No transaction in progress")
+        self._tx, self._tx_thread, self._tx_saves = None, None, {}
+        return tx, saves
+
+    @_synchronized
+    def commit(self):
+        """End the transaction, saving each table it changed or saved exactly once."""
+        tx, saves = self._end_transaction()
+        try:
+            for name, (version, _) in tx.items():
+                t = self.tables.peek(name)
+                if t is None:
+                    # evicted, so unchanged
+                    continue
+                t.commit()
+                if name in saves or version is None or t.version != version:
+                    self.save(name, base_dir=saves.get(name, self._bases.get(name)))
+        finally:
+            for name in tx:
+                t = self.tables.peek(name)
+                if t is not None and t._tx_owner is not None:
+                    t.commit()
+            self._tx_done.notify_all()
+
+    @_synchronized
+    def rollback(self):
+        """End the transaction, undoing every change made in it."""
+        tx, _ = self._end_transaction()
+        for name, (version, clean) in tx.items():
+            if version is None:
+                if name in self.tables:
+                    del self.tables[name]
+                for state in (self._bases, self._clean, self._stamps):
+                    state.pop(name, None)
+                continue
+            t = self.tables.peek(name)
+            if t is None:
+                continue
+            t.rollback()
+            if clean:
+                self._clean[name] = t.version
+        self._tx_done.notify_all()
+
+    @contextmanager
+    def transaction(self):
+        """`with db.transaction():` commits when the block ends and rolls back if it raises."""
+        self.begin()
+        try:
+            yield self
+        except BaseException:
+            self.rollback()
+            raise
+        self.commit()
 
-    def create_table(self, name, columns, pk=None, uniques=None, if_not_exists=False):
+    def is_dirty(self, name):
+        t = self.tables.peek(name)
+        return t is not None and (self._clean.get(name) != t.version or bool(t.journal))
+
+    @_synchronized
+    def open(self, base_dir=None):
+        """Catalog the tables stored in a directory; their rows load on first access."""
+        base = self._base(base_dir)
+        self._opened.add(base)
+        manifest = _read_manifest(base)
+        for name in table_names(base):
+            if name in self.tables:
+                continue
+            path = table_path(name, base)
+            entry = manifest.get(name)
+            if entry and entry.get("file") == _file_stamp(path):
+                schema = entry["schema"]
+            elif path.endswith(".tbl"):
+                schema = _schema_of(storage.read_header(path))
+            else:
+                # a JSON table outside the manifest (e.g. saved before there
+                # was one) has to be parsed once; its entry is then backfilled
+                # so later opens catalog it without reading it
+                stamp = _file_stamp(path)
+                try:
+                    self.load(name, base_dir=base)
+                except ValueError:
+                    continue
+                with self._shared_dir(base, exclusive=True):
+                    if table_path(name, base) == path and _file_stamp(path) == stamp:
+                        _update_manifest(base, name, {"file": stamp, "schema": self.tables[name].schema()})
+                continue
+            self.tables.add_pending(name, base, schema)
+
+    def schema(self, name):
+        if name not in self.tables:
+            raise ValueError("Table does not exist")
+        return self.tables.schema(name)
+
+    def _enforce_budget(self, keep=None):
+        if self.memory_budget is None:
+            return
+        loaded = self.tables.loaded()
+        sizes = {n: t.memory_estimate() for n, t in loaded}
+        total = sum(sizes.values())
+        for name, t in loaded:
+            if total <= self.memory_budget:
+                break
+            # a table in the open transaction must stay for commit or rollback to end it
+            if name == keep or name not in self._bases or self.is_dirty(name) or t._tx_owner is not None:
+                continue
+            self.tables.add_pending(name, self._bases[name], t.schema())
+            total -= sizes[name]
+
+    @_outside_transactions
+    def create_table(self, name, columns, pk=None, uniques=None, if_not_exists=False, engine="row", types=None):
         if name in self.tables:
             if if_not_exists:
                 return
             raise ValueError("Table already exists")
-        self.tables[name] = Table(name, columns, pk, uniques)
+        if engine not in TABLE_ENGINES:
+            raise ValueError(f"Unknown table engine: {engine}")
+        self.tables[name] = TABLE_ENGINES[engine](name, columns, pk, uniques, types)
+        self._attach(self.tables[name], self._base())
+        if self._tx is not None:
+            self._tx[name] = (None, False)
+
+    @_outside_transactions
+    def create_index(self, table, name, column, kind="hash"):
+        if table not in self.tables:
+            raise ValueError("Table does not exist")
+        if self.index_owner(name):
+            raise ValueError(f"Index already exists: {name}")
+        self.tables[table].create_index(name, column, kind)
 
+    def index_owner(self, name):
+        # index names share one namespace per database
+        for tname in self.tables:
+            if name in _index_names(self.tables.schema(tname)):
+                return tname
+        return None
+
+    @_outside_transactions
+    def drop_index(self, name):
+        tname = self.index_owner(name)
+        if tname is None:
+            raise ValueError(f"Index does not exist: {name}")
+        self.tables[tname].drop_index(name)
+        return tname
+
+    @_outside_transactions
     def save(self, name, base_dir=None):
         if name not in self.tables:
             raise ValueError("Table does not exist")
-        t = self.tables[name]
+        if self._tx is not None:
+            # written once, at commit
+            self._tx_saves[name] = self._base(base_dir)
+            return
+        base = self._base(base_dir)
+        with self._shared_dir(base, exclusive=True):
+            t = self.tables[name]
+            with t.lock.read():
+                # schema changes rewrite the snapshot so catalogs stay accurate,
+                # and so do bulk loads of at least half the table, whose rows
+                # would otherwise be written to the log and again at checkpoint
+                journal = t.journal or ()
+                schema_change = any(e["op"] in ("create_index", "drop_index") for e in journal)
+                bulk = sum(len(e["rows"]) for e in journal if e["op"] == "insert_many")
+                rewrite = schema_change or (bulk and bulk * 2 >= t.row_count())
+                if not (self.wal and table_path(name, base) and self._bases.get(name) == base and not rewrite):
+                    wal = self._wal(base)
+                    self._write_snapshot(t, base, wal.lsn if wal else None)
+                    self._attach(t, base)
+                    self._changed(base)
+                    return
+                wal = self._wal(base)
+                before = _log_stamp(base)
+                for entry in t.journal:
+                    wal.append(name, entry)
+                t.journal = []
+                self._restamp_log(base, before)
+                self._clean[name] = t.version
+                self._changed(base)
+            if wal.size() >= self.checkpoint_bytes:
+                self.checkpoint(base)
+
+    def _write_snapshot(self, t, base, lsn=None):
+        os.makedirs(base, exist_ok=True)
+        path = f"{base}/{t.name}{TABLE_EXTS[self.storage]}"
+        if self.storage == "binary":
+            storage.write_table(path, t, lsn)
+        else:
+            self._write_json(path, t, lsn)
+        # drop the file left behind by the other format
+        for ext in TABLE_EXTS.values():
+            stale = f"{base}/{t.name}{ext}"
+            if stale != path and os.path.exists(stale):
+                os.remove(stale)
+        _update_manifest(base, t.name, {"file": _file_stamp(path), "schema": t.schema()})
+
+    def _write_json(self, path, t, lsn):
         data = {
             "name": t.name,
             "columns": t.columns,
+            "types": t.types,
             "primary_key": t.primary_key,
             "unique_keys": t.unique_keys,
-            "rows": t.rows,
+            "indexes": t.index_definitions(),
+            "engine": t.engine,
         }
-        base = base_dir or DATA_DIR
-        os.makedirs(base, exist_ok=True)
-        path = f"{base}/{name}.json"
-        with open(path, "w") as f:
-            json.dump(data, f, indent=2)
+        if lsn is not None:
+            # log entries up to this lsn are already part of the snapshot
+            data["lsn"] = lsn
+        # rows go out a page per line: json.dumps encodes a page in C, where
+        # json.dump(indent=...) would encode every value in Python
+        head = json.dumps(data)
+        rows = t.rows
+        # write to a temp file and rename, so readers never see a partial file
+        with open(f"{path}.tmp", "w") as f:
+            f.write(head[:-1] + ', "rows": [')
+            for start in range(0, len(rows), storage.PAGE_ROWS):
+                f.write(",\n" if start else "\n")
+                f.write(json.dumps(rows[start:start + storage.PAGE_ROWS], default=datatypes.to_json)[1:-1])
+            f.write("\n]}\n")
+        os.replace(f"{path}.tmp", path)
+
+    def copy_from(self, name, path, format="csv", header=False, base_dir=None, batch_size=BULK_BATCH):
+        """Bulk-load a CSV or JSON Lines file into a table; returns the number of rows loaded.
 
+        The file is streamed through Table.bulk_insert in one transaction
+        (or the caller's), so a bad record loads nothing, and the table is
+        saved once at the end.
+        """
+        if name not in self.tables:
+            raise ValueError("Table does not exist")
+        t = self.tables[name]
+        records = loader.read(path, format, t.columns, header)
+        with nullcontext() if self.in_transaction else self.transaction():
+            count = t.bulk_insert(records, batch_size)
+            self.save(name, base_dir=base_dir)
+        return count
+
+    @_outside_transactions
+    def apply_all(self, name, changes, base_dir=None):
+        """Apply each of `changes` (callables taking the table) all-or-nothing, then save the table once.
+
+        Returns a (True, result) or (False, exception) pair per change: a
+        change that raises is rolled back on its own and the others still
+        apply. Concurrent writers can so share one save (see aiodb.py).
+        """
+        base = self._base(base_dir)
+        with self.exclusive(base):
+            if name not in self.tables:
+                raise ValueError("Table does not exist")
+            t = self.tables[name]
+            outcomes = []
+            for change in changes:
+                # other threads' writes to the table wait for this change
+                t.begin(self._tx_done)
+                try:
+                    result = change(t)
+                except Exception as e:
+                    t.rollback()
+                    outcomes.append((False, e))
+                else:
+                    t.commit()
+                    outcomes.append((True, result))
+                finally:
+                    self._tx_done.notify_all()
+            if any(ok for ok, _ in outcomes):
+                self.save(name, base_dir=base)
+        return outcomes
+
+    @_outside_transactions
     def save_all(self, base_dir=None):
-        for name in list(self.tables.keys()):
+        # tables still only in the catalog are unchanged on disk
+        for name, _ in self.tables.loaded():
             self.save(name, base_dir=base_dir)
 
-    def load(self, name, base_dir=None):
-        base = base_dir or DATA_DIR
-        path = f"{base}/{name}.json"
-        if not os.path.exists(path):
+    def _read_table(self, name, base):
+        path = table_path(name, base)
+        if path is None:
             raise ValueError("Table file does not exist")
-        with open(path) as f:
-            data = json.load(f)
+        if path.endswith(".tbl"):
+            # only the header is read here; rows are decoded on first use
+            rows = storage.MappedRows(path)
+            data = rows.header
+        else:
+            with open(path) as f:
+                data = json.load(f)
+            rows = data.get("rows")
         # basic validation
-        if "name" not in data or "columns" not in data or "rows" not in data:
+        if "name" not in data or "columns" not in data or rows is None:
+            raise ValueError("Invalid table file")
+        engine = TABLE_ENGINES.get(data.get("engine", "row"))
+        if engine is None:
             raise ValueError("Invalid table file")
-        t = Table(data["name"], data["columns"], data.get("primary_key"), data.get("unique_keys", []))
-        t.rows = data["rows"]
+        t = engine(data["name"], data["columns"], data.get("primary_key"), data.get("unique_keys", []), data.get("types"))
+        if isinstance(rows, list):
+            # JSON keeps TIMESTAMPs as text
+            stamps = [c for c, kind in t.types.items() if kind == "TIMESTAMP"]
+            for r in rows if stamps else ():
+                for c in stamps:
+                    r[c] = datatypes.coerce("TIMESTAMP", r.get(c), c)
+            t.rows = rows
+            t.rebuild_indexes()
+        else:
+            t._source = rows
+        for spec in data.get("indexes", []):
+            t.create_index(spec["name"], spec["column"], spec.get("type", "hash"))
+        # replay the log tail written after this snapshot
+        wal = self._wal(base)
+        if wal is not None:
+            for entry in wal.entries(name, after=data.get("lsn", 0)):
+                t.replay(entry)
+        return t
+
+    @_synchronized
+    def load(self, name, base_dir=None):
+        base = self._base(base_dir)
+        with self._shared_dir(base):
+            t = self._read_table(name, base)
+            migrate = not table_path(name, base).endswith(TABLE_EXTS[self.storage])
+        if migrate:
+            # automatic migration to this database's storage format
+            with self._shared_dir(base, exclusive=True):
+                wal = self._wal(base)
+                self._write_snapshot(t, base, wal.lsn if wal else None)
+                self._changed(base)
+        self._attach(t, base)
         self.tables[name] = t
 
+    @_outside_transactions
+    def checkpoint(self, base_dir=None):
+        """Fold the write-ahead log of a directory into fresh table snapshots."""
+        if self._tx is not None:
+            raise ValueError("Cannot checkpoint inside a transaction")
+        base = self._base(base_dir)
+        wal = self._wal(base)
+        if wal is None:
+            return
+        with self._shared_dir(base, exclusive=True):
+            wal.sync()
+            names = wal.tables() | {
+                n for n, b in self._bases.items() if b == base and self.tables.peek(n) and self.tables.peek(n).journal
+            }
+            for name in names:
+                if self.tables.peek(name) and self._bases.get(name) == base:
+                    t = self.tables.peek(name)
+                elif table_path(name, base):
+                    t = self._read_table(name, base)
+                else:
+                    # dropped since it was logged
+                    continue
+                with t.lock.read():
+                    self._write_snapshot(t, base, wal.lsn)
+                    if t.journal:
+                        t.journal = []
+                        self._clean[name] = t.version
+            wal.truncate()
+            for name, b in self._bases.items():
+                if b == base and self.tables.peek(name) is not None:
+                    self._stamps[name] = self._stamp(name, base)
+            self._changed(base)
+
+    @_synchronized
+    def sync(self):
+        for wal in self._wals.values():
+            wal.sync()
+
+    @_synchronized
+    def close(self):
+        self._vacuum_stop.set()
+        for wal in self._wals.values():
+            wal.close()
+        self._wals = {}
+        for lock in self._dir_locks.values():
+            lock.close()
+        for counter in self._counters.values():
+            counter.close()
+        self._dir_locks, self._counters = {}, {}
+
+    @_outside_transactions
     def drop_table(self, name, base_dir=None):
         if name not in self.tables:
             raise ValueError("Table does not exist")
+        if self._tx is not None:
+            raise ValueError("Cannot drop a table inside a transaction")
 
-        base = base_dir or DATA_DIR
-        # Remove JSON file if it exists
-        path = f"{base}/{name}.json"
-        if os.path.exists(path):
-            os.remove(path)
+        base = self._base(base_dir)
+        with self._shared_dir(base, exclusive=True):
+            # Remove the table file if it exists
+            path = table_path(name, base)
+            if path:
+                os.remove(path)
+            _update_manifest(base, name, None)
+            self._changed(base)
 
         del self.tables[name]
+        self._bases.pop(name, None)
+        self._clean.pop(name, None)
+        self._stamps.pop(name, None)
@@ -0,0 +1,177 @@
+#Index structures used by Table
+#
+# Indexes map column values to row handles: the row dicts of a row-store
+# table, or positional row ids of a columnar one. `ident` turns a handle
+# into something hashable that tells rows apart.
+
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+
+
+class HashIndex:
+    """Hash index mapping a column value to the rows holding it."""
+
+    kind = "hash"
+
+    def __init__(self, column, unique=False, ident=id):
+        self.column = column
+        self.unique = unique
+        self.ident = ident
+        self.map = {}
+
+    def add(self, key, row):
+        if self.unique:
+            self.map[key] = row
+        else:
+            self.map.setdefault(key, {})[self.ident(row)] = row
+
+    def add_many(self, pairs):
+        # (key, row) pairs
+        for key, row in pairs:
+            self.add(key, row)
+
+    def remove(self, key, row):
+        if self.unique:
+            existing = self.map.get(key)
+            if existing is not None and self.ident(existing) == self.ident(row):
+                del self.map[key]
+            return
+        bucket = self.map.get(key)
+        if bucket is not None:
+            bucket.pop(self.ident(row), None)
+            if not bucket:
+                del self.map[key]
+
+    def lookup(self, value):
+        try:
+            found = self.map.get(value)
+        except TypeError:
+            # unhashable, so never stored
+            return []
+        if found is None:
+            return []
+        if self.unique:
+            return [found]
+        return list(found.values())
+
+    def conflict(self, value, row=None):
+        # another row (not `row` itself) already holding `value` in a unique index
+        try:
+            existing = self.map.get(value)
+        except TypeError:
+            return False
+        return existing is not None and (row is None or self.ident(existing) != self.ident(row))
+
+    def distinct(self):
+        return len(self.map)
+
+    def clear(self):
+        self.map = {}
+
+
+def sort_key(value):
+    # total order over mixed value types: None < numbers < strings < timestamps < others
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    if isinstance(value, datetime):
+        return (3, value)
+    return (4, str(value))
+
+
+class SortedIndex:
+    """Ordered index kept as a bisect-maintained sorted key array."""
+
+    kind = "sorted"
+
+    def __init__(self, column, unique=False, ident=id):
+        self.column = column
+        self.unique = unique
+        self.ident = ident
+        self.keys = []
+        self.rows = []
+        self._distinct = 0
+
+    def add(self, key, row):
+        key = sort_key(key)
+        pos = bisect_right(self.keys, key)
+        if pos == 0 or self.keys[pos - 1] != key:
+            self._distinct += 1
+        self.keys.insert(pos, key)
+        self.rows.insert(pos, row)
+
+    def add_many(self, pairs):
+        """Add (key, row) pairs; a large batch is sorted once instead of inserted one by one."""
+        pairs = [(sort_key(key), row) for key, row in pairs]
+        if len(pairs) * 8 < len(self.keys):
+            # a few rows into a big index: each insert moves less than a rebuild
+            for key, row in pairs:
+                pos = bisect_right(self.keys, key)
+                if pos == 0 or self.keys[pos - 1] != key:
+                    self._distinct += 1
+                self.keys.insert(pos, key)
+                self.rows.insert(pos, row)
+            return
+        # the stable sort keeps equal keys in insertion order, as add() does
+        merged = list(zip(self.keys, self.rows)) + pairs
+        merged.sort(key=lambda pair: pair[0])
+        self.keys = [key for key, _ in merged]
+        self.rows = [row for _, row in merged]
+        self._distinct = sum(1 for i, key in enumerate(self.keys) if not i or key != self.keys[i - 1])
+
+    def remove(self, key, row):
+        key = sort_key(key)
+        lo = bisect_left(self.keys, key)
+        hi = bisect_right(self.keys, key, lo)
+        ident = self.ident(row)
+        for pos in range(lo, hi):
+            if self.ident(self.rows[pos]) == ident:
+                del self.keys[pos]
+                del self.rows[pos]
+                if hi - lo == 1:
+                    self._distinct -= 1
+                return
+
+    def lookup(self, value):
+        key = sort_key(value)
+        lo = bisect_left(self.keys, key)
+        return self.rows[lo:bisect_right(self.keys, key, lo)]
+
+    def conflict(self, value, row=None):
+        return any(row is None or self.ident(r) != self.ident(row) for r in self.lookup(value))
+
+    def distinct(self):
+        return self._distinct
+
+    def _span(self, lo, hi, lo_inclusive, hi_inclusive):
+        start, stop = 0, len(self.keys)
+        if lo is not None:
+            bound = bisect_left if lo_inclusive else bisect_right
+            start = bound(self.keys, sort_key(lo))
+        if hi is not None:
+            bound = bisect_right if hi_inclusive else bisect_left
+            stop = bound(self.keys, sort_key(hi))
+        return start, stop
+
+    def irange(self, lo=None, hi=None, lo_inclusive=True, hi_inclusive=True, descending=False):
+        # iterate rows with lo <(=) key <(=) hi in key order; None means unbounded
+        start, stop = self._span(lo, hi, lo_inclusive, hi_inclusive)
+        positions = range(stop - 1, start - 1, -1) if descending else range(start, stop)
+        rows = self.rows
+        return (rows[p] for p in positions)
+
+    def count(self, lo=None, hi=None, lo_inclusive=True, hi_inclusive=True):
+        # number of rows irange() would yield, from two bisections
+        start, stop = self._span(lo, hi, lo_inclusive, hi_inclusive)
+        return max(0, stop - start)
+
+    def clear(self):
+        self.keys = []
+        self.rows = []
+        self._distinct = 0
+
+
+INDEX_TYPES = {"hash": HashIndex, "sorted": SortedIndex}
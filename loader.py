@@ -0,0 +1,54 @@
+#Streaming readers for bulk loads
+#
+# Each reader yields one record dict per line of the file, so a load never
+# holds more of the file in memory than the batch being inserted. CSV
+# values stay strings, as typed values do in SQL, and empty fields are NULL.
+
+import csv, json, os
+
+
+def read_csv(path, columns, header=False):
+    """Records of a CSV file: fields in table column order, or named by a header line."""
+    with _open(path, newline="") as f:
+        reader = csv.reader(f)
+        names = columns
+        if header:
+            names = next(reader, None) or []
+            if sorted(names) != sorted(columns):
+                raise ValueError(f"CSV header {names} does not match the table columns {list(columns)}")
+        for line, fields in enumerate(reader, 2 if header else 1):
+            if not fields:
+                continue
+            if len(fields) != len(names):
+                raise ValueError(f"Line {line}: expected {len(names)} fields, got {len(fields)}")
+            yield {c: v if v != "" else None for c, v in zip(names, fields)}
+
+
+def read_jsonl(path, columns=None, header=False):
+    """Records of a JSON Lines file: one JSON object per line."""
+    with _open(path) as f:
+        for line, text in enumerate(f, 1):
+            if not text.strip():
+                continue
+            try:
+                record = json.loads(text)
+            except ValueError:
+                raise ValueError(f"Line {line}: invalid JSON")
+            if not isinstance(record, dict):
+                raise ValueError(f"Line {line}: expected a JSON object")
+            yield record
+
+
+FORMATS = {"csv": read_csv, "jsonl": read_jsonl}
+
+
+def read(path, format, columns, header=False):
+    if format not in FORMATS:
+        raise ValueError(f"Unknown file format: {format}")
+    return FORMATS[format](path, columns, header)
+
+
+def _open(path, **kwargs):
+    if not os.path.isfile(path):
+        raise ValueError(f"File does not exist: {path}")
+    return open(path, encoding="utf-8", **kwargs)
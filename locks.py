@@ -0,0 +1,172 @@
+#Locks: a reader/writer lock guarding one table, and the file lock and
+# change counter processes sharing a database directory coordinate with
+
+import mmap, os, threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # no advisory file locks (Windows): FileLock then only does bookkeeping
+    fcntl = None
+
+
+class RWLock:
+    """Any number of readers or one writer; waiting writers go first.
+
+    Reentrant per thread: the writer may read or write again and a reader
+    may read again. A reader asking to write would wait on itself forever,
+    so that raises RuntimeError instead.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        # thread id -> read depth
+        self._readers = {}
+        self._writer = None
+        self._depth = 0
+        self._waiting = 0
+
+    def is_writer(self):
+        return self._writer == threading.get_ident()
+
+    def acquire_read(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer != me and me not in self._readers:
+                while self._writer is not None or self._waiting:
+                    self._cond.wait()
+            self._readers[me] = self._readers.get(me, 0) + 1
+
+    def release_read(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._readers[me] > 1:
+                self._readers[me] -= 1
+                return
+            del self._readers[me]
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._depth += 1
+                return
+            if me in self._readers:
+                raise RuntimeError("Cannot write while reading: finish or close the iterator first")
+            self._waiting += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+            finally:
+                self._waiting -= 1
+            self._writer = me
+            self._depth = 1
+
+    def release_write(self):
+        with self._cond:
+            self._depth -= 1
+            if not self._depth:
+                self._writer = None
+                self._cond.notify_all()
+
+    @contextmanager
+    def read(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+class FileLock:
+    """Advisory lock on a file, shared between processes (fcntl.flock).
+
+    Holders are processes, not threads: callers serialize their own threads
+    (Database does, under its lock). Nested acquisitions only count, and a
+    shared holder asking for exclusive raises RuntimeError, as in RWLock.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._f = None
+        self._exclusive = False
+        self._depth = 0
+
+    def acquire(self, exclusive=False):
+        if self._depth:
+            if exclusive and not self._exclusive:
+                raise RuntimeError("Cannot take an exclusive lock while holding a shared one")
+            self._depth += 1
+            return
+        if self._f is None:
+            self._f = open(self.path, "a")
+        if fcntl is not None:
+            fcntl.flock(self._f.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        self._exclusive = exclusive
+        self._depth = 1
+
+    def release(self):
+        self._depth -= 1
+        if not self._depth and fcntl is not None:
+            fcntl.flock(self._f.fileno(), fcntl.LOCK_UN)
+
+    @contextmanager
+    def shared(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    @contextmanager
+    def exclusive(self):
+        self.acquire(exclusive=True)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+
+class ChangeCounter:
+    """A 64-bit counter in a small file, memory-mapped so reading it costs no system call.
+
+    Writers bump it while holding the exclusive FileLock; readers compare
+    it with the value they last saw to know whether anything changed.
+    """
+
+    def __init__(self, path):
+        fd = os.open(path, os.O_RDWR | os.O_CREAT)
+        try:
+            if os.fstat(fd).st_size < 8:
+                os.ftruncate(fd, 8)
+            self._map = mmap.mmap(fd, 8)
+        finally:
+            os.close(fd)
+
+    @property
+    def value(self):
+        return int.from_bytes(self._map[:8], "little")
+
+    def bump(self):
+        value = self.value + 1
+        self._map[:8] = value.to_bytes(8, "little")
+        return value
+
+    def close(self):
+        self._map.close()
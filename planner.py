@@ -0,0 +1,862 @@
+#Query planner and executor
+#
+# plan() turns a parsed SELECT into a tree of physical operators, picking
+# access paths by cost estimates from Table.stats(). execute() runs any
+# parsed statement against a Database. Operators yield row mappings: scans
+# yield read-only views of just the columns the query uses.
+
+import heapq, math
+from itertools import islice
+
+import sql
+import vector
+from db import RANGE_OPS, RowView, coerce_where, is_compound, range_bounds, row_predicate, sort_key, split_where, where_leaves
+
+# relative cost of checking one row in a NumPy mask instead of in Python
+VECTOR_ROW_COST = 0.05
+
+
+def selectivity(where, stats):
+    """Estimated fraction of rows matching a where clause."""
+    if is_compound(where):
+        parts = [selectivity(w, stats) for w in where[1:]]
+        if where[0] == "NOT":
+            return 1 - parts[0]
+        if where[0] == "AND":
+            return math.prod(parts)
+        return 1 - math.prod(1 - p for p in parts)
+    col, op, val = split_where(where)
+    distinct = max(1, stats["distinct"].get(col, 1))
+    if op == "=":
+        return 1 / distinct
+    if op == "!=":
+        return 1 - 1 / distinct
+    # textbook defaults for ranges, without histograms
+    return 0.25 if op == "BETWEEN" else 1 / 3
+
+
+def format_where(where):
+    if is_compound(where):
+        if where[0] == "NOT":
+            return f"NOT {format_where(where[1])}"
+        return "(" + f" {where[0]} ".join(format_where(w) for w in where[1:]) + ")"
+    col, op, val = split_where(where)
+    if op == "BETWEEN":
+        return f"{col} BETWEEN {val[0]!r} AND {val[1]!r}"
+    return f"{col} {op} {val!r}"
+
+
+def _get(col):
+    return lambda r: r.get(col)
+
+
+def call_label(call):
+    return f"{call.func}({call.column or '*'})"
+
+
+class Operator:
+    """A plan node: rows() yields row mappings, `estimate` is the expected row count."""
+
+    children = ()
+
+    def __init__(self, estimate):
+        self.estimate = estimate
+
+    def rows(self):
+        raise NotImplementedError
+
+    def describe(self):
+        return type(self).__name__
+
+    def explain(self, depth=0):
+        lines = [f"{'  ' * depth}{'-> ' if depth else ''}{self.describe()}  (rows={round(self.estimate)})"]
+        for child in self.children:
+            lines += child.explain(depth + 1)
+        return lines
+
+
+class SeqScan(Operator):
+    def __init__(self, table, where, estimate, columns=None):
+        super().__init__(estimate)
+        self.table = table
+        self.where = where
+        self.columns = columns
+
+    def rows(self):
+        return self.table.full_scan(self.where, self.columns)
+
+    def describe(self):
+        text = f"Seq Scan on {self.table.name}"
+        return text + f" filter {format_where(self.where)}" if self.where else text
+
+
+class IndexScan(Operator):
+    # an index lookup / range when `term` is given, else a walk in index order
+    def __init__(self, table, index, term, estimate, descending=False, columns=None):
+        super().__init__(estimate)
+        self.table = table
+        self.index = index
+        self.term = term
+        self.descending = descending
+        self.columns = columns
+
+    def rows(self):
+        if self.term is None:
+            return self.table.index_scan(self.index, descending=self.descending, columns=self.columns)
+        _, op, val = split_where(self.term)
+        return self.table.index_scan(self.index, op, val, self.descending, self.columns)
+
+    def describe(self):
+        text = f"Index Scan using {self.index} on {self.table.name}"
+        if self.term is not None:
+            text += f" where {format_where(self.term)}"
+        return text + " DESC" if self.descending else text
+
+
+class Filter(Operator):
+    def __init__(self, child, where, estimate):
+        super().__init__(estimate)
+        self.children = (child,)
+        self.where = where
+
+    def rows(self):
+        return filter(row_predicate(self.where, _get), self.children[0].rows())
+
+    def describe(self):
+        return f"Filter {format_where(self.where)}"
+
+
+class Sort(Operator):
+    # keeps only the first `limit` rows in a heap when a limit is known
+    def __init__(self, child, column, descending, limit, estimate):
+        super().__init__(estimate)
+        self.children = (child,)
+        self.column = column
+        self.descending = descending
+        self.limit = limit
+
+    def rows(self):
+        col = self.column
+        key = lambda r: sort_key(r.get(col))
+        rows = self.children[0].rows()
+        if self.limit is not None:
+            pick = heapq.nlargest if self.descending else heapq.nsmallest
+            return iter(pick(self.limit, rows, key=key))
+        return iter(sorted(rows, key=key, reverse=self.descending))
+
+    def describe(self):
+        text = f"Sort by {self.column} {'DESC' if self.descending else 'ASC'}"
+        return text + f" (top {self.limit})" if self.limit is not None else text
+
+
+class Limit(Operator):
+    def __init__(self, child, limit, offset, estimate):
+        super().__init__(estimate)
+        self.children = (child,)
+        self.limit = limit
+        self.offset = offset
+
+    def rows(self):
+        stop = None if self.limit is None else self.offset + self.limit
+        return islice(self.children[0].rows(), self.offset, stop)
+
+    def describe(self):
+        return f"Limit {self.limit if self.limit is not None else 'ALL'} offset {self.offset}"
+
+
+class Project(Operator):
+    # output column `names[i]` takes the value of row key `sources[i]`
+    def __init__(self, child, sources, names):
+        super().__init__(child.estimate)
+        self.children = (child,)
+        self.sources = sources
+        self.names = names
+
+    def rows(self):
+        pairs = list(zip(self.names, self.sources))
+        return ({name: r.get(src) for name, src in pairs} for r in self.children[0].rows())
+
+    def describe(self):
+        return f"Project {', '.join(self.names)}"
+
+
+class Qualify(Operator):
+    # renames a table's columns to alias.column for joins; shown as part of its input
+    def __init__(self, child, table, alias, columns):
+        super().__init__(child.estimate)
+        self.children = child.children
+        self.child = child
+        self.table = table
+        self.alias = alias
+        self.source_columns = columns
+        self.columns = [f"{alias}.{c}" for c in columns]
+
+    def rows(self):
+        pairs = list(zip(self.columns, self.source_columns))
+        return ({q: r.get(c) for q, c in pairs} for r in self.child.rows())
+
+    def describe(self):
+        text = self.child.describe()
+        return text if self.alias == self.table.name else f"{text} as {self.alias}"
+
+
+class HashJoin(Operator):
+    """Equi-join that hashes the smaller input and streams the other one past it."""
+
+    def __init__(self, left, right, left_key, right_key, kind, estimate):
+        super().__init__(estimate)
+        self.children = (left, right)
+        self.left_key = left_key
+        self.right_key = right_key
+        self.kind = kind
+        self.build_left = left.estimate < right.estimate
+
+    def rows(self):
+        left, right = self.children
+        lk, rk = self.left_key, self.right_key
+        # NULL keys never match; sort_key makes 1 and 1.0 (and unhashable values) comparable
+        nulls = dict.fromkeys(right.columns)
+        table = {}
+        if self.build_left:
+            built = list(left.rows())
+            for i, l in enumerate(built):
+                if l.get(lk) is not None:
+                    table.setdefault(sort_key(l[lk]), []).append(i)
+            matched = bytearray(len(built))
+            for r in right.rows():
+                if r.get(rk) is None:
+                    continue
+                for i in table.get(sort_key(r[rk]), ()):
+                    matched[i] = 1
+                    yield {**built[i], **r}
+            if self.kind == "left":
+                for i, l in enumerate(built):
+                    if not matched[i]:
+                        yield {**l, **nulls}
+            return
+        for r in right.rows():
+            if r.get(rk) is not None:
+                table.setdefault(sort_key(r[rk]), []).append(r)
+        for l in left.rows():
+            matches = table.get(sort_key(l[lk]), ()) if l.get(lk) is not None else ()
+            for r in matches:
+                yield {**l, **r}
+            if not matches and self.kind == "left":
+                yield {**l, **nulls}
+
+    def describe(self):
+        side = "left" if self.build_left else "right"
+        return f"Hash {self.kind.title()} Join on {self.left_key} = {self.right_key} (build {side})"
+
+
+class MergeJoin(Operator):
+    """Equi-join of two inputs that both arrive sorted on their join key."""
+
+    def __init__(self, left, right, left_key, right_key, kind, estimate):
+        super().__init__(estimate)
+        self.children = (left, right)
+        self.left_key = left_key
+        self.right_key = right_key
+        self.kind = kind
+
+    def rows(self):
+        left, right = self.children
+        lk, rk = self.left_key, self.right_key
+        nulls = dict.fromkeys(right.columns)
+        rights = iter(right.rows())
+        r = next(rights, None)
+        group, group_key = [], None
+        for l in left.rows():
+            key = None if l.get(lk) is None else sort_key(l[lk])
+            if key is not None and key != group_key:
+                # advance the right side to this key and collect its equal run
+                while r is not None and (r.get(rk) is None or sort_key(r[rk]) < key):
+                    r = next(rights, None)
+                group = []
+                while r is not None and r.get(rk) is not None and sort_key(r[rk]) == key:
+                    group.append(r)
+                    r = next(rights, None)
+                group_key = key
+            matches = group if key is not None else ()
+            for m in matches:
+                yield {**l, **m}
+            if not matches and self.kind == "left":
+                yield {**l, **nulls}
+
+    def describe(self):
+        return f"Merge {self.kind.title()} Join on {self.left_key} = {self.right_key}"
+
+
+class Accumulator:
+    """Running COUNT/SUM/AVG/MIN/MAX of the non-NULL values fed to add()."""
+
+    def __init__(self, func):
+        self.func = func
+        self.count = 0
+        self.total = 0
+        self.best = None
+
+    def add(self, value):
+        if value is None:
+            return
+        self.count += 1
+        if self.func in ("SUM", "AVG"):
+            try:
+                self.total += value
+            except TypeError:
+                raise ValueError(f"{self.func} needs numeric values")
+        elif self.func == "MIN":
+            if self.best is None or sort_key(value) < sort_key(self.best):
+                self.best = value
+        elif self.func == "MAX":
+            if self.best is None or sort_key(value) > sort_key(self.best):
+                self.best = value
+
+    def result(self):
+        if self.func == "COUNT":
+            return self.count
+        if not self.count:
+            return None
+        if self.func == "SUM":
+            return self.total
+        if self.func == "AVG":
+            return self.total / self.count
+        return self.best
+
+
+def _feed(accs, calls, row):
+    for acc, call in zip(accs, calls):
+        acc.add(1 if call.column is None else row.get(call.column))
+
+
+class Aggregate(Operator):
+    # one pass over the child rows, producing a single row keyed by `labels`
+    def __init__(self, child, calls, labels):
+        super().__init__(1)
+        self.children = (child,)
+        self.calls = calls
+        self.labels = labels
+
+    def rows(self):
+        accs = [Accumulator(c.func) for c in self.calls]
+        for r in self.children[0].rows():
+            _feed(accs, self.calls, r)
+        yield {label: acc.result() for label, acc in zip(self.labels, accs)}
+
+    def describe(self):
+        return f"Aggregate {', '.join(self.labels)}"
+
+
+class HashAggregate(Operator):
+    """GROUP BY in one streaming pass, keeping one set of accumulators per group."""
+
+    def __init__(self, child, keys, calls, labels, estimate):
+        super().__init__(estimate)
+        self.children = (child,)
+        self.keys = keys
+        self.calls = calls
+        self.labels = labels
+
+    def rows(self):
+        keys, calls = self.keys, self.calls
+        groups = {}
+        for r in self.children[0].rows():
+            values = tuple(r.get(k) for k in keys)
+            # sort_key keeps unhashable values groupable
+            group = groups.get(tuple(map(sort_key, values)))
+            if group is None:
+                group = groups[tuple(map(sort_key, values))] = (values, [Accumulator(c.func) for c in calls])
+            _feed(group[1], calls, r)
+        for values, accs in groups.values():
+            yield _group_row(keys, values, self.labels, accs)
+
+    def describe(self):
+        return f"Hash Aggregate {', '.join(self.labels)} group by {', '.join(self.keys)}"
+
+
+class StreamAggregate(Operator):
+    # GROUP BY over input already ordered on the keys: one group in memory at a time
+    def __init__(self, child, keys, calls, labels, estimate):
+        super().__init__(estimate)
+        self.children = (child,)
+        self.keys = keys
+        self.calls = calls
+        self.labels = labels
+
+    def rows(self):
+        keys, calls = self.keys, self.calls
+        current = values = accs = None
+        for r in self.children[0].rows():
+            row_values = tuple(r.get(k) for k in keys)
+            key = tuple(map(sort_key, row_values))
+            if key != current:
+                if accs is not None:
+                    yield _group_row(keys, values, self.labels, accs)
+                current, values, accs = key, row_values, [Accumulator(c.func) for c in calls]
+            _feed(accs, calls, r)
+        if accs is not None:
+            yield _group_row(keys, values, self.labels, accs)
+
+    def describe(self):
+        return f"Stream Aggregate {', '.join(self.labels)} group by {', '.join(self.keys)}"
+
+
+class IndexAggregate(Operator):
+    # COUNT / MIN / MAX per key read straight off an index, no table scan
+    def __init__(self, table, index, key, calls, labels, estimate):
+        super().__init__(estimate)
+        self.table = table
+        self.index = index
+        self.key = key
+        self.calls = calls
+        self.labels = labels
+
+    def rows(self):
+        for value, count in self.table.index_groups(self.index):
+            row = {self.key: value}
+            for label, call in zip(self.labels, self.calls):
+                if call.func == "COUNT":
+                    row[label] = count if call.column is None or value is not None else 0
+                else:
+                    row[label] = value
+            yield row
+
+    def describe(self):
+        return f"Index Aggregate {', '.join(self.labels)} using {self.index} on {self.table.name}"
+
+
+def _group_row(keys, values, labels, accs):
+    row = dict(zip(keys, values))
+    for label, acc in zip(labels, accs):
+        row[label] = acc.result()
+    return row
+
+
+class TableAggregate(Operator):
+    # aggregates reduced inside the table, over NumPy column arrays when available
+    def __init__(self, table, calls, labels, where):
+        super().__init__(1)
+        self.table = table
+        self.calls = calls
+        self.labels = labels
+        self.where = where
+
+    def rows(self):
+        t, where = self.table, self.where
+        yield {label: t.aggregate(c.func, c.column, where) for label, c in zip(self.labels, self.calls)}
+
+    def describe(self):
+        text = f"Vectorized Aggregate {', '.join(self.labels)} on {self.table.name}"
+        return text + f" filter {format_where(self.where)}" if self.where else text
+
+
+def _table(db, name):
+    if name not in db.tables:
+        raise ValueError("Table does not exist")
+    return db.tables[name]
+
+
+def _check_column(t, col):
+    if col not in t.columns:
+        raise ValueError(f"Unknown column: {col}")
+
+
+def _index_for(t, column, ordered=False):
+    # name of an index on `column`; hash indexes first for lookups
+    found = None
+    for name, idx in t.indexes.items():
+        if idx.column != column or (ordered and idx.kind != "sorted"):
+            continue
+        if idx.kind == "hash":
+            return name
+        found = found or name
+    return found
+
+
+def _vectorized(t, stats):
+    return vector.np is not None and stats["rows"] >= vector.MIN_ROWS
+
+
+def _access_path(t, where, stats, columns=None):
+    # cheapest way to produce `columns` of the rows matching `where`, and its cost
+    n = stats["rows"]
+    scan_cost = n * VECTOR_ROW_COST if _vectorized(t, stats) else n
+    if where is None:
+        return SeqScan(t, None, n, columns), scan_cost
+    est = n * selectivity(where, stats)
+    best, best_cost = SeqScan(t, where, est, columns), scan_cost
+    if not is_compound(where):
+        terms = [where]
+    elif where[0] == "AND":
+        terms = list(where[1:])
+    else:
+        terms = []
+    for term in terms:
+        if is_compound(term):
+            continue
+        col, op, val = split_where(term)
+        if op == "!=" or (op in RANGE_OPS and _index_for(t, col, ordered=True) is None):
+            continue
+        name = _index_for(t, col, ordered=op != "=")
+        if name is None:
+            continue
+        idx = t.indexes[name]
+        if idx.kind == "sorted":
+            # a sorted index counts its matches exactly
+            term_est = idx.count(**range_bounds(op, val))
+        else:
+            term_est = n * selectivity(term, stats)
+        cost = term_est + math.log2(n + 1)
+        if cost >= best_cost:
+            continue
+        node = IndexScan(t, name, term, term_est, columns=columns)
+        rest = [w for w in terms if w is not term]
+        if rest:
+            node = Filter(node, rest[0] if len(rest) == 1 else ("AND", *rest), est)
+        best, best_cost = node, cost
+    return best, best_cost
+
+
+def _ordered(t, access, cost, where, order_by, descending, stop, stats, columns=None):
+    # sort the access path's rows, or walk a sorted index on order_by if cheaper
+    est = access.estimate
+    sort = Sort(access, order_by, descending, stop, est if stop is None else min(est, stop))
+    sort_cost = cost + est * math.log2(est + 2)
+    name = _index_for(t, order_by, ordered=True)
+    if name is None:
+        return sort
+    n = stats["rows"]
+    if where is not None and not is_compound(where) and where[0] == order_by and split_where(where)[1] != "!=":
+        # the filter is a range on the sort column: one index range, no sort
+        return IndexScan(t, name, where, est, descending, columns)
+    walk = IndexScan(t, name, None, n, descending, columns)
+    walk_cost = n
+    if where is not None:
+        sel = selectivity(where, stats)
+        walk = Filter(walk, where, est)
+        if stop is not None:
+            # stops after `stop` matches, about stop / selectivity rows in
+            walk_cost = min(n, stop / max(sel, 1e-9))
+    elif stop is not None:
+        walk_cost = min(n, stop)
+    return walk if walk_cost < sort_cost else sort
+
+
+class Scope:
+    """The tables of a query by alias, resolving (possibly qualified) column names."""
+
+    def __init__(self, db, stmt):
+        self.tables = {}
+        for name, alias in [(stmt.table, stmt.alias)] + [(j.table, j.alias) for j in stmt.joins]:
+            alias = alias or name
+            if alias in self.tables:
+                raise ValueError(f"Duplicate table name or alias: {alias}")
+            self.tables[alias] = _table(db, name)
+        # joined rows carry alias.column keys, single-table rows plain columns
+        self.joined = len(self.tables) > 1
+
+    def locate(self, name):
+        # (alias, column) of a column reference
+        if "." in name:
+            alias, col = name.split(".", 1)
+            if alias not in self.tables:
+                raise ValueError(f"Unknown table: {alias}")
+            _check_column(self.tables[alias], col)
+            return alias, col
+        owners = [a for a, t in self.tables.items() if name in t.columns]
+        if not owners:
+            raise ValueError(f"Unknown column: {name}")
+        if len(owners) > 1:
+            raise ValueError(f"Ambiguous column: {name}")
+        return owners[0], name
+
+    def resolve(self, name):
+        alias, col = self.locate(name)
+        return f"{alias}.{col}" if self.joined else col
+
+    def coerce(self, name, op, val):
+        # a comparison with its value converted to the column's type, if typed
+        alias, col = self.locate(name)
+        return name, op, coerce_where((col, op, val), self.tables[alias].types)[2]
+
+
+def _map_leaves(where, fn):
+    # the where clause with every (col, op, value) comparison passed through `fn`
+    if is_compound(where):
+        return (where[0], *(_map_leaves(w, fn) for w in where[1:]))
+    return fn(*split_where(where))
+
+
+def _rename(where, rename):
+    return _map_leaves(where, lambda col, op, val: (rename(col), op, val))
+
+
+def _number(value):
+    # literals are strings; compared with COUNT/SUM/AVG results they are numbers
+    if isinstance(value, str):
+        for cast in (int, float):
+            try:
+                return cast(value)
+            except ValueError:
+                pass
+    return value
+
+
+def _conjunction(terms):
+    if not terms:
+        return None
+    return terms[0] if len(terms) == 1 else ("AND", *terms)
+
+
+def _join_tree(scope, stmt, where, needed):
+    # left-deep join of the FROM tables; returns the tree and the where part left to filter
+    nullable = {j.alias or j.table for j in stmt.joins if j.kind == "left"}
+    if where is None:
+        terms = []
+    elif is_compound(where) and where[0] == "AND":
+        terms = list(where[1:])
+    else:
+        terms = [where]
+    # push single-table terms into that table's scan, except below a LEFT JOIN's
+    # nullable side, where they must see the NULL-extended rows
+    local = {alias: [] for alias in scope.tables}
+    residual = []
+    for term in terms:
+        owners = {col.split(".", 1)[0] for col, _, _ in where_leaves(term)}
+        alias = owners.pop() if len(owners) == 1 else None
+        if alias is not None and alias not in nullable:
+            local[alias].append(_rename(term, lambda c: c.split(".", 1)[1]))
+        else:
+            residual.append(term)
+
+    def source(alias, ordered_on=None):
+        t = scope.tables[alias]
+        stats = t.stats()
+        where = _conjunction(local[alias])
+        columns = needed[alias]
+        if ordered_on is None:
+            node = _access_path(t, where, stats, columns)[0]
+        else:
+            node = IndexScan(t, _index_for(t, ordered_on, ordered=True), None, stats["rows"], columns=columns)
+            if where is not None:
+                node = Filter(node, where, stats["rows"] * selectivity(where, stats))
+        return Qualify(node, t, alias, columns)
+
+    aliases = list(scope.tables)
+    joined = {aliases[0]}
+    node = None
+    for j in stmt.joins:
+        alias = j.alias or j.table
+        (la, lc), (ra, rc) = scope.locate(j.left), scope.locate(j.right)
+        if ra != alias:
+            (la, lc), (ra, rc) = (ra, rc), (la, lc)
+        if ra != alias or la not in joined:
+            raise ValueError(f"JOIN {alias} ON must compare a column of {alias} with an earlier table")
+        lt, rt = scope.tables[la], scope.tables[ra]
+        merge = node is None and _index_for(lt, lc, ordered=True) and _index_for(rt, rc, ordered=True)
+        left = node if node is not None else source(la, lc if merge else None)
+        right = source(ra, rc if merge else None)
+        # matches per key: the larger side's row count over its distinct keys
+        distinct = max(lt.stats()["distinct"].get(lc, 1), rt.stats()["distinct"].get(rc, 1), 1)
+        est = left.estimate * right.estimate / distinct
+        if j.kind == "left":
+            est = max(est, left.estimate)
+        join = MergeJoin if merge else HashJoin
+        node = join(left, right, f"{la}.{lc}", f"{ra}.{rc}", j.kind, est)
+        joined.add(alias)
+    return node, _conjunction(residual)
+
+
+def _group_single(t, access, where, keys, calls, labels, stats, columns):
+    # GROUP BY on one table: from an index when it has all the answers, by
+    # walking a sorted index on the key, or with a hash table.
+    # Returns the node and the key its output is ordered on, if any.
+    est = min(access.estimate, math.prod(max(1, stats["distinct"].get(k, 1)) for k in keys))
+    if len(keys) == 1:
+        key = keys[0]
+        on_key = all(c.column is None or (c.column == key and c.func in ("COUNT", "MIN", "MAX")) for c in calls)
+        name = _index_for(t, key)
+        if where is None and on_key and name is not None:
+            ordered = t.indexes[name].kind == "sorted"
+            return IndexAggregate(t, name, key, calls, labels, est), key if ordered else None
+        name = _index_for(t, key, ordered=True)
+        if name is not None and isinstance(access, SeqScan) and (where is None or not _vectorized(t, stats)):
+            walk = IndexScan(t, name, None, stats["rows"], columns=columns)
+            if where is not None:
+                walk = Filter(walk, where, access.estimate)
+            return StreamAggregate(walk, keys, calls, labels, est), key
+    return HashAggregate(access, keys, calls, labels, est), None
+
+
+def _needed(scope, stmt):
+    # columns each table has to produce, by alias, in table order (projection pushdown)
+    if not stmt.columns:
+        return {alias: t.columns for alias, t in scope.tables.items()}
+    refs = list(stmt.columns) + list(stmt.group_by) + [stmt.order_by]
+    for where in (stmt.where, stmt.having):
+        if where is not None:
+            refs += [col for col, _, _ in where_leaves(where)]
+    for j in stmt.joins:
+        refs += [j.left, j.right]
+    refs = [r.column if isinstance(r, sql.Call) else r for r in refs]
+    used = {scope.locate(r) for r in refs if r is not None}
+    return {alias: [c for c in t.columns if (alias, c) in used] for alias, t in scope.tables.items()}
+
+
+def _input(scope, stmt, where, needed):
+    # rows of the FROM clause filtered by WHERE: a join tree or one table's access path, and its cost
+    if scope.joined:
+        node, residual = _join_tree(scope, stmt, where, needed)
+        if residual is not None:
+            stats = {"distinct": {f"{a}.{c}": d for a, t in scope.tables.items() for c, d in t.stats()["distinct"].items()}}
+            node = Filter(node, residual, node.estimate * selectivity(residual, stats))
+        return node, node.estimate
+    alias = stmt.alias or stmt.table
+    t = scope.tables[alias]
+    return _access_path(t, where, t.stats(), needed[alias])
+
+
+def plan(db, stmt):
+    """Physical operator tree for a Select statement."""
+    scope = Scope(db, stmt)
+    if stmt.where is not None and any(isinstance(col, sql.Call) for col, _, _ in where_leaves(stmt.where)):
+        raise ValueError("Aggregates are not allowed in WHERE; use HAVING")
+    where = None if stmt.where is None else _rename(_map_leaves(stmt.where, scope.coerce), scope.resolve)
+    columns = stmt.columns or ()
+    names = [call_label(c) if isinstance(c, sql.Call) else c for c in columns]
+    group_by = [scope.resolve(c) for c in stmt.group_by]
+    grouped = bool(group_by) or any(isinstance(c, sql.Call) for c in columns)
+    stop = None if stmt.limit is None else stmt.offset + stmt.limit
+    needed = _needed(scope, stmt)
+    node, cost = _input(scope, stmt, where, needed)
+    t = None if scope.joined else scope.tables[stmt.alias or stmt.table]
+    columns_used = None if t is None else needed[stmt.alias or stmt.table]
+
+    if grouped:
+        if not columns:
+            raise ValueError("SELECT * cannot be combined with GROUP BY")
+        # aggregates to compute, from the select list, HAVING and ORDER BY
+        calls, labels = [], []
+
+        def output_key(item):
+            # key of a select / HAVING / ORDER BY item in the aggregated rows
+            if isinstance(item, sql.Call):
+                label = call_label(item)
+                if label not in labels:
+                    labels.append(label)
+                    calls.append(sql.Call(item.func, item.column and scope.resolve(item.column)))
+                return label
+            key = scope.resolve(item)
+            if key not in group_by:
+                raise ValueError(f"Column {item} must appear in GROUP BY or be aggregated")
+            return key
+
+        def having_term(col, op, val):
+            if isinstance(col, sql.Call) and col.func in ("COUNT", "SUM", "AVG"):
+                val = tuple(map(_number, val)) if op == "BETWEEN" else _number(val)
+            elif isinstance(col, sql.Call):
+                # MIN / MAX are values of their column
+                val = scope.coerce(col.column, op, val)[2]
+            else:
+                val = scope.coerce(col, op, val)[2]
+            return (output_key(col), op, val)
+
+        sources = [output_key(c) for c in columns]
+        having = None if stmt.having is None else _map_leaves(stmt.having, having_term)
+        order_by = None if stmt.order_by is None else output_key(stmt.order_by)
+        ordered_on = None
+        if not group_by:
+            if t is not None and isinstance(node, SeqScan) and _vectorized(t, t.stats()):
+                node = TableAggregate(t, calls, labels, where)
+            else:
+                node = Aggregate(node, calls, labels)
+        elif t is not None:
+            node, ordered_on = _group_single(t, node, where, group_by, calls, labels, t.stats(), columns_used)
+        else:
+            node = HashAggregate(node, group_by, calls, labels, node.estimate)
+        if having is not None:
+            node = Filter(node, having, node.estimate / 3)
+        if order_by is not None and (order_by != ordered_on or stmt.descending):
+            node = Sort(node, order_by, stmt.descending, stop, node.estimate)
+    else:
+        sources = [scope.resolve(c) for c in columns]
+        if stmt.order_by is not None:
+            if isinstance(stmt.order_by, sql.Call):
+                raise ValueError("ORDER BY an aggregate needs an aggregate query")
+            order_by = scope.resolve(stmt.order_by)
+            if t is None:
+                node = Sort(node, order_by, stmt.descending, stop, node.estimate)
+            else:
+                node = _ordered(t, node, cost, where, order_by, stmt.descending, stop, t.stats(), columns_used)
+
+    if stmt.limit is not None or stmt.offset:
+        est = max(0, node.estimate - stmt.offset)
+        node = Limit(node, stmt.limit, stmt.offset, est if stmt.limit is None else min(est, stmt.limit))
+    if columns:
+        node = Project(node, sources, names)
+    return node
+
+
+def explain(db, stmt):
+    return "\n".join(plan(db, stmt).explain())
+
+
+def execute(db, stmt):
+    """Run a parsed statement: SELECT gives a list of rows, EXPLAIN the plan text, others a message.
+
+    Writes are saved as they happen, or at COMMIT inside a transaction.
+    Result rows are dicts; iterate plan(db, stmt).rows() to stream them
+    instead. SELECT results other than whole tables are kept in the
+    database's result cache until a table they read changes, and their
+    rows are read-only (cache.FrozenRow), even when too big to keep.
+    """
+    if isinstance(stmt, sql.Explain):
+        return explain(db, stmt.statement)
+    if isinstance(stmt, sql.Select):
+        run = lambda: [dict(r) if isinstance(r, RowView) else r for r in plan(db, stmt).rows()]
+        whole = stmt.where is None and stmt.limit is None and not stmt.joins and not stmt.group_by and not any(
+            isinstance(c, sql.Call) for c in stmt.columns or ())
+        if db.result_cache is None or whole:
+            return run()
+        # the bound statement is the normalized text plus its parameters
+        tables = [_table(db, name) for name in [stmt.table] + [j.table for j in stmt.joins]]
+        return db.result_cache.cached(("query", stmt), tables, run)
+    if isinstance(stmt, sql.Insert):
+        t = _table(db, stmt.table)
+        t.insert(dict(zip(t.columns, stmt.values)))
+        db.save(stmt.table)
+        return "Row inserted"
+    if isinstance(stmt, sql.Delete):
+        t = _table(db, stmt.table)
+        for col, _, _ in where_leaves(stmt.where):
+            _check_column(t, col)
+        t.delete(stmt.where)
+        db.save(stmt.table)
+        return "Row deleted"
+    if isinstance(stmt, sql.CreateTable):
+        db.create_table(stmt.name, list(stmt.columns), if_not_exists=True, types=dict(stmt.types))
+        db.save(stmt.name)
+        return "Table created"
+    if isinstance(stmt, sql.CreateIndex):
+        db.create_index(stmt.table, stmt.name, stmt.column, stmt.kind)
+        db.save(stmt.table)
+        return "Index created"
+    if isinstance(stmt, sql.DropIndex):
+        db.save(db.drop_index(stmt.name))
+        return "Index dropped"
+    if isinstance(stmt, sql.DropTable):
+        db.drop_table(stmt.name)
+        return "Table dropped"
+    if isinstance(stmt, sql.Begin):
+        db.begin()
+        return "Transaction started"
+    if isinstance(stmt, sql.Commit):
+        db.commit()
+        return "Transaction committed"
+    if isinstance(stmt, sql.Rollback):
+        db.rollback()
+        return "Transaction rolled back"
+    if isinstance(stmt, sql.Copy):
+        count = db.copy_from(stmt.table, stmt.path, stmt.format, stmt.header)
+        return f"{count} row(s) loaded"
+    raise ValueError("Unknown command")
@@ -1,95 +1,498 @@
-#SQL Like Query Parser (minimal, safer)
+#SQL Like Query Parser
+#
+# tokenize() splits a statement into tokens, Parser builds an AST of the
+# statement nodes below, and parse() caches the ASTs of recently seen
+# statements. Values are kept as typed in the statement: quoted strings,
+# numbers and bare words alike are strings, NULL is None; tables coerce them
+# to the types of typed columns. A `?` placeholder is a Param
+# that parse(sql, params) replaces with the matching parameter.
+#
+# WHERE clauses use the Table where format: (col, op, value) comparisons,
+# combined as ("AND", ...), ("OR", ...) and ("NOT", clause).
 
-def _strip_quotes(s):
-    s = s.strip()
-    if (s.startswith('"') and s.endswith('"')) or (s.startswith("'") and s.endswith("'")):
-        return s[1:-1]
-    return s
+import re
+import threading
+from collections import OrderedDict, namedtuple
 
+import datatypes
 
-def parse(sql):
-    s = sql.strip()
-    if not s:
-        raise ValueError("Empty query")
-    up = s.upper()
+COMPARE_OPS = ("=", "!=", "<", "<=", ">", ">=")
+AGGREGATES = ("COUNT", "SUM", "AVG", "MIN", "MAX")
 
-    # CREATE TABLE name (col1, col2)
-    if up.startswith("CREATE TABLE"):
-        try:
-            rest = s[len("CREATE TABLE"):].strip()
-            name, cols_part = rest.split("(", 1)
-            name = name.strip()
-            cols = cols_part.rsplit(")", 1)[0]
-            cols_list = [c.strip() for c in cols.split(",") if c.strip()]
-            if not name or not cols_list:
-                raise ValueError
-            return ("CREATE", name, cols_list)
-        except Exception:
-            raise ValueError("Invalid CREATE syntax. Use: CREATE TABLE name (col1, col2)")
-
-    # INSERT INTO name VALUES (v1, v2)
-    if up.startswith("INSERT INTO"):
-        try:
-            rest = s[len("INSERT INTO"):].strip()
-            name_part, vals_part = rest.split("VALUES", 1)
-            name = name_part.strip()
-            vals = vals_part.strip()
-            if not vals.startswith("(") or not vals.endswith(")"):
-                raise ValueError
-            vals_content = vals[1:-1]
-            vals_list = [ _strip_quotes(v.strip()) for v in vals_content.split(",") ]
-            return ("INSERT", name, vals_list)
-        except Exception:
-            raise ValueError("Invalid INSERT syntax. Use: INSERT INTO name VALUES (v1, v2)")
-
-    # SELECT * FROM name [WHERE col = val]
-    if up.startswith("SELECT"):
-        try:
-            # support: SELECT * FROM name WHERE col = val
-            parts = s.split()
-            if len(parts) < 4 or parts[1] != '*':
-                raise ValueError
-            if parts[2].upper() != 'FROM':
-                raise ValueError
-            name = parts[3]
-            if 'WHERE' in (p.upper() for p in parts):
-                where_idx = next(i for i, p in enumerate(parts) if p.upper() == 'WHERE')
-                # simple: WHERE col = val
-                if len(parts) <= where_idx + 3 or parts[where_idx + 2] != '=':
-                    raise ValueError
-                col = parts[where_idx + 1]
-                val = _strip_quotes(parts[where_idx + 3] if parts[where_idx + 3] != ';' else parts[where_idx + 4]) if len(parts) > where_idx + 3 else ''
-                return ("SELECT", name, (col, _strip_quotes(val)))
-            return ("SELECT", name)
-        except Exception:
-            raise ValueError("Invalid SELECT syntax. Use: SELECT * FROM name [WHERE col = value]")
-
-    # DELETE FROM name WHERE col = val
-    if up.startswith("DELETE FROM"):
-        try:
-            rest = s[len("DELETE FROM"):].strip()
-            if 'WHERE' not in rest.upper():
-                raise ValueError
-            name_part, where_part = rest.split('WHERE', 1)
-            name = name_part.strip()
-            where_tokens = where_part.strip().split()
-            if len(where_tokens) < 3 or where_tokens[1] != '=':
-                raise ValueError
-            col = where_tokens[0]
-            val = _strip_quotes(where_tokens[2])
-            return ("DELETE", name, (col, val))
-        except Exception:
-            raise ValueError("Invalid DELETE syntax. Use: DELETE FROM name WHERE col = value")
-
-    # DROP TABLE name
-    if up.startswith("DROP TABLE"):
+KEYWORDS = {
+    "CREATE", "TABLE", "INDEX", "ON", "USING", "HASH", "SORTED", "INSERT", "INTO", "VALUES", "SELECT", "FROM",
+    "WHERE", "AND", "OR", "NOT", "BETWEEN", "IS", "NULL", "ORDER", "BY", "ASC", "DESC", "LIMIT", "OFFSET",
+    "DELETE", "DROP", "EXPLAIN", "JOIN", "INNER", "LEFT", "OUTER", "AS",
+    "GROUP", "HAVING", "BEGIN", "TRANSACTION", "COMMIT", "ROLLBACK", "COPY", "LOAD",
+}
+
+# types: (column, type) pairs of the typed columns
+CreateTable = namedtuple("CreateTable", "name columns types", defaults=((),))
+CreateIndex = namedtuple("CreateIndex", "name table column kind", defaults=("hash",))
+DropIndex = namedtuple("DropIndex", "name")
+DropTable = namedtuple("DropTable", "name")
+Insert = namedtuple("Insert", "table values")
+# columns: None for *, else a tuple of column names and Call nodes;
+# column names may be qualified as table.col or alias.col. order_by and
+# the left side of HAVING comparisons may be Call nodes too.
+Select = namedtuple("Select", "table where order_by descending limit offset columns alias joins group_by having",
+                    defaults=(None, None, False, None, 0, None, None, (), (), None))
+# kind is "inner" or "left"; left / right are the two sides of ON a.x = b.y
+Join = namedtuple("Join", "table alias kind left right")
+Delete = namedtuple("Delete", "table where")
+Explain = namedtuple("Explain", "statement")
+Begin = namedtuple("Begin", "")
+Commit = namedtuple("Commit", "")
+Rollback = namedtuple("Rollback", "")
+# bulk load of a file; format is "csv" or "jsonl"
+Copy = namedtuple("Copy", "table path format header", defaults=("csv", False))
+# an aggregate in a select list; column is None for COUNT(*)
+Call = namedtuple("Call", "func column")
+# count: the parameter is a LIMIT or OFFSET, checked when it is bound
+Param = namedtuple("Param", "index count", defaults=(False,))
+
+USAGE = {
+    "CREATE TABLE": "CREATE TABLE name (col1 [INTEGER|REAL|TEXT|BOOLEAN|TIMESTAMP], col2 [type], ...)",
+    "CREATE INDEX": "CREATE INDEX idx ON name (col) [USING HASH|SORTED]",
+    "INSERT": "INSERT INTO name VALUES (v1, v2)",
+    "SELECT": "SELECT *|col, ...|COUNT(*), ... FROM name [alias] [[INNER|LEFT] JOIN name [alias] ON a.x = b.y] "
+              "[WHERE condition] [GROUP BY col, ... [HAVING condition]] [ORDER BY col [ASC|DESC]] [LIMIT n] [OFFSET m]",
+    "DELETE": "DELETE FROM name WHERE condition",
+    "DROP TABLE": "DROP TABLE name",
+    "DROP INDEX": "DROP INDEX idx",
+    "EXPLAIN": "EXPLAIN SELECT ...",
+    "BEGIN": "BEGIN [TRANSACTION]",
+    "COMMIT": "COMMIT [TRANSACTION]",
+    "ROLLBACK": "ROLLBACK [TRANSACTION]",
+    "COPY": "COPY name FROM 'file.csv' [HEADER]",
+    "LOAD": "LOAD JSONL 'file.jsonl' INTO name",
+}
+
+Token = namedtuple("Token", "kind text value")
+
+_TOKEN_RE = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<string>'(?:[^']|'')*'|"(?:[^"]|"")*")
+  | (?P<number>-?\d+(?:\.\d+)?)
+  | (?P<name>[A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)?)
+  | (?P<op><=|>=|!=|<>|[=<>])
+  | (?P<punct>[(),*;?])
+""", re.VERBOSE)
+
+
+def tokenize(sql):
+    tokens = []
+    pos = 0
+    while pos < len(sql):
+        m = _TOKEN_RE.match(sql, pos)
+        if m is None:
+            raise ValueError(f"Unexpected character {sql[pos]!r} at position {pos}")
+        pos = m.end()
+        kind, text = m.lastgroup, m.group()
+        if kind == "space":
+            continue
+        if kind == "string":
+            quote = text[0]
+            tokens.append(Token("string", text, text[1:-1].replace(quote * 2, quote)))
+        elif kind == "name" and text.upper() in KEYWORDS:
+            tokens.append(Token("keyword", text.upper(), text.upper()))
+        elif kind == "op":
+            op = "!=" if text == "<>" else text
+            tokens.append(Token("op", op, op))
+        else:
+            tokens.append(Token(kind, text, text))
+    return tokens
+
+
+def normalize(tokens):
+    # canonical statement text: keywords upper-cased, whitespace collapsed
+    return " ".join(t.text for t in tokens)
+
+
+class Parser:
+    """Recursive-descent parser over a token list; statement() returns one AST node."""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+        self.params = 0
+
+    def peek(self, offset=0):
+        pos = self.pos + offset
+        return self.tokens[pos] if pos < len(self.tokens) else None
+
+    def next(self):
+        tok = self.peek()
+        if tok is None:
+            raise ValueError("Unexpected end of statement")
+        self.pos += 1
+        return tok
+
+    def accept(self, *texts):
+        # consume the next token if it is one of the given keywords / symbols
+        tok = self.peek()
+        if tok is not None and tok.kind != "string" and tok.text in texts:
+            self.pos += 1
+            return tok.text
+        return None
+
+    def expect(self, *texts):
+        found = self.accept(*texts)
+        if found is None:
+            tok = self.peek()
+            raise ValueError(f"Expected {' or '.join(texts)}, got {tok.text if tok else 'end of statement'}")
+        return found
+
+    def word(self, text):
+        # consume a bare word used as a keyword in one place only, like HEADER
+        tok = self.peek()
+        if tok is not None and tok.kind == "name" and tok.text.upper() == text:
+            self.pos += 1
+            return True
+        return False
+
+    def string(self):
+        tok = self.next()
+        if tok.kind != "string":
+            raise ValueError(f"Expected a quoted string, got {tok.text}")
+        return tok.value
+
+    def name(self):
+        tok = self.next()
+        if tok.kind != "name":
+            raise ValueError(f"Expected a name, got {tok.text}")
+        return tok.value
+
+    def names(self):
+        self.expect("(")
+        out = [self.name()]
+        while self.accept(","):
+            out.append(self.name())
+        self.expect(")")
+        return tuple(out)
+
+    def literal(self):
+        tok = self.next()
+        # bare words are values too, as in INSERT INTO t VALUES (p1, 2)
+        if tok.kind in ("string", "number", "name"):
+            return tok.value
+        if tok.text == "NULL":
+            return None
+        if tok.text == "?":
+            self.params += 1
+            return Param(self.params - 1)
+        raise ValueError(f"Expected a value, got {tok.text}")
+
+    def count(self):
+        value = self.literal()
+        if isinstance(value, Param):
+            return value._replace(count=True)
+        return to_count(value)
+
+    def statement(self):
+        tok = self.peek()
+        if tok is None:
+            raise ValueError("Empty query")
+        head = tok.text
+        if head in ("CREATE", "DROP") and self.peek(1) is not None:
+            head = f"{head} {self.peek(1).text}"
+        if head not in USAGE:
+            raise ValueError("Unsupported or invalid SQL statement")
         try:
-            name = s[len("DROP TABLE"):].strip()
-            if not name:
-                raise ValueError
-            return ("DROP", name)
-        except Exception:
-            raise ValueError("Invalid DROP syntax. Use: DROP TABLE name")
+            node = getattr(self, "parse_" + head.lower().replace(" ", "_"))()
+            self.accept(";")
+            if self.peek() is not None:
+                raise ValueError(f"Unexpected {self.peek().text}")
+        except ValueError as e:
+            raise ValueError(f"Invalid {head} syntax ({e}). Use: {USAGE[head]}")
+        return node
+
+    # create_table := CREATE TABLE name ( column [type] {, column [type]} )
+    def parse_create_table(self):
+        self.expect("CREATE")
+        self.expect("TABLE")
+        name = self.name()
+        self.expect("(")
+        columns, types = [], []
+        while True:
+            columns.append(self.name())
+            tok = self.peek()
+            if tok is not None and tok.kind == "name":
+                types.append((columns[-1], datatypes.type_name(self.name())))
+            if not self.accept(","):
+                break
+        self.expect(")")
+        return CreateTable(name, tuple(columns), tuple(types))
+
+    def parse_create_index(self):
+        self.expect("CREATE")
+        self.expect("INDEX")
+        name = self.name()
+        self.expect("ON")
+        table = self.name()
+        columns = self.names()
+        if len(columns) != 1:
+            raise ValueError("Indexes cover exactly one column")
+        if self.accept("USING"):
+            return CreateIndex(name, table, columns[0], self.expect("HASH", "SORTED").lower())
+        return CreateIndex(name, table, columns[0])
+
+    def parse_insert(self):
+        self.expect("INSERT")
+        self.expect("INTO")
+        table = self.name()
+        self.expect("VALUES")
+        self.expect("(")
+        values = [self.literal()]
+        while self.accept(","):
+            values.append(self.literal())
+        self.expect(")")
+        return Insert(table, tuple(values))
+
+    def parse_explain(self):
+        self.expect("EXPLAIN")
+        return Explain(self.parse_select())
+
+    def parse_select(self):
+        self.expect("SELECT")
+        columns = self.select_list()
+        self.expect("FROM")
+        table = self.name()
+        alias = self.alias()
+        joins = []
+        while True:
+            kind = self.accept("JOIN", "INNER", "LEFT")
+            if kind is None:
+                break
+            if kind != "JOIN":
+                if kind == "LEFT":
+                    self.accept("OUTER")
+                self.expect("JOIN")
+            joins.append(self.join(kind.lower() if kind == "LEFT" else "inner"))
+        where = self.condition() if self.accept("WHERE") else None
+        group_by, having = (), None
+        if self.accept("GROUP"):
+            self.expect("BY")
+            group_by = [self.name()]
+            while self.accept(","):
+                group_by.append(self.name())
+            group_by = tuple(group_by)
+            if self.accept("HAVING"):
+                having = self.condition()
+        order_by, descending, limit, offset = None, False, None, 0
+        if self.accept("ORDER"):
+            self.expect("BY")
+            order_by = self.select_item()
+            descending = self.accept("ASC", "DESC") == "DESC"
+        if self.accept("LIMIT"):
+            limit = self.count()
+        if self.accept("OFFSET"):
+            offset = self.count()
+        return Select(table, where, order_by, descending, limit, offset, columns, alias, tuple(joins), group_by, having)
+
+    def alias(self):
+        # [AS] name after a table name
+        tok = self.peek()
+        if self.accept("AS") or (tok is not None and tok.kind == "name"):
+            return self.name()
+        return None
+
+    # join := name [alias] ON name = name
+    def join(self, kind):
+        table = self.name()
+        alias = self.alias()
+        self.expect("ON")
+        left = self.name()
+        self.expect("=")
+        return Join(table, alias, kind, left, self.name())
+
+    # select_list := * | item {, item}
+    def select_list(self):
+        if self.accept("*"):
+            return None
+        items = [self.select_item()]
+        while self.accept(","):
+            items.append(self.select_item())
+        return tuple(items)
+
+    # item := name | AGGREGATE ( * | name )
+    def select_item(self):
+        name = self.name()
+        if name.upper() not in AGGREGATES or not self.accept("("):
+            return name
+        func = name.upper()
+        column = None if func == "COUNT" and self.accept("*") else self.name()
+        self.expect(")")
+        return Call(func, column)
+
+    def parse_delete(self):
+        self.expect("DELETE")
+        self.expect("FROM")
+        table = self.name()
+        self.expect("WHERE")
+        return Delete(table, self.condition())
+
+    def parse_drop_table(self):
+        self.expect("DROP")
+        self.expect("TABLE")
+        return DropTable(self.name())
+
+    def parse_drop_index(self):
+        self.expect("DROP")
+        self.expect("INDEX")
+        return DropIndex(self.name())
+
+    def parse_begin(self):
+        self.expect("BEGIN")
+        self.accept("TRANSACTION")
+        return Begin()
+
+    def parse_commit(self):
+        self.expect("COMMIT")
+        self.accept("TRANSACTION")
+        return Commit()
+
+    def parse_rollback(self):
+        self.expect("ROLLBACK")
+        self.accept("TRANSACTION")
+        return Rollback()
+
+    def parse_copy(self):
+        self.expect("COPY")
+        table = self.name()
+        self.expect("FROM")
+        return Copy(table, self.string(), "csv", self.word("HEADER"))
+
+    def parse_load(self):
+        self.expect("LOAD")
+        if not self.word("JSONL"):
+            raise ValueError("Expected JSONL")
+        path = self.string()
+        self.expect("INTO")
+        return Copy(self.name(), path, "jsonl")
+
+    # condition := conjunction {OR conjunction}
+    def condition(self):
+        terms = [self.conjunction()]
+        while self.accept("OR"):
+            terms.append(self.conjunction())
+        return terms[0] if len(terms) == 1 else ("OR", *terms)
+
+    # conjunction := negation {AND negation}
+    def conjunction(self):
+        terms = [self.negation()]
+        while self.accept("AND"):
+            terms.append(self.negation())
+        return terms[0] if len(terms) == 1 else ("AND", *terms)
+
+    # negation := NOT negation | ( condition ) | comparison
+    def negation(self):
+        if self.accept("NOT"):
+            return ("NOT", self.negation())
+        if self.accept("("):
+            cond = self.condition()
+            self.expect(")")
+            return cond
+        return self.comparison()
+
+    # comparison := item op value | item BETWEEN value AND value | item IS [NOT] NULL
+    def comparison(self):
+        col = self.select_item()
+        if self.accept("BETWEEN"):
+            lo = self.literal()
+            self.expect("AND")
+            return (col, "BETWEEN", (lo, self.literal()))
+        if self.accept("IS"):
+            op = "!=" if self.accept("NOT") else "="
+            self.expect("NULL")
+            return (col, op, None)
+        return (col, self.expect(*COMPARE_OPS), self.literal())
+
+
+def to_count(value):
+    # a LIMIT or OFFSET value: a non-negative int, or its digits
+    if isinstance(value, int) and not isinstance(value, bool) and value >= 0:
+        return value
+    if not isinstance(value, str) or not value.isdigit():
+        raise ValueError(f"Expected a non-negative integer, got {value!r}")
+    return int(value)
+
+
+def bind(node, params):
+    # copy of an AST with every Param replaced by its parameter
+    if isinstance(node, Param):
+        return to_count(params[node.index]) if node.count else params[node.index]
+    if isinstance(node, tuple):
+        values = [bind(v, params) for v in node]
+        return type(node)(*values) if hasattr(node, "_fields") else tuple(values)
+    return node
+
+
+class StatementCache:
+    """LRU cache of parsed statements, keyed by statement text; safe to share between threads."""
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+
+statement_cache = StatementCache()
+
+
+def parse(sql, params=None):
+    """Parse one statement, reusing the AST of an earlier identical statement.
 
-    raise ValueError("Unsupported or invalid SQL statement")
+    Statements are cached under their exact text and their normalized
+    text, so differences in case or spacing still hit. `params` fills
+    the statement's `?` placeholders, in order.
+    """
+    key = sql.strip()
+    entry = statement_cache.get(key)
+    if entry is None:
+        tokens = tokenize(key)
+        norm = normalize(tokens)
+        entry = statement_cache.get(norm)
+        statement_cache.count(hit=entry is not None)
+        if entry is None:
+            parser = Parser(tokens)
+            entry = (parser.statement(), parser.params)
+            statement_cache.put(norm, entry)
+        if key != norm:
+            statement_cache.put(key, entry)
+    else:
+        statement_cache.count(hit=True)
 
+    node, count = entry
+    params = params or ()
+    if len(params) != count:
+        raise ValueError(f"Statement takes {count} parameter(s), got {len(params)}")
+    return bind(node, params) if count else node
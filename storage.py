@@ -0,0 +1,226 @@
+#Binary table file format
+#
+# MAGIC | u32 header length | JSON header | string dictionary | row pages
+#
+# The header holds the schema and the offsets of the other sections, so the
+# catalog can be read without touching row data. Rows are stored in pages of
+# length-prefixed, type-tagged values in column order; strings that occur
+# more than once are stored once in the dictionary and referenced by number.
+
+import json, mmap, os, struct
+from collections import Counter
+from datetime import datetime
+
+import datatypes
+
+MAGIC = b"MRDB1\n"
+PAGE_ROWS = 1024
+
+T_NONE, T_ABSENT, T_STR, T_SREF, T_INT, T_FLOAT, T_TRUE, T_FALSE, T_JSON, T_TIME = range(10)
+
+_DOUBLE = struct.Struct("<d")
+_U32 = struct.Struct("<I")
+
+
+def _put_varint(out, n):
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _get_varint(buf, pos):
+    n = shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+
+def _put_bytes(out, data):
+    _put_varint(out, len(data))
+    out += data
+
+
+def _put_int(out, n):
+    # zigzag: small negative numbers stay short
+    _put_varint(out, n * 2 if n >= 0 else -n * 2 - 1)
+
+
+def _get_int(buf, pos):
+    n, pos = _get_varint(buf, pos)
+    return (-((n + 1) >> 1) if n & 1 else n >> 1), pos
+
+
+def _put_value(out, v, strings):
+    if v is None:
+        out.append(T_NONE)
+    elif v is True:
+        out.append(T_TRUE)
+    elif v is False:
+        out.append(T_FALSE)
+    elif isinstance(v, int):
+        out.append(T_INT)
+        _put_int(out, v)
+    elif isinstance(v, float):
+        out.append(T_FLOAT)
+        out += _DOUBLE.pack(v)
+    elif isinstance(v, str):
+        ref = strings.get(v)
+        if ref is None:
+            out.append(T_STR)
+            _put_bytes(out, v.encode())
+        else:
+            out.append(T_SREF)
+            _put_varint(out, ref)
+    elif isinstance(v, datetime):
+        # microseconds since the epoch
+        out.append(T_TIME)
+        _put_int(out, datatypes.to_micros(v))
+    else:
+        out.append(T_JSON)
+        _put_bytes(out, json.dumps(v).encode())
+
+
+def write_table(path, t, lsn=None, dictionary=True):
+    rows = t.rows
+    columns = t.columns
+    strings = {}
+    if dictionary:
+        counts = Counter(v for r in rows for v in r.values() if isinstance(v, str))
+        strings = {s: i for i, s in enumerate(s for s, c in counts.items() if c > 1)}
+
+    body = bytearray()
+    for s in strings:
+        _put_bytes(body, s.encode())
+    strings_size = len(body)
+
+    pages = []
+    for start in range(0, len(rows), PAGE_ROWS):
+        offset = len(body)
+        chunk = rows[start:start + PAGE_ROWS]
+        for r in chunk:
+            for c in columns:
+                if c in r:
+                    _put_value(body, r[c], strings)
+                else:
+                    body.append(T_ABSENT)
+        pages.append([offset, len(body) - offset, len(chunk)])
+
+    header = {
+        "name": t.name,
+        "columns": columns,
+        "types": t.types,
+        "primary_key": t.primary_key,
+        "unique_keys": t.unique_keys,
+        "indexes": t.index_definitions(),
+        "engine": t.engine,
+        "row_count": len(rows),
+        "strings": [0, strings_size, len(strings)],
+        "pages": pages,
+    }
+    if lsn is not None:
+        header["lsn"] = lsn
+    head = json.dumps(header).encode()
+
+    # write to a temp file and rename, so readers never see a partial file
+    # and open memory maps keep pointing at the old one
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(_U32.pack(len(head)))
+        f.write(head)
+        f.write(body)
+    os.replace(tmp, path)
+
+
+def _read_head(f):
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Invalid table file")
+    (size,) = _U32.unpack(f.read(_U32.size))
+    header = json.loads(f.read(size))
+    return header, len(MAGIC) + _U32.size + size
+
+
+def read_header(path):
+    with open(path, "rb") as f:
+        return _read_head(f)[0]
+
+
+class MappedRows:
+    """Rows of a binary table file, decoded page by page from a memory map."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.header, self.base = _read_head(f)
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.header["row_count"] else None
+        self.columns = self.header["columns"]
+        self._strings = None
+
+    def __len__(self):
+        return self.header["row_count"]
+
+    def strings(self):
+        if self._strings is None:
+            offset, size, count = self.header["strings"]
+            buf, pos = self._mm, self.base + offset
+            out = []
+            for _ in range(count):
+                n, pos = _get_varint(buf, pos)
+                out.append(buf[pos:pos + n].decode())
+                pos += n
+            self._strings = out
+        return self._strings
+
+    def page(self, i):
+        offset, size, count = self.header["pages"][i]
+        buf = self._mm
+        strings = self.strings()
+        columns = self.columns
+        pos = self.base + offset
+        rows = []
+        for _ in range(count):
+            row = {}
+            for c in columns:
+                tag = buf[pos]
+                pos += 1
+                if tag == T_SREF:
+                    ref, pos = _get_varint(buf, pos)
+                    row[c] = strings[ref]
+                elif tag == T_STR:
+                    n, pos = _get_varint(buf, pos)
+                    row[c] = buf[pos:pos + n].decode()
+                    pos += n
+                elif tag == T_INT:
+                    row[c], pos = _get_int(buf, pos)
+                elif tag == T_NONE:
+                    row[c] = None
+                elif tag == T_FLOAT:
+                    row[c] = _DOUBLE.unpack_from(buf, pos)[0]
+                    pos += _DOUBLE.size
+                elif tag == T_TRUE:
+                    row[c] = True
+                elif tag == T_FALSE:
+                    row[c] = False
+                elif tag == T_TIME:
+                    n, pos = _get_int(buf, pos)
+                    row[c] = datatypes.from_micros(n)
+                elif tag == T_JSON:
+                    n, pos = _get_varint(buf, pos)
+                    row[c] = json.loads(buf[pos:pos + n])
+                    pos += n
+                # T_ABSENT: column missing from this row
+            rows.append(row)
+        return rows
+
+    def __iter__(self):
+        for i in range(len(self.header["pages"])):
+            yield from self.page(i)
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
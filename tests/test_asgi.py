@@ -0,0 +1,100 @@
+import sys
+import json
+import asyncio
+import pathlib
+
+# ensure project root on path
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import db as db_mod
+from aiodb import AsyncDatabase
+
+
+def test_async_writes_share_one_flush(tmp_path):
+    adb = AsyncDatabase(base_dir=str(tmp_path), wal=True)
+    adb.db.create_table("t", ["id", "v"], pk="id", types={"id": "INTEGER"})
+
+    async def main():
+        writes = [adb.write("t", lambda t, i=i: t.insert({"id": i, "v": f"x{i}"})) for i in range(20)]
+        # a duplicate key fails alone
+        writes.append(adb.write("t", lambda t: t.insert({"id": 0, "v": "dup"})))
+        results = await asyncio.gather(*writes, return_exceptions=True)
+        assert isinstance(results[-1], ValueError)
+        assert not any(isinstance(r, Exception) for r in results[:-1])
+        return await adb.select("t", ("id", ">=", 10))
+
+    try:
+        assert len(asyncio.run(main())) == 10
+        assert adb.writes == 21 and adb.flushes == 1
+    finally:
+        adb.close()
+
+    d = db_mod.Database(base_dir=str(tmp_path))
+    d.load("t")
+    assert d.tables["t"].row_count() == 20
+    assert d.tables["t"].select(("id", 0))[0]["v"] == "x0"
+
+
+def call(app, method, path, body=b"", query=b"", content_type=b"application/json"):
+    # one request through the ASGI app: (status, headers, body)
+    messages = []
+    pending = [{"type": "http.request", "body": body}]
+
+    async def receive():
+        return pending.pop(0)
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": method, "path": path, "query_string": query,
+             "headers": [(b"content-type", content_type), (b"content-length", str(len(body)).encode())]}
+    asyncio.run(app(scope, receive, send))
+    start = messages[0]
+    return start["status"], dict(start["headers"]), b"".join(m.get("body", b"") for m in messages[1:])
+
+
+def test_asgi_app(tmp_path, monkeypatch):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    monkeypatch.setattr(db_mod, 'DATA_DIR', str(data_dir))
+    sys.modules.pop('webapp', None)
+    sys.modules.pop('asgi', None)
+    import asgi
+
+    # form posts and pages go through the Flask app
+    form = b"application/x-www-form-urlencoded"
+    assert call(asgi.app, "POST", "/databases", b"dbname=shop", content_type=form)[0] in (302, 303)
+    status, _, _ = call(asgi.app, "POST", "/db/shop/tables/create", b"tname=p&cols=id+INTEGER%2C+name&pk=id", content_type=form)
+    assert status in (302, 303)
+
+    url = "/api/db/shop/tables/p/rows"
+    status, _, body = call(asgi.app, "POST", url, json.dumps([{"id": 1, "name": "a"}, {"id": 2, "name": "b"}]).encode())
+    assert status == 201 and json.loads(body) == {"inserted": 2}
+    status, _, body = call(asgi.app, "PATCH", url, json.dumps([{"id": 2, "name": "x"}, {"id": 3, "name": "y"}]).encode())
+    assert status == 200 and json.loads(body) == {"updated": 1}
+    status, _, body = call(asgi.app, "DELETE", url, b"[1, 2, 1]")
+    assert json.loads(body) == {"deleted": 2}
+    status, _, body = call(asgi.app, "POST", url, b'[{"id": "one", "name": "c"}]')
+    assert status == 400 and "Invalid INTEGER" in json.loads(body)["error"]
+    assert call(asgi.app, "POST", "/api/db/shop/tables/nope/rows", b"[]")[0] == 404
+
+    call(asgi.app, "POST", url, b'[{"id": 7, "name": "seven"}]')
+    status, headers, body = call(asgi.app, "GET", url, query=b"name=seven")
+    assert status == 200 and headers[b"content-type"] == b"application/json"
+    assert json.loads(body)["rows"] == [{"id": 7, "name": "seven"}]
+    status, _, body = call(asgi.app, "GET", "/db/shop/tables/p")
+    assert status == 200 and b"seven" in body
+
+    # shutdown waits for both pools off the event loop
+    messages = []
+    pending = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+
+    async def receive():
+        return pending.pop(0)
+
+    async def send(message):
+        messages.append(message["type"])
+
+    asyncio.run(asgi.app({"type": "lifespan"}, receive, send))
+    assert messages == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
+    assert asgi.executor._shutdown and asgi.stream_executor._shutdown
@@ -65,3 +65,56 @@ def test_database_and_table_crud(tmp_path, monkeypatch):
     assert rv.status_code in (302, 303)
     rv = client.get('/databases')
     assert 'shop' not in rv.get_data(as_text=True)
+
+
+def test_json_rows_api(tmp_path, monkeypatch):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    monkeypatch.setattr(db_mod, 'DATA_DIR', str(data_dir))
+    sys.modules.pop('webapp', None)
+    import webapp
+
+    client = webapp.app.test_client()
+    client.post('/databases', data={'dbname': 'shop'})
+    client.post('/db/shop/tables/create', data={'tname': 'products', 'cols': 'id INTEGER, name, price REAL', 'pk': 'id'})
+    url = '/api/db/shop/tables/products/rows'
+
+    rows = [{'id': i, 'name': f'item{i}', 'price': i * 10} for i in range(1, 6)]
+    rv = client.post(url, json=rows)
+    assert rv.status_code == 201 and rv.get_json() == {'inserted': 5}
+
+    # one bad row inserts nothing
+    rv = client.post(url, json=[{'id': 6, 'name': 'x', 'price': 1}, {'id': 1, 'name': 'dup', 'price': 1}])
+    assert rv.status_code == 400 and 'Duplicate primary key' in rv.get_json()['error']
+
+    body = client.get(url + '?limit=2').get_json()
+    assert [r['id'] for r in body['rows']] == [1, 2] and body['count'] == 2
+    body = client.get(body['next']).get_json()
+    assert [r['id'] for r in body['rows']] == [3, 4]
+
+    # filters: a column value, a JSON where clause, and keyset paging
+    assert client.get(url + '?name=item3&columns=id').get_json()['rows'] == [{'id': 3}]
+    body = client.get(url + '?where=["price", ">=", "30"]&order_by=price&desc=1').get_json()
+    assert [r['id'] for r in body['rows']] == [5, 4, 3]
+    body = client.get(url + '?after=3&limit=1').get_json()
+    assert [r['id'] for r in body['rows']] == [4] and 'after=4' in body['next']
+    assert client.get(url + '?nosuch=1').status_code == 400
+    # so do unknown columns to order by or in a where clause, on either read path
+    for query in ('?order_by=nosuch', '?where=["nosuch", 1]', '?where=["nosuch", 1]&order_by=id', '?after=1&order_by=nosuch'):
+        rv = client.get(url + query)
+        assert rv.status_code == 400 and 'nosuch' in rv.get_json()['error']
+
+    rv = client.patch(url, json=[{'id': 1, 'price': '15'}, {'id': 2, 'name': 'two'}])
+    assert rv.get_json() == {'updated': 2}
+    # a bad update rolls back the whole batch
+    rv = client.patch(url, json=[{'id': 3, 'name': 'three'}, {'id': 4, 'price': 'abc'}])
+    assert rv.status_code == 400
+    assert client.get(url + '?id=3').get_json()['rows'][0]['name'] == 'item3'
+
+    assert client.delete(url, json=[1, {'id': 2}, 99]).get_json() == {'deleted': 2}
+
+    # the batches were saved
+    d = db_mod.Database()
+    d.load('products', base_dir=str(data_dir / 'shop'))
+    assert [r['id'] for r in d.tables['products'].select(order_by='id')] == [3, 4, 5]
+    assert d.tables['products'].select(('id', 3))[0]['price'] == 30.0
@@ -1,7 +1,9 @@
+import json
 import os
 import importlib
 import sys
 import pathlib
+from datetime import datetime
 
 # ensure project root is on sys.path so test runner can import local modules
 sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
@@ -104,3 +106,788 @@ def test_create_table_if_not_exists(tmp_path):
         db.create_table("u", ["id"], pk="id")
     # with flag should be OK
     db.create_table("u", ["id"], pk="id", if_not_exists=True)
+
+
+def test_key_indexes_follow_mutations(tmp_path):
+    db = setup_db(tmp_path)
+    db.create_table("users", ["id", "name", "email"], pk="id", uniques=["email"])
+    t = db.tables["users"]
+    assert set(t.indexes) == {"users_pkey", "users_email_key"}
+
+    t.insert({"id": "1", "name": "A", "email": "a@example.com"})
+    t.insert({"id": "2", "name": "B", "email": "b@example.com"})
+
+    # old key values are released on update and delete
+    t.update(("id", "1"), {"email": "c@example.com"})
+    t.insert({"id": "3", "name": "C", "email": "a@example.com"})
+    t.delete(("id", "2"))
+    t.insert({"id": "2", "name": "B2", "email": "b@example.com"})
+    with pytest.raises(ValueError):
+        t.insert({"id": "4", "name": "D", "email": "c@example.com"})
+
+    # unhashable key values are refused before anything changes, and match nothing
+    with pytest.raises(ValueError, match="indexed column id"):
+        t.insert({"id": ["5"], "name": "E", "email": "e@example.com"})
+    with pytest.raises(ValueError, match="Record 2"):
+        t.bulk_insert([{"id": "5", "name": "E", "email": "e@example.com"}, {"id": "6", "name": "F", "email": {"x": 1}}])
+    with pytest.raises(ValueError):
+        t.update(("id", "1"), {"email": ["e"]})
+    assert t.select(("id", ["1"])) == [] and len(t.rows) == 3
+    t.insert({"id": "7", "name": ["a", "list"], "email": "f@example.com"})
+    with pytest.raises(ValueError):
+        t.create_index("users_name", "name")
+    assert "users_name" not in t.indexes
+
+    # indexes are rebuilt on load
+    db.save("users")
+    db2 = Database()
+    db2.load("users")
+    with pytest.raises(ValueError):
+        db2.tables["users"].insert({"id": "3", "name": "X", "email": "x@example.com"})
+
+
+def test_secondary_index(tmp_path):
+    db = setup_db(tmp_path)
+    db.create_table("items", ["id", "color"], pk="id")
+    t = db.tables["items"]
+    t.insert({"id": "1", "color": "red"})
+    t.insert({"id": "2", "color": "blue"})
+    db.create_index("items", "items_color", "color")
+    t.insert({"id": "3", "color": "red"})
+
+    assert sorted(r["id"] for r in t.select(("color", "red"))) == ["1", "3"]
+    assert t.update(("color", "red"), {"color": "green"}) == 2
+    assert t.select(("color", "red")) == []
+    t.delete(("color", "green"))
+    assert t.select() == [{"id": "2", "color": "blue"}]
+
+    # index definitions survive save / load
+    db.save("items")
+    db2 = Database()
+    db2.load("items")
+    assert "items_color" in db2.tables["items"].indexes
+    assert db2.tables["items"].select(("color", "blue")) == [{"id": "2", "color": "blue"}]
+
+    assert db2.drop_index("items_color") == "items"
+    with pytest.raises(ValueError):
+        db2.drop_index("items_pkey")
+
+
+def test_sorted_index_ranges_and_order(tmp_path):
+    db = setup_db(tmp_path)
+    db.create_table("events", ["id", "ts"], pk="id")
+    t = db.tables["events"]
+    for i, ts in enumerate([30, 10, 50, 20, 40]):
+        t.insert({"id": str(i), "ts": ts})
+
+    # same answers with and without the ordered index
+    scans = [
+        t.select(("ts", ">", 20)),
+        t.select(("ts", "BETWEEN", (20, 40))),
+        t.select(order_by="ts", limit=2),
+        t.select(("ts", "<=", 30), order_by="ts", descending=True),
+    ]
+    t.create_index("events_ts", "ts", "sorted")
+    assert [r["ts"] for r in t.select(("ts", ">", 20))] == [30, 40, 50]
+    assert [r["ts"] for r in t.select(("ts", "BETWEEN", (20, 40)))] == [20, 30, 40]
+    assert [r["ts"] for r in t.select(order_by="ts", limit=2)] == [10, 20]
+    assert [r["ts"] for r in t.select(("ts", "<=", 30), order_by="ts", descending=True)] == [30, 20, 10]
+    assert sorted(map(str, scans[0])) == sorted(map(str, t.select(("ts", ">", 20))))
+    assert scans[2:] == [t.select(order_by="ts", limit=2), t.select(("ts", "<=", 30), order_by="ts", descending=True)]
+
+    # the index follows updates and deletes
+    t.update(("id", "1"), {"ts": 60})
+    t.delete(("ts", 50))
+    assert [r["ts"] for r in t.select(order_by="ts")] == [20, 30, 40, 60]
+
+    # bulk loads merge into the index in one sort, small ones insert in place
+    t.bulk_insert([{"id": f"b{i}", "ts": ts} for i, ts in enumerate([25, 5, 40, 70, 25, 1, 33, 8, 90])])
+    t.bulk_insert([{"id": "c", "ts": 35}])
+    idx = t.indexes["events_ts"]
+    assert [r["ts"] for r in t.select(order_by="ts")] == [1, 5, 8, 20, 25, 25, 30, 33, 35, 40, 40, 60, 70, 90]
+    assert idx.keys == sorted(idx.keys) and idx.distinct() == 12
+
+    with pytest.raises(ValueError):
+        t.select(("ts", "LIKE", 1))
+
+
+def test_scan_pages(tmp_path):
+    db = setup_db(tmp_path)
+    db.create_table("items", ["id"], pk="id")
+    t = db.tables["items"]
+    for i in range(10):
+        t.insert({"id": i})
+
+    assert [r["id"] for r in t.scan(3, 4)] == [3, 4, 5, 6]
+    assert [r["id"] for r in t.scan(8)] == [8, 9]
+    assert [r["id"] for r in t.scan(after=6, limit=2)] == [7, 8]
+    assert [r["id"] for r in t.select(order_by="id", descending=True, limit=3, offset=2)] == [7, 6, 5]
+    t.create_index("items_id", "id", "sorted")
+    assert [r["id"] for r in t.scan(after=6, limit=2)] == [7, 8]
+    assert [r["id"] for r in t.select(order_by="id", descending=True, limit=3, offset=2)] == [7, 6, 5]
+
+
+def test_wal_replay_and_checkpoint(tmp_path):
+    setup_db(tmp_path)
+    db = Database(wal=True)
+    db.create_table("users", ["id", "name", "email"], pk="id", uniques=["email"])
+    db.save("users")
+    snapshot = (tmp_path / "data" / "users.json").read_text()
+
+    t = db.tables["users"]
+    t.insert({"id": "1", "name": "A", "email": "a@example.com"})
+    t.insert({"id": "2", "name": "B", "email": "b@example.com"})
+    t.insert({"id": "3", "name": "C", "email": "c@example.com"})
+    db.save("users")
+    t.update(("id", "2"), {"name": "B2"})
+    t.delete(("id", "3"))
+    db.save("users")
+
+    # mutations went to the log, the snapshot was not rewritten
+    assert (tmp_path / "data" / "users.json").read_text() == snapshot
+    assert (tmp_path / "data" / "_wal.log").exists()
+
+    # schema changes do rewrite it
+    db.create_index("users", "users_name", "name")
+    db.save("users")
+    assert (tmp_path / "data" / "users.json").read_text() != snapshot
+
+    db2 = Database()
+    db2.load("users")
+    assert db2.tables["users"].rows == t.rows
+    assert "users_name" in db2.tables["users"].indexes
+
+    db.checkpoint()
+    db.close()
+    db3 = Database()
+    db3.load("users")
+    assert db3.tables["users"].rows == t.rows
+    assert len((tmp_path / "data" / "_wal.log").read_text().splitlines()) == 1
+
+    # a snapshot written after recreating a table hides older log entries
+    db.create_table("tmp", ["id"], pk="id")
+    db.save("tmp")
+    db.tables["tmp"].insert({"id": "1"})
+    db.save("tmp")
+    db.drop_table("tmp")
+    db.create_table("tmp", ["id"], pk="id")
+    db.save("tmp")
+    db.load("tmp")
+    assert db.tables["tmp"].rows == []
+
+
+def test_binary_storage_and_migration(tmp_path):
+    setup_db(tmp_path)
+    db = Database()
+    db.create_table("items", ["id", "color", "qty", "meta"], pk="id")
+    t = db.tables["items"]
+    for i in range(3000):
+        t.insert({"id": str(i), "color": ["red", "blue"][i % 2], "qty": i - 5, "meta": None if i % 3 else {"n": i}})
+    t.insert({"id": "x", "color": "é", "qty": 1.5, "meta": True})
+    db.create_index("items", "items_color", "color")
+    db.save("items")
+
+    # a JSON table is migrated on load by a binary database
+    bdb = Database(storage="binary")
+    bdb.load("items")
+    assert not (tmp_path / "data" / "items.json").exists()
+    assert (tmp_path / "data" / "items.tbl").stat().st_size < len(json.dumps(t.rows))
+
+    # the binary file loads lazily: header first, rows on first use
+    bdb2 = Database(storage="binary")
+    bdb2.load("items")
+    t2 = bdb2.tables["items"]
+    assert t2._source is not None and t2.row_count() == 3001
+    assert t2.select(("id", "7")) == [{"id": "7", "color": "blue", "qty": 2, "meta": None}]
+    assert t2.rows == t.rows
+    assert len(t2.select(("color", "red"))) == 1500
+    with pytest.raises(ValueError):
+        t2.insert({"id": "x", "color": "c", "qty": 0, "meta": None})
+
+    # and back to JSON
+    db.load("items")
+    assert db.tables["items"].rows == t.rows
+    assert (tmp_path / "data" / "items.json").exists()
+    assert not (tmp_path / "data" / "items.tbl").exists()
+
+
+def test_open_catalogs_tables_and_loads_on_demand(tmp_path):
+    setup_db(tmp_path)
+    db = Database()
+    for name in ("a", "b", "c"):
+        db.create_table(name, ["id", "v"], pk="id")
+        for i in range(200):
+            db.tables[name].insert({"id": str(i), "v": name * 50})
+        db.save(name)
+    db.create_index("b", "b_v", "v")
+    db.save("b")
+
+    db2 = Database(memory_budget=1)
+    db2.open()
+    assert sorted(db2.tables) == ["a", "b", "c"]
+    assert db2.tables.loaded() == []
+    assert db2.schema("b")["row_count"] == 200
+    assert db2.index_owner("b_v") == "b"
+
+    # first access loads the table; a tiny budget evicts the colder clean one
+    assert len(db2.tables["a"].select(("id", "1"))) == 1
+    db2.tables["b"]
+    assert [n for n, _ in db2.tables.loaded()] == ["b"]
+
+    # dirty tables are kept until saved
+    db2.tables["b"].insert({"id": "x", "v": "new"})
+    db2.tables["c"]
+    assert [n for n, _ in db2.tables.loaded()] == ["b", "c"]
+    db2.save("b")
+    db2.tables["a"]
+    assert [n for n, _ in db2.tables.loaded()] == ["a"]
+    assert len(db2.tables["b"].rows) == 201
+
+    # so are clean tables in the open transaction, until it ends
+    db2.begin()
+    db2.tables["a"]
+    db2.tables["c"]
+    joined = db2.tables.loaded()
+    assert [n for n, _ in joined] == ["b", "a", "c"]
+    db2.commit()
+    assert all(t._tx_owner is None for _, t in joined)
+
+    # a directory without a catalog is parsed once, then opens lazily
+    (tmp_path / "data" / "_catalog.json").unlink()
+    db3 = Database()
+    db3.open()
+    assert sorted(n for n, _ in db3.tables.loaded()) == ["a", "b", "c"]
+    db4 = Database()
+    db4.open()
+    assert db4.tables.loaded() == [] and db4.schema("b")["row_count"] == 201
+
+
+def test_refresh_skips_unchanged_tables(tmp_path):
+    setup_db(tmp_path)
+    db = Database(wal=True)
+    db.create_table("a", ["id"], pk="id")
+    db.create_table("b", ["id"], pk="id")
+    db.save("a")
+    db.save("b")
+    a = db.tables["a"]
+
+    assert db.refresh("a") is a
+    # our own writes, to this or another table's log, don't force a reload
+    a.insert({"id": "1"})
+    db.save("a")
+    db.tables["b"].insert({"id": "1"})
+    db.save("b")
+    assert db.refresh("a") is a
+    assert db.reloads_avoided == 2
+
+    # a change made by someone else does
+    other = Database(wal=True)
+    other.load("a")
+    other.tables["a"].insert({"id": "2"})
+    other.save("a")
+    other.close()
+    fresh = db.refresh("a")
+    assert fresh is not a
+    assert [r["id"] for r in fresh.rows] == ["1", "2"]
+    assert db.reloads_avoided == 2
+
+
+def test_columnar_engine_matches_row_store(tmp_path):
+    db = setup_db(tmp_path)
+    for name, engine in (("r", "row"), ("c", "columnar")):
+        db.create_table(name, ["id", "color", "qty"], pk="id", engine=engine)
+        t = db.tables[name]
+        for i in range(3000):
+            t.insert({"id": i, "color": ["red", "green", None][i % 3], "qty": str(i % 7)})
+        t.update(("color", "green"), {"qty": 1.5})
+        t.delete(("qty", "3"))
+        t.create_index(f"{name}_qty", "qty", "sorted")
+        with pytest.raises(ValueError):
+            t.insert({"id": 5, "color": "x", "qty": "0"})
+        with pytest.raises(ValueError):
+            t.update(("id", 6), {"id": 7})
+
+    r, c = db.tables["r"], db.tables["c"]
+    assert c.rows == r.rows
+    for where in (("color", "red"), ("color", None), ("qty", ">", "4"), ("id", "BETWEEN", (10, 20)), ("color", "blue")):
+        assert c.select(where) == r.select(where)
+    assert c.select(order_by="qty", descending=True, limit=5) == r.select(order_by="qty", descending=True, limit=5)
+    assert list(c.scan(100, 5)) == list(r.scan(100, 5))
+    assert c.row_count() == r.row_count()
+    assert c.memory_estimate() * 3 < r.memory_estimate()
+    # unknown columns are refused alike
+    for t in (r, c):
+        for query in (lambda: t.select(("nosuch", 1)), lambda: t.select(order_by="nosuch"),
+                      lambda: t.aggregate("COUNT", where=("OR", ("id", 1), ("nosuch", 1))), lambda: t.delete(("nosuch", 1))):
+            with pytest.raises(ValueError, match="nosuch"):
+                query()
+
+    # enough deletes compact the columns; results stay the same
+    c.delete(("color", "red"))
+    r.delete(("color", "red"))
+    c.delete(("color", None))
+    r.delete(("color", None))
+    assert c.select(("id", 1)) == r.select(("id", 1))
+    assert c.rows == r.rows
+
+    db.save("c")
+    db2 = Database()
+    db2.load("c")
+    assert db2.tables["c"].engine == "columnar"
+    assert db2.tables["c"].rows == r.rows
+
+
+def test_compound_where_and_aggregates_with_and_without_numpy(tmp_path, monkeypatch):
+    import vector
+
+    db = setup_db(tmp_path)
+    for name, engine in (("r", "row"), ("c", "columnar")):
+        db.create_table(name, ["id", "city", "price"], pk="id", engine=engine)
+        t = db.tables[name]
+        for i in range(2000):
+            t.insert({"id": i, "city": ["oslo", "rome", None][i % 3], "price": None if i % 10 == 0 else i % 50 + 0.5})
+        t.delete(("id", "<", 100))
+
+    wheres = [
+        ("AND", ("city", "rome"), ("price", ">", 20)),
+        ("OR", ("city", None), ("price", "BETWEEN", (1, 3))),
+        ("NOT", ("AND", ("city", "!=", "oslo"), ("id", ">=", 1500))),
+        ("price", "<", "x"),
+    ]
+    aggregates = [("COUNT", None), ("COUNT", "price"), ("SUM", "price"), ("AVG", "price"), ("MIN", "city"),
+                  ("MAX", "price")]
+
+    def results(t):
+        found = [sorted(r["id"] for r in t.select(w)) for w in wheres]
+        totals = [t.aggregate(f, c, w) for f, c in aggregates for w in (None, wheres[0])]
+        return found, totals
+
+    expected = results(db.tables["r"])
+    assert expected[0][0] == [i for i in range(100, 2000) if i % 3 == 1 and i % 10 and i % 50 + 0.5 > 20]
+    assert results(db.tables["c"]) == expected
+    if vector.np is not None:
+        # after a write, column arrays are rebuilt by the second query, not the first
+        c = db.tables["c"]
+        c.insert({"id": 5000, "city": "rome", "price": 1.5})
+        c.delete(("id", 5000))
+        first = list(c.full_scan(("price", "<", 2)))
+        assert c._vectors == {}
+        assert list(c.full_scan(("price", "<", 2))) == first
+        assert set(c._vectors) == {"price"}
+    monkeypatch.setattr(vector, "np", None)
+    for name in ("r", "c"):
+        found, totals = results(db.tables[name])
+        assert found == expected[0]
+        assert totals == pytest.approx(expected[1])
+
+    t = db.tables["r"]
+    assert t.aggregate("sum", "price", ("id", -1)) is None
+    t.update(("AND", ("city", "oslo"), ("id", "<", 110)), {"price": 0})
+    assert t.aggregate("MAX", "price", ("AND", ("city", "oslo"), ("id", "<", 110))) == 0
+    with pytest.raises(ValueError):
+        t.aggregate("SUM", "city")
+    with pytest.raises(ValueError):
+        t.aggregate("MEDIAN", "price")
+    with pytest.raises(ValueError):
+        t.select(("NOT", ("id", 1), ("id", 2)))
+
+
+def test_iter_select_yields_lazy_read_only_views(tmp_path):
+    db = setup_db(tmp_path)
+    for name, engine in (("r", "row"), ("c", "columnar")):
+        db.create_table(name, ["id", "name", "age"], pk="id", engine=engine)
+        t = db.tables[name]
+        for i in range(50):
+            t.insert({"id": i, "name": f"n{i}", "age": i % 5})
+
+        it = t.iter_select(("age", 2), ["id", "name"])
+        first = next(it)
+        assert first == {"id": 2, "name": "n2"}
+        assert list(first) == ["id", "name"]
+        with pytest.raises(TypeError):
+            first["name"] = "x"
+        with pytest.raises(KeyError):
+            first["age"]
+        assert [r["id"] for r in it] == list(range(7, 50, 5))
+
+        views = t.iter_select(("AND", ("age", ">", 2), ("id", "<", 20)), order_by="id", descending=True, limit=3)
+        assert [dict(r) for r in views] == [dict(r) for r in t.select(("AND", ("age", ">", 2), ("id", "<", 20)),
+                                                                      order_by="id", descending=True, limit=3)]
+        assert len(list(t.iter_select(limit=10, offset=45))) == 5
+        with pytest.raises(ValueError):
+            t.iter_select(columns=["missing"])
+        with pytest.raises(ValueError):
+            t.iter_select(("NOT", ("id", 1), ("id", 2)))
+    assert t.select(("id", 2)) == [{"id": 2, "name": "n2", "age": 2}]
+
+
+def test_transactions_are_atomic_and_save_once(tmp_path, monkeypatch):
+    db = setup_db(tmp_path)
+    for name, engine in (("r", "row"), ("c", "columnar")):
+        db.create_table(name, ["id", "email", "n"], pk="id", uniques=["email"], engine=engine)
+        t = db.tables[name]
+        for i in range(2000):
+            t.insert({"id": i, "email": f"e{i}", "n": i % 4})
+        t.create_index(f"{name}_n", "n", "sorted")
+        db.save(name)
+        before = t.select()
+
+        # a failing update leaves no row changed
+        with pytest.raises(ValueError):
+            t.update(("id", "<", 3), {"email": "e1"})
+        assert t.select() == before
+
+        with pytest.raises(RuntimeError):
+            with db.transaction():
+                t.insert({"id": 5000, "email": "new", "n": 9})
+                t.update(("n", 1), {"n": 7})
+                t.delete(("n", "<", 3))
+                t.create_index(f"{name}_email", "email", "sorted")
+                t.drop_index(f"{name}_n")
+                raise RuntimeError("abort")
+        assert t.select() == before
+        assert sorted(t.indexes) == sorted([f"{name}_pkey", f"{name}_email_key", f"{name}_n"])
+        assert len(t.select(("n", ">=", 1))) == 1500
+        assert t.select(("id", 5000)) == [] and not db.is_dirty(name)
+
+    saves = []
+    monkeypatch.setattr(Database, "_write_snapshot", lambda self, t, base, lsn=None: saves.append(t.name))
+    with db.transaction():
+        db.create_table("log", ["msg"])
+        for i in range(10):
+            db.tables["r"].update(("id", i), {"n": 9})
+            db.save("r")
+        db.tables["c"].delete(("n", 0))
+        assert saves == [] and db.in_transaction
+    assert sorted(saves) == ["c", "log", "r"]
+    assert len(db.tables["c"].select()) == 1500
+
+    db.begin()
+    db.create_table("tmp", ["a"])
+    db.tables["r"].insert({"id": -1, "email": "x", "n": 0})
+    with pytest.raises(ValueError):
+        db.begin()
+    with pytest.raises(ValueError):
+        db.drop_table("r")
+    db.rollback()
+    assert "tmp" not in db.tables and db.tables["r"].select(("id", -1)) == []
+    with pytest.raises(ValueError):
+        db.commit()
+
+
+def test_concurrent_writers_and_transactions(tmp_path):
+    import threading
+    import time
+
+    db = setup_db(tmp_path)
+    db.create_table("counters", ["id", "n"], pk="id")
+    t = db.tables["counters"]
+
+    def work(k):
+        for i in range(200):
+            t.insert({"id": f"{k}-{i}", "n": i})
+            t.update(("id", f"{k}-{i}"), {"n": i + 1})
+            assert len(t.select(("id", f"{k}-{i}"))) == 1
+        db.save("counters")
+
+    threads = [threading.Thread(target=work, args=(k,)) for k in range(8)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    assert t.row_count() == 1600
+    assert t.aggregate("SUM", "n") == 8 * sum(range(1, 201))
+
+    db2 = Database()
+    db2.load("counters")
+    assert db2.tables["counters"].row_count() == 1600
+    assert not [f for f in os.listdir(db_mod.DATA_DIR) if f.endswith(".tmp")]
+
+    # another thread's write waits until this thread's transaction ends
+    seen = []
+    db.begin()
+    t.insert({"id": "tx", "n": 0})
+    other = threading.Thread(target=lambda: (t.insert({"id": "late", "n": 0}), seen.append(t.row_count())))
+    other.start()
+    time.sleep(0.05)
+    assert seen == [] and db.in_transaction
+    db.rollback()
+    other.join(1)
+    assert seen == [1601]
+    assert t.select(("id", "tx")) == [] and len(t.select(("id", "late"))) == 1
+
+    # the same with a table-level transaction, which has no database gate:
+    # the waiting writer sleeps on the table's condition until commit
+    class CountingCondition(threading.Condition):
+        waits = 0
+
+        def wait(self, timeout=None):
+            self.waits += 1
+            return super().wait(timeout)
+
+    t._tx_ended = CountingCondition()
+    t.begin()
+    t.update(("id", "late"), {"n": 1})
+    other = threading.Thread(target=lambda: t.update(("id", "late"), {"n": 2}), daemon=True)
+    other.start()
+    deadline = time.monotonic() + 5
+    while not t._tx_ended.waits and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.05)
+    # one wait, not a retry loop, and nothing written before the commit
+    assert t._tx_ended.waits == 1 and other.is_alive()
+    assert t.select(("id", "late"))[0]["n"] == 1
+    t.commit()
+    other.join(5)
+    assert not other.is_alive() and t.select(("id", "late"))[0]["n"] == 2
+
+
+@pytest.mark.parametrize("engine", ["row", "columnar"])
+def test_snapshots_see_one_version_while_writers_go_on(tmp_path, engine):
+    import threading
+
+    db = setup_db(tmp_path)
+    db.create_table("s", ["id", "n"], pk="id", engine=engine)
+    t = db.tables["s"]
+    for i in range(50):
+        t.insert({"id": i, "n": i})
+    before = sorted((r["id"], r["n"]) for r in t.select())
+
+    snap = t.snapshot()
+    rows = snap.rows()
+    first = next(rows)
+    # writes go ahead while the snapshot is open and half read
+    t.update(("id", "<", 25), {"n": -1})
+    t.delete(("id", ">=", 40))
+    t.insert({"id": 100, "n": 100})
+    seen = [first] + list(rows)
+    assert sorted((r["id"], r["n"]) for r in seen) == before
+    assert snap.select(("n", "<", 0), columns=["id"]) == []
+    assert len(t.snapshot().select(("n", "<", 0))) == 25
+
+    # uncommitted transaction work stays invisible to snapshots
+    db.begin()
+    t.update(("id", 0), {"n": 7})
+    t.delete(("id", 1))
+    with t.snapshot() as s2:
+        assert sorted(r["id"] for r in s2.rows(("id", "<", 3))) == [0, 1, 2]
+        assert s2.select(("id", 0), columns=["n"]) == [{"n": -1}]
+    db.commit()
+    assert t.snapshot().select(("id", 0), columns=["n"]) == [{"n": 7}]
+
+    # a scan in another thread does not hold up writers
+    page = t.scan()
+    next(page)
+    writer = threading.Thread(target=t.insert, args=({"id": 200, "n": 0},))
+    writer.start()
+    writer.join(1)
+    assert not writer.is_alive()
+    assert 200 not in [r["id"] for r in page]
+
+    snap.close()
+    assert db.vacuum() > 0
+    assert not t._versions
+
+
+def test_shared_databases_follow_each_others_writes(tmp_path):
+    base = str(tmp_path / "shared")
+    a = Database(base_dir=base, wal=True, shared=True)
+    b = Database(base_dir=base, wal=True, shared=True)
+    a.create_table("t", ["id", "n"], pk="id")
+    a.save("t")
+    b.open(base)
+    assert b.tables["t"].row_count() == 0
+
+    with a.exclusive():
+        a.tables["t"].insert({"id": "1", "n": "x"})
+        a.save("t")
+    # caught up by replaying the log, not by reloading the table
+    t = b.tables["t"]
+    assert b.refresh("t") is t and t.select(("id", "1")) == [{"id": "1", "n": "x"}]
+    avoided = b.reloads_avoided
+    b.refresh("t")
+    assert b.reloads_avoided == avoided + 1
+
+    # writes in an exclusive block are checked against the other's rows
+    with b.exclusive():
+        with pytest.raises(ValueError):
+            b.tables["t"].insert({"id": "1", "n": "y"})
+        b.tables["t"].insert({"id": "2", "n": "y"})
+        b.save("t")
+    with a.exclusive():
+        a.tables["t"].update(("id", "2"), {"n": "z"})
+        a.save("t")
+    a.checkpoint()
+    assert b.refresh("t").select(("id", "2")) == [{"id": "2", "n": "z"}]
+    with b.exclusive():
+        b.tables["t"].delete(("id", "1"))
+        b.save("t")
+    assert a.refresh("t").row_count() == 1
+
+    # tables created and dropped by one show up in the other
+    a.create_table("u", ["id"])
+    a.save("u")
+    b.refresh("t")
+    assert "u" in b.tables
+    a.drop_table("u")
+    b.refresh("t")
+    assert "u" not in b.tables
+
+    c = Database(base_dir=base, wal=True)
+    c.load("t")
+    assert c.tables["t"].select() == [{"id": "2", "n": "z"}]
+    for d in (a, b, c):
+        d.close()
+
+
+@pytest.mark.parametrize("engine", ["row", "columnar"])
+def test_bulk_insert_and_copy_from_files(tmp_path, engine):
+    db = setup_db(tmp_path)
+    db.create_table("b", ["id", "name"], pk="id", uniques=["name"], engine=engine)
+    t = db.tables["b"]
+    t.create_index("b_id", "id", "sorted")
+    assert t.bulk_insert(({"id": i, "name": f"n{i}"} for i in range(25)), batch_size=10) == 25
+    assert len(list(t.index_scan("b_id", ">=", 20))) == 5
+    assert [r["id"] for r in t.select(("id", ">=", 22), order_by="id")] == [22, 23, 24]
+
+    # a duplicate fails its whole batch, against the table or within the batch
+    with pytest.raises(ValueError, match="Record 2: Duplicate primary key"):
+        t.bulk_insert([{"id": 100, "name": "x"}, {"id": 3, "name": "y"}])
+    with pytest.raises(ValueError, match="Record 12: Duplicate unique key: name"):
+        t.bulk_insert([{"id": 100 + i, "name": f"m{i % 11}"} for i in range(20)], batch_size=20)
+    with pytest.raises(ValueError, match="Record 1: Missing columns"):
+        t.bulk_insert([{"id": 200}])
+    assert t.row_count() == 25
+
+    # COPY is all or nothing and saves once
+    csv_path = tmp_path / "b.csv"
+    csv_path.write_text("name,id\nc1,100\nc2,101\n,102\n")
+    assert db.copy_from("b", str(csv_path), header=True) == 3
+    assert t.select(("id", "102")) == [{"id": "102", "name": None}]
+    bad = tmp_path / "bad.jsonl"
+    bad.write_text('{"id": 300, "name": "j0"}\n{"id": 301, "name": "j1"}\n{"id": 0, "name": "j2"}\n')
+    with pytest.raises(ValueError):
+        db.copy_from("b", str(bad), format="jsonl", batch_size=2)
+    assert t.row_count() == 28 and not t.select(("id", 300))
+    with pytest.raises(ValueError, match="File does not exist"):
+        db.copy_from("b", str(tmp_path / "missing.csv"))
+
+    # a small bulk insert is logged as one entry and replayed on load
+    w = Database(wal=True)
+    w.load("b")
+    w.tables["b"].bulk_insert([{"id": 400, "name": "w"}])
+    w.save("b")
+    w.close()
+    db2 = Database()
+    db2.load("b")
+    assert db2.tables["b"].row_count() == 29
+
+
+@pytest.mark.parametrize("engine", ["row", "columnar"])
+def test_typed_columns_store_native_values(tmp_path, engine):
+    db = setup_db(tmp_path)
+    types = {"id": "INTEGER", "price": "REAL", "name": "TEXT", "ok": "BOOL", "at": "TIMESTAMP"}
+    db.create_table("p", ["id", "price", "name", "ok", "at"], pk="id", engine=engine, types=types)
+    t = db.tables["p"]
+    assert t.types["ok"] == "BOOLEAN"
+    t.insert({"id": "9", "price": "9.5", "name": 9, "ok": "yes", "at": "2024-05-01T12:00:00+02:00"})
+    t.bulk_insert([{"id": str(i), "price": i, "name": f"n{i}", "ok": i % 2, "at": None} for i in (10, 100)])
+    t.create_index("p_price", "price", "sorted")
+    assert t.select(("id", "9")) == [{"id": 9, "price": 9.5, "name": "9", "ok": True, "at": datetime(2024, 5, 1, 10)}]
+
+    # comparisons are numeric, values in where clauses are coerced too
+    assert [r["id"] for r in t.select(("price", ">", "9"), order_by="price")] == [9, 10, 100]
+    assert [r["id"] for r in t.select(("id", "<", "50"))] == [9, 10]
+    assert t.aggregate("COUNT", where=("ok", "false")) == 2
+    assert t.aggregate("MAX", "at") == datetime(2024, 5, 1, 10)
+    assert t.update(("id", "10"), {"price": "11"}) == 1
+    with pytest.raises(ValueError, match="Invalid INTEGER value for id: 'x'"):
+        t.insert({"id": "x", "price": 1, "name": "a", "ok": True, "at": None})
+    with pytest.raises(ValueError, match="Record 1: Invalid REAL value for price"):
+        t.bulk_insert([{"id": 1, "price": "cheap", "name": "a", "ok": True, "at": None}])
+    with pytest.raises(ValueError, match="Invalid BOOLEAN value for ok"):
+        t.update(("id", 9), {"ok": "maybe"})
+    with pytest.raises(ValueError, match="Unknown column type"):
+        db.create_table("bad", ["a"], types={"a": "MONEY"})
+    if engine == "columnar":
+        assert t.column("price").values.typecode == "d"
+
+    # types and native values survive both storage formats and the log
+    db.save("p")
+    w = Database(wal=True, storage="binary")
+    w.load("p")
+    w.tables["p"].update(("id", 9), {"at": "2025-01-01 00:00:00"})
+    w.save("p")
+    w.close()
+    for storage in ("json", "binary"):
+        d = Database(storage=storage)
+        d.load("p")
+        p = d.tables["p"]
+        assert p.types == {"id": "INTEGER", "price": "REAL", "name": "TEXT", "ok": "BOOLEAN", "at": "TIMESTAMP"}
+        assert p.select(("id", 9))[0]["at"] == datetime(2025, 1, 1)
+        assert [r["price"] for r in p.select(order_by="price")] == [9.5, 11.0, 100.0]
+        # INTEGER columns compare numerically with non-integral bounds
+        assert len(p.select(("id", "<", 9.5))) == len(p.select(("id", "<=", "9"))) and p.select(("id", 8.5)) == []
+        with pytest.raises(ValueError, match="Invalid INTEGER"):
+            p.select(("id", "<", "abc"))
+
+
+def test_select_results_are_cached_until_the_table_changes(tmp_path):
+    db = setup_db(tmp_path)
+    db.create_table("c", ["id", "k"], pk="id")
+    t = db.tables["c"]
+    for i in range(10):
+        t.insert({"id": i, "k": i % 2})
+    cache = db.result_cache
+    assert len(t.select(("k", 1))) == 5
+    rows = t.select(("k", 1))
+    assert (cache.hits, cache.misses) == (1, 1)
+    # cached rows are read-only on hits and misses alike; the lists are the caller's
+    with pytest.raises(TypeError):
+        rows[0]["k"] = "changed"
+    with pytest.raises(TypeError):
+        t.select(("k", 0))[0]["k"] = "changed"
+    rows.clear()
+    assert [r["k"] for r in t.select(("k", 1))] == [1] * 5
+    # whole tables are not cached, and stay the table's own rows as before
+    t.select()
+    assert cache.stats()["entries"] == 2
+
+    # every kind of mutation invalidates exactly
+    t.insert({"id": 10, "k": 1})
+    assert len(t.select(("k", 1))) == 6
+    t.update(("id", 10), {"k": 0})
+    assert len(t.select(("k", 1))) == 5
+    db.begin()
+    t.delete(("k", 1))
+    assert t.select(("k", 1)) == []
+    db.rollback()
+    assert len(t.select(("k", 1))) == 5
+    # a reloaded table is a new table
+    db.save("c")
+    other = Database()
+    other.load("c")
+    other.tables["c"].delete(("id", 1))
+    other.save("c")
+    db.load("c")
+    assert len(db.tables["c"].select(("k", 1))) == 4
+
+    # least recently used entries go once the budget is exceeded
+    small = Database(result_cache_bytes=1000)
+    small.load("c")
+    s = small.tables["c"]
+    for i in range(10):
+        s.select(("id", i))
+    stats = small.result_cache.stats()
+    assert stats["evictions"] > 0 and stats["bytes"] <= 1000
+    s.select(("id", 9))
+    assert small.result_cache.stats()["hits"] == 1
+    # a result too big to keep is read-only all the same
+    tiny = Database(result_cache_bytes=50)
+    tiny.load("c")
+    big = tiny.tables["c"].select(("k", 0))
+    assert tiny.result_cache.stats()["entries"] == 0
+    with pytest.raises(TypeError):
+        big[0]["k"] = "changed"
+    assert all(r["k"] == 0 for r in tiny.tables["c"].select(("k", 0)))
+    assert Database(result_cache_bytes=0).result_cache is None
@@ -0,0 +1,81 @@
+import sys
+import pathlib
+import threading
+import time
+
+# ensure project root is on sys.path so test runner can import local modules
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import pytest
+
+from locks import ChangeCounter, FileLock, RWLock, fcntl
+
+
+def test_readers_share_and_writers_exclude():
+    lock = RWLock()
+    events = []
+
+    def writer():
+        with lock.write():
+            events.append("write")
+
+    with lock.read():
+        # a second thread can read alongside this one
+        other = threading.Thread(target=lambda: (lock.acquire_read(), events.append("read"), lock.release_read()))
+        other.start()
+        other.join(1)
+        assert events == ["read"]
+
+        w = threading.Thread(target=writer)
+        w.start()
+        time.sleep(0.05)
+        # the writer waits for the reader to finish
+        assert events == ["read"]
+        # reentrant read while a writer waits does not deadlock
+        with lock.read():
+            pass
+    w.join(1)
+    assert events == ["read", "write"]
+
+    with lock.write():
+        # the writer may read and write again
+        with lock.read():
+            with lock.write():
+                assert lock.is_writer()
+    assert not lock.is_writer()
+
+    with lock.read():
+        with pytest.raises(RuntimeError):
+            lock.acquire_write()
+
+
+def test_file_lock_and_change_counter_are_shared_between_processes(tmp_path):
+    import subprocess
+
+    path = str(tmp_path / "db.lock")
+    probe = (
+        "import fcntl, sys\n"
+        "f = open(sys.argv[1], 'a')\n"
+        "try:\n"
+        "    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)\n"
+        "except OSError:\n"
+        "    sys.exit(1)\n"
+    )
+    lock = FileLock(path)
+    with lock.shared():
+        with lock.shared():
+            with pytest.raises(RuntimeError):
+                lock.acquire(exclusive=True)
+        if fcntl is not None:
+            assert subprocess.run([sys.executable, "-c", probe, path]).returncode == 1
+    if fcntl is not None:
+        assert subprocess.run([sys.executable, "-c", probe, path]).returncode == 0
+    lock.close()
+
+    a = ChangeCounter(str(tmp_path / "version"))
+    b = ChangeCounter(str(tmp_path / "version"))
+    assert a.value == b.value == 0
+    assert a.bump() == 1 and b.value == 1
+    assert b.bump() == 2 and a.value == 2
+    a.close()
+    b.close()
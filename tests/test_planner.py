@@ -0,0 +1,243 @@
+import sys
+import pathlib
+
+# ensure project root is on sys.path so test runner can import local modules
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import pytest
+
+import db as db_mod
+from db import Database
+from planner import execute, plan
+from sql import parse
+
+
+def setup_db(tmp_path):
+    path = tmp_path / "data"
+    path.mkdir()
+    db_mod.DATA_DIR = str(path)
+    db = Database()
+    db.create_table("items", ["id", "kind", "price"], pk="id")
+    t = db.tables["items"]
+    for i in range(500):
+        t.insert({"id": i, "kind": f"k{i % 50}", "price": i % 20})
+    return db
+
+
+def run(db, q, *params):
+    return execute(db, parse(q, params))
+
+
+def test_access_paths_follow_statistics(tmp_path):
+    db = setup_db(tmp_path)
+    t = db.tables["items"]
+    stats = t.stats()
+    assert stats["rows"] == 500
+    assert stats["distinct"]["id"] == 500
+    assert 40 <= stats["distinct"]["kind"] <= 60
+
+    # SQL literals are strings; numbers are bound as parameters
+    q = "SELECT * FROM items WHERE kind = 'k3' AND price < ?"
+    assert "Seq Scan on items" in run(db, "EXPLAIN " + q, 10)
+    run(db, "CREATE INDEX items_kind ON items (kind)")
+    text = run(db, "EXPLAIN " + q, 10)
+    assert "Filter price < 10" in text and "Index Scan using items_kind on items where kind = 'k3'" in text
+    assert sorted(r["id"] for r in run(db, q, 10)) == [3, 103, 203, 303, 403]
+
+    # a low-selectivity predicate keeps the sequential scan
+    run(db, "CREATE INDEX items_price ON items (price) USING SORTED")
+    assert run(db, "EXPLAIN SELECT * FROM items WHERE price >= ?", 0).startswith("Seq Scan")
+    assert "items_pkey" in run(db, "EXPLAIN SELECT * FROM items WHERE id = ?", 7)
+
+    # ORDER BY ... LIMIT walks the sorted index instead of sorting
+    q = "SELECT * FROM items ORDER BY price DESC LIMIT 3"
+    text = run(db, "EXPLAIN " + q)
+    assert "Sort" not in text and "Index Scan using items_price on items DESC" in text
+    assert [r["price"] for r in run(db, q)] == [19, 19, 19]
+    text = run(db, "EXPLAIN SELECT * FROM items WHERE price BETWEEN ? AND ? ORDER BY price", 3, 5)
+    assert text.startswith("Index Scan using items_price") and "Sort" not in text
+
+
+def test_execute_statements(tmp_path):
+    db = setup_db(tmp_path)
+    assert run(db, "SELECT kind, price FROM items WHERE id = ?", 42) == [{"kind": "k42", "price": 2}]
+    rows = run(db, "SELECT id FROM items WHERE price = ? OR id < ? ORDER BY id DESC LIMIT 2 OFFSET 1", 19, 2)
+    assert rows == [{"id": 479}, {"id": 459}]
+    assert run(db, "SELECT COUNT(*), SUM(price), MAX(kind), MIN(price) FROM items WHERE id < ?", 25) == [
+        {"COUNT(*)": 25, "SUM(price)": sum(i % 20 for i in range(25)), "MAX(kind)": "k9", "MIN(price)": 0}]
+
+    assert run(db, "DELETE FROM items WHERE price > ?", 0) == "Row deleted"
+    assert run(db, "SELECT COUNT(*) FROM items") == [{"COUNT(*)": 25}]
+    assert run(db, "INSERT INTO items VALUES (?, ?, ?)", 1000, "new", 5) == "Row inserted"
+    assert run(db, "SELECT kind FROM items WHERE price = ?", 5) == [{"kind": "new"}]
+
+    with pytest.raises(ValueError):
+        run(db, "SELECT nope FROM items")
+    with pytest.raises(ValueError):
+        run(db, "SELECT id, COUNT(*) FROM items")
+    with pytest.raises(ValueError):
+        run(db, "SELECT * FROM missing")
+
+    assert run(db, "BEGIN") == "Transaction started"
+    run(db, "DELETE FROM items WHERE id < ?", 2000)
+    assert run(db, "SELECT COUNT(*) FROM items") == [{"COUNT(*)": 0}]
+    assert run(db, "ROLLBACK TRANSACTION") == "Transaction rolled back"
+    assert run(db, "SELECT COUNT(*) FROM items") == [{"COUNT(*)": 26}]
+    run(db, "BEGIN TRANSACTION;")
+    run(db, "INSERT INTO items VALUES (?, ?, ?)", 1001, "new", 6)
+    assert run(db, "COMMIT") == "Transaction committed"
+    db2 = Database()
+    db2.load("items")
+    assert len(db2.tables["items"].select()) == 27
+
+    path = tmp_path / "more.jsonl"
+    path.write_text('{"id": 2001, "kind": "j", "price": 1}\n{"id": 2002, "kind": "j", "price": 2}\n')
+    assert run(db, f"LOAD JSONL '{path}' INTO items") == "2 row(s) loaded"
+    assert run(db, "SELECT COUNT(*) FROM items WHERE kind = 'j'") == [{"COUNT(*)": 2}]
+    with pytest.raises(ValueError):
+        run(db, "COMMIT")
+
+    # typed columns compare as numbers, not as the strings the SQL was typed as
+    run(db, "CREATE TABLE typed (id INTEGER, price REAL)")
+    for i in (2, 10, 100):
+        run(db, "INSERT INTO typed VALUES (?, ?)", str(i), f"{i}.5")
+    assert run(db, "SELECT id FROM typed WHERE price > 9 ORDER BY id") == [{"id": 10}, {"id": 100}]
+    assert run(db, "SELECT id FROM typed WHERE id BETWEEN '3' AND '50'") == [{"id": 10}]
+    with pytest.raises(ValueError, match="Invalid INTEGER value for id"):
+        run(db, "INSERT INTO typed VALUES (x, 1)")
+
+    # SELECT results are cached by statement and parameters until a table changes
+    cache = db.result_cache
+    cache.clear()
+    q = "SELECT i.kind, t.price FROM items i JOIN typed t ON i.price = t.id WHERE t.id = ?"
+    run(db, "INSERT INTO items VALUES (?, ?, ?)", 3000, "joined", 100)
+    assert run(db, q, 100) == [{"i.kind": "joined", "t.price": 100.5}]
+    assert run(db, "select i.kind, t.price from items i join typed t on i.price = t.id where t.id = ?", 100) == [
+        {"i.kind": "joined", "t.price": 100.5}]
+    run(db, q, 10)
+    assert (cache.hits, cache.misses) == (1, 2)
+    run(db, "DELETE FROM typed WHERE id = 100")
+    assert run(db, q, 100) == []
+
+
+def test_joins(tmp_path):
+    db = setup_db(tmp_path)
+    db.create_table("orders", ["oid", "item", "qty"], pk="oid")
+    orders = db.tables["orders"]
+    for i in range(40):
+        orders.insert({"oid": i, "item": i * 3 if i < 30 else None, "qty": i % 4})
+    items = {r["id"]: r for r in db.tables["items"].rows}
+    expected = sorted((o["oid"], o["item"], items[o["item"]]["kind"]) for o in orders.rows if o["item"] in items)
+
+    q = "SELECT o.oid, o.item, i.kind FROM orders o JOIN items i ON i.id = o.item"
+    text = run(db, "EXPLAIN " + q)
+    assert "Hash Inner Join on o.item = i.id (build left)" in text
+    rows = run(db, q)
+    assert sorted((r["o.oid"], r["o.item"], r["i.kind"]) for r in rows) == expected
+
+    # filters on one table are pushed below the join
+    q = "SELECT oid, kind FROM items i INNER JOIN orders o ON o.item = i.id WHERE qty = ? AND price < ? ORDER BY oid"
+    text = run(db, "EXPLAIN " + q, 1, 10)
+    assert "Seq Scan on orders filter qty = 1 as o" in text and "Seq Scan on items filter price < 10 as i" in text
+    assert [r["oid"] for r in run(db, q, 1, 10)] == [
+        oid for oid, item, _ in expected if oid % 4 == 1 and items[item]["price"] < 10]
+
+    # LEFT JOIN keeps unmatched rows; a WHERE on the nullable side is applied after the join
+    q = "SELECT oid, kind FROM orders o LEFT JOIN items i ON o.item = i.id"
+    rows = run(db, q)
+    assert len(rows) == 40 and sum(r["kind"] is None for r in rows) == 10
+    rows = run(db, "SELECT oid FROM orders LEFT OUTER JOIN items ON item = id WHERE kind IS NULL")
+    assert sorted(r["oid"] for r in rows) == list(range(30, 40))
+
+    # sorted indexes on both keys give a merge join with the same result
+    run(db, "CREATE INDEX items_id_sorted ON items (id) USING SORTED")
+    run(db, "CREATE INDEX orders_item ON orders (item) USING SORTED")
+    for kind in ("", "LEFT "):
+        q = f"SELECT oid, kind FROM orders o {kind}JOIN items i ON o.item = i.id"
+        assert f"Merge {kind.strip().title() or 'Inner'} Join" in run(db, "EXPLAIN " + q)
+        merged = run(db, q)
+        assert len(merged) == (40 if kind else 30)
+        assert sorted(merged, key=lambda r: r["oid"]) == [
+            {"oid": o, "kind": items[o * 3]["kind"] if o < 30 else None} for o in range(40 if kind else 30)]
+    assert run(db, "SELECT COUNT(*), SUM(qty) FROM orders JOIN items ON item = id") == [
+        {"COUNT(*)": 30, "SUM(qty)": sum(i % 4 for i in range(30))}]
+
+    with pytest.raises(ValueError):
+        run(db, "SELECT * FROM items JOIN items ON id = id")
+    with pytest.raises(ValueError):
+        run(db, "SELECT id FROM items a JOIN items b ON a.id = b.id")
+
+
+def test_group_by_and_having(tmp_path):
+    db = setup_db(tmp_path)
+    items = db.tables["items"].rows
+    by_price = {}
+    for r in items:
+        by_price.setdefault(r["price"], []).append(r)
+
+    q = "SELECT price, COUNT(*), MAX(kind), AVG(id) FROM items GROUP BY price HAVING COUNT(*) >= 25 ORDER BY price"
+    assert "Hash Aggregate" in run(db, "EXPLAIN " + q)
+    expected = [{"price": p, "COUNT(*)": len(rs), "MAX(kind)": max(r["kind"] for r in rs),
+                 "AVG(id)": sum(r["id"] for r in rs) / len(rs)} for p, rs in sorted(by_price.items())]
+    assert run(db, q) == expected
+
+    # a sorted index on the key streams groups in key order, with no sort
+    run(db, "CREATE INDEX items_price ON items (price) USING SORTED")
+    text = run(db, "EXPLAIN " + q)
+    assert "Stream Aggregate" in text and "Sort" not in text
+    assert run(db, q) == expected
+
+    # COUNT per key comes straight from the index
+    q = "SELECT price, COUNT(*) FROM items GROUP BY price ORDER BY price DESC LIMIT 2"
+    assert "Index Aggregate COUNT(*) using items_price" in run(db, "EXPLAIN " + q)
+    assert run(db, q) == [{"price": 19, "COUNT(*)": 25}, {"price": 18, "COUNT(*)": 25}]
+
+    # groups over a join and several keys
+    db.create_table("tags", ["item", "tag"])
+    for i in range(0, 300, 7):
+        db.tables["tags"].insert({"item": i, "tag": "even" if i % 2 == 0 else "odd"})
+    counts = {}
+    for i in range(0, 250, 7):
+        key = ("even" if i % 2 == 0 else "odd", i % 20)
+        counts[key] = counts.get(key, 0) + 1
+    expected = sorted(({"tag": k[0], "price": k[1], "COUNT(*)": n} for k, n in counts.items() if n > 1),
+                      key=lambda r: (r["price"], r["tag"]))
+    rows = run(db, "SELECT tag, price, COUNT(*) FROM tags JOIN items ON item = id WHERE id < ? GROUP BY tag, price "
+                   "HAVING COUNT(*) > 1 ORDER BY price", 250)
+    assert expected and sorted(rows, key=lambda r: (r["price"], r["tag"])) == expected
+    assert [r["price"] for r in rows] == sorted(r["price"] for r in rows)
+
+    with pytest.raises(ValueError):
+        run(db, "SELECT kind, COUNT(*) FROM items GROUP BY price")
+    with pytest.raises(ValueError):
+        run(db, "SELECT * FROM items GROUP BY price")
+    with pytest.raises(ValueError):
+        run(db, "SELECT price FROM items WHERE COUNT(*) > 1 GROUP BY price")
+
+
+def test_projection_pushdown(tmp_path):
+    db = setup_db(tmp_path)
+    t = db.tables["items"]
+
+    node = plan(db, parse("SELECT kind FROM items WHERE price = ?", (3,)))
+    scan = node.children[0]
+    assert scan.columns == ["kind", "price"]
+    rows = run(db, "SELECT * FROM items WHERE id = ?", 7)
+    assert rows == [{"id": 7, "kind": "k7", "price": 7}]
+    # cached results are read-only; a copy may be changed and leaves the table alone
+    with pytest.raises(TypeError):
+        rows[0]["kind"] = "changed"
+    row = dict(rows[0])
+    row["kind"] = "changed"
+    assert t.select(("id", 7))[0]["kind"] == "k7"
+
+    assert plan(db, parse("SELECT COUNT(*) FROM items")).children[0].children[0].columns == []
+    assert run(db, "SELECT kind, SUM(price) FROM items GROUP BY kind ORDER BY kind")[0] == {"kind": "k0", "SUM(price)": 50}
+
+    db.create_table("orders", ["oid", "item", "qty", "note"], pk="oid")
+    for i in range(20):
+        db.tables["orders"].insert({"oid": i, "item": i, "qty": i % 4, "note": "x"})
+    q = "SELECT o.oid, i.kind FROM orders o JOIN items i ON o.item = i.id WHERE o.qty = ?"
+    join = plan(db, parse(q, (1,))).children[0]
+    assert sorted(c for side in join.children for c in side.columns) == ["i.id", "i.kind", "o.item", "o.oid", "o.qty"]
+    assert run(db, q, 1)[:2] == [{"o.oid": 1, "i.kind": "k1"}, {"o.oid": 5, "i.kind": "k5"}]
@@ -5,16 +5,34 @@ import pathlib
 sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
 
 import pytest
-from sql import parse
+import sql
+from sql import parse, CreateTable, CreateIndex, DropIndex, DropTable, Insert, Select, Delete, Copy
 
 def test_parse_valid_queries():
     cases = [
-        ("CREATE TABLE users (id, name, email)", ("CREATE", "users", ["id", "name", "email"])),
-        ("INSERT INTO users VALUES (1, 'Alice', 'a@example.com')", ("INSERT", "users", ["1", "Alice", "a@example.com"])),
-        ("SELECT * FROM users", ("SELECT", "users")),
-        ("SELECT * FROM users WHERE id = 1", ("SELECT", "users", ("id", "1"))),
-        ("DELETE FROM users WHERE id = 1", ("DELETE", "users", ("id", "1"))),
-        ("DROP TABLE users", ("DROP", "users")),
+        ("CREATE TABLE users (id, name, email)", CreateTable("users", ("id", "name", "email"))),
+        ("INSERT INTO users VALUES (1, 'Alice', 'a@example.com')", Insert("users", ("1", "Alice", "a@example.com"))),
+        ("SELECT * FROM users", Select("users")),
+        ("SELECT * FROM users WHERE id = 1", Select("users", ("id", "=", "1"))),
+        ("DELETE FROM users WHERE id = 1", Delete("users", ("id", "=", "1"))),
+        ("DROP TABLE users", DropTable("users")),
+        ("CREATE INDEX users_name ON users (name)", CreateIndex("users_name", "users", "name")),
+        ("DROP INDEX users_name", DropIndex("users_name")),
+        ("CREATE INDEX users_id ON users (id) USING SORTED", CreateIndex("users_id", "users", "id", "sorted")),
+        ("SELECT * FROM users WHERE id > 5", Select("users", ("id", ">", "5"))),
+        ("SELECT * FROM users WHERE id BETWEEN 2 AND 4", Select("users", ("id", "BETWEEN", ("2", "4")))),
+        ("SELECT * FROM users ORDER BY id DESC LIMIT 3", Select("users", None, "id", True, 3)),
+        ("SELECT * FROM users LIMIT 10 OFFSET 20", Select("users", limit=10, offset=20)),
+        ("insert into notes values ('a, b', 'it''s here', NULL);", Insert("notes", ("a, b", "it's here", None))),
+        ("SELECT * FROM users WHERE name = 'Ann Lee' AND (age >= 30 OR NOT city <> 'Oslo') AND email IS NOT NULL",
+         Select("users", ("AND", ("name", "=", "Ann Lee"), ("OR", ("age", ">=", "30"), ("NOT", ("city", "!=", "Oslo"))),
+                          ("email", "!=", None)))),
+        ("COPY users FROM 'users.csv'", Copy("users", "users.csv")),
+        ("copy users from 'data/u.csv' header", Copy("users", "data/u.csv", "csv", True)),
+        ("LOAD JSONL 'users.jsonl' INTO users", Copy("users", "users.jsonl", "jsonl")),
+        ("CREATE TABLE p (id INTEGER, name, price real, ok BOOL, at TIMESTAMP)",
+         CreateTable("p", ("id", "name", "price", "ok", "at"),
+                     (("id", "INTEGER"), ("price", "REAL"), ("ok", "BOOLEAN"), ("at", "TIMESTAMP")))),
     ]
 
     for q, expected in cases:
@@ -22,7 +40,51 @@ def test_parse_valid_queries():
 
 
 def test_parse_invalid_queries():
-    bad = ["", "CREATE users", "INSERT users 1,2,3", "SELECT users"]
+    bad = ["", "CREATE users", "INSERT users 1,2,3", "SELECT users", "CREATE INDEX idx users (name)", "DROP INDEX",
+           "SELECT * FROM users WHERE id LIKE 3", "SELECT * FROM users LIMIT x", "SELECT * FROM users WHERE (id = 1",
+           "INSERT INTO users VALUES ('open)", "DELETE FROM users", "SELECT * FROM users u extra", "SELECT * FROM a JOIN b ON a.x",
+           "COPY users FROM users.csv", "COPY users FROM 'u.csv' WITH", "LOAD 'u.jsonl' INTO users",
+           "CREATE TABLE p (id MONEY)", "CREATE TABLE p (id INTEGER NOT NULL)"]
     for q in bad:
         with pytest.raises(ValueError):
             parse(q)
+
+
+def test_statement_cache_and_placeholders():
+    sql.statement_cache.clear()
+    q = "SELECT * FROM users WHERE age > ? AND name != ? LIMIT ?"
+    for age in range(5):
+        assert parse(q, (age, "x", 2)) == Select("users", ("AND", ("age", ">", age), ("name", "!=", "x")), limit=2)
+    assert sql.statement_cache.misses == 1
+    assert sql.statement_cache.hits == 4
+
+    # spacing and keyword case normalize to the same statement
+    assert parse("select *  from users where age > ? and name != ? limit ?", (1, "y", 3)).limit == 3
+    assert sql.statement_cache.misses == 1
+
+    with pytest.raises(ValueError):
+        parse(q, (1,))
+    # LIMIT / OFFSET parameters are counts
+    assert parse(q, (1, "y", "3")).limit == 3
+    for bad in ("x", -1, 1.5, None, True):
+        with pytest.raises(ValueError, match="non-negative integer"):
+            parse(q, (1, "y", bad))
+
+    # threads share the cache
+    import threading
+    sql.statement_cache.maxsize = 4
+    errors = []
+
+    def work(n):
+        try:
+            for i in range(300):
+                parse(f"SELECT * FROM t{(n + i) % 9} LIMIT ?", (i,))
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=work, args=(n,)) for n in range(8)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    sql.statement_cache.maxsize = 256
+    assert errors == []
@@ -34,3 +34,71 @@ def test_webapp_post_and_duplicate(tmp_path, monkeypatch):
     # get should show the user
     rv = client.get('/users')
     assert 'Alice' in rv.get_data(as_text=True)
+
+
+def test_users_pagination_and_stream(tmp_path, monkeypatch):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    monkeypatch.setattr(db_mod, 'DATA_DIR', str(data_dir))
+    sys.modules.pop('webapp', None)
+    import webapp
+
+    client = webapp.app.test_client()
+    for i in range(5):
+        client.post('/users', data={'id': str(i), 'name': f'user{i}', 'email': f'{i}@example.com'})
+
+    txt = client.get('/users?per_page=2').get_data(as_text=True)
+    assert 'user1' in txt and 'user2' not in txt
+    assert 'page=2' in txt
+
+    txt = client.get('/users?per_page=2&page=3').get_data(as_text=True)
+    assert 'user4' in txt and 'user3' not in txt
+
+    # keyset paging by primary key
+    txt = client.get('/users?per_page=2&after=1').get_data(as_text=True)
+    assert 'user2' in txt and 'user3' in txt and 'user1' not in txt
+    assert 'after=3' in txt
+
+    rv = client.get('/users?stream=1')
+    assert rv.is_streamed
+    txt = rv.get_data(as_text=True)
+    assert all(f'user{i}' in txt for i in range(5))
+    assert txt.rstrip().endswith('</html>')
+
+
+def test_table_pages_are_conditional_and_cached(tmp_path, monkeypatch):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    monkeypatch.setattr(db_mod, 'DATA_DIR', str(data_dir))
+    sys.modules.pop('webapp', None)
+    import webapp
+
+    monkeypatch.setattr(webapp.page_cache, 'maxsize', 10)
+    client = webapp.app.test_client()
+    client.post('/users', data={'id': '1', 'name': 'Alice', 'email': 'a@example.com'})
+
+    rv = client.get('/users')
+    etag = rv.headers['ETag']
+    assert rv.status_code == 200 and rv.headers['Last-Modified']
+    assert 'no-cache' in rv.headers['Cache-Control']
+
+    # unchanged table: the client's copy is still good
+    rv = client.get('/users', headers={'If-None-Match': etag})
+    assert rv.status_code == 304 and rv.get_data() == b''
+
+    # served again from the page cache
+    hits = webapp.page_cache.hits
+    assert 'Alice' in client.get('/users').get_data(as_text=True)
+    assert webapp.page_cache.hits == hits + 1
+
+    # a change gives a new ETag and a freshly rendered page
+    client.post('/users', data={'id': '2', 'name': 'Bob', 'email': 'b@example.com'})
+    rv = client.get('/users', headers={'If-None-Match': etag})
+    assert rv.status_code == 200 and rv.headers['ETag'] != etag
+    assert 'Bob' in rv.get_data(as_text=True)
+
+    # streamed pages carry validators but are not cached
+    rv = client.get('/users?stream=1')
+    assert rv.headers['ETag'] == client.get('/users').headers['ETag']
+    assert 'Bob' in rv.get_data(as_text=True)
+    assert client.get('/users?stream=1', headers={'If-None-Match': rv.headers['ETag']}).status_code == 304
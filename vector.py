@@ -0,0 +1,169 @@
+#Optional NumPy execution path for predicates and aggregates
+#
+# A column is turned into arrays once per table version and cached by the
+# table: numbers as a numeric array, strings as dictionary codes. Without
+# NumPy `np` is None and tables evaluate rows in Python instead.
+
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# below this many rows building arrays costs more than it saves
+MIN_ROWS = 1024
+
+
+class Vector:
+    """One column as arrays.
+
+    kind "num": `data` holds the values, zero where NULL.
+    kind "str": `data` holds codes into `dictionary`; NULL is the code
+    len(dictionary). kind "obj" (mixed types) keeps the Python `values`.
+    """
+
+    def __init__(self, kind, valid, data=None, dictionary=None, values=None):
+        self.kind = kind
+        self.valid = valid
+        self.data = data
+        self.dictionary = dictionary
+        self.values = values
+
+    def __len__(self):
+        return len(self.valid)
+
+
+def from_values(values):
+    n = len(values)
+    valid = np.fromiter((v is not None for v in values), bool, n)
+    types = {type(v) for v in values} - {type(None)}
+    if types <= {str}:
+        encoding = {}
+        codes = np.fromiter((-1 if v is None else encoding.setdefault(v, len(encoding)) for v in values), np.int64, n)
+        codes[~valid] = len(encoding)
+        return Vector("str", valid, data=codes, dictionary=list(encoding))
+    if types <= {int, float, bool}:
+        try:
+            data = np.array([0 if v is None else v for v in values])
+        except OverflowError:
+            data = None
+        if data is not None and data.dtype.kind in "biuf":
+            return Vector("num", valid, data=data)
+    return Vector("obj", valid, values=values)
+
+
+def from_column(col):
+    # a columnar Column: dictionary codes are reused without decoding, and
+    # typed arrays of numbers or booleans are copied in one go
+    if isinstance(col.values, array):
+        if col.decode not in (None, bool):
+            return from_values([col.get(i) for i in range(col.size)])
+        data = np.array(col.values, dtype=col.values.typecode)
+        return Vector("num", bitmap(col.validity, col.size), data=data.astype(bool) if col.decode else data)
+    if col.values is not None:
+        return from_values(col.values)
+    valid = bitmap(col.validity, col.size)
+    codes = np.frombuffer(col.codes, dtype=np.uint32).astype(np.int64)
+    codes[~valid] = len(col.dictionary)
+    return Vector("str", valid, data=codes, dictionary=list(col.dictionary))
+
+
+def bitmap(bits, size):
+    # little-endian bit array (one bit per row) as a bool array
+    return np.unpackbits(np.frombuffer(bits, dtype=np.uint8), bitorder="little")[:size].astype(bool)
+
+
+def _numeric(v):
+    return isinstance(v, (int, float))
+
+
+def compare(vec, op, val, matcher):
+    """Boolean mask of the rows matching `op val`.
+
+    `matcher(op, val)` builds the row-at-a-time test, used for strings
+    (once per distinct value) and for mixed-type columns.
+    """
+    if op == "BETWEEN":
+        return compare(vec, ">=", val[0], matcher) & compare(vec, "<=", val[1], matcher)
+    if vec.kind == "str":
+        # evaluate the test once per distinct string, then gather by code
+        test = matcher(op, val)
+        lookup = np.fromiter(map(test, vec.dictionary + [None]), bool, len(vec.dictionary) + 1)
+        return lookup[vec.data]
+    if vec.kind == "obj":
+        return np.fromiter(map(matcher(op, val), vec.values), bool, len(vec.values))
+    if not _numeric(val):
+        # NULLs sort before numbers and numbers before everything else,
+        # so all non-NULL values of a numeric column compare alike
+        test = matcher(op, val)
+        return np.where(vec.valid, test(0), test(None))
+    data, valid = vec.data, vec.valid
+    if op == "=":
+        return valid & (data == val)
+    if op == "!=":
+        return ~valid | (data != val)
+    if op == "<":
+        return ~valid | (data < val)
+    if op == "<=":
+        return ~valid | (data <= val)
+    if op == ">":
+        return valid & (data > val)
+    return valid & (data >= val)
+
+
+def combine(op, masks):
+    # AND / OR / NOT of boolean masks
+    if op == "NOT":
+        return ~masks[0]
+    out = masks[0].copy()
+    for m in masks[1:]:
+        if op == "AND":
+            out &= m
+        else:
+            out |= m
+    return out
+
+
+def bitmap_bytes(flags):
+    # one byte per row (0 or 1) as a bool array
+    return np.frombuffer(flags, dtype=np.uint8).astype(bool)
+
+
+def positions(mask, live=None):
+    # row positions selected by a mask, skipping rows cleared in `live`
+    if live is not None:
+        mask = mask & bitmap_bytes(live)
+    return np.flatnonzero(mask).tolist()
+
+
+def reduce(func, vec, mask=None):
+    """COUNT/SUM/AVG/MIN/MAX of the non-NULL values selected by `mask`.
+
+    Returns NotImplemented when the column has no array form for `func`
+    (e.g. SUM of strings), so the caller can fall back to Python.
+    """
+    sel = vec.valid if mask is None else vec.valid & mask
+    if func == "COUNT":
+        return int(np.count_nonzero(sel))
+    if vec.kind == "num":
+        data = vec.data[sel]
+        if not len(data):
+            return None
+        if func == "MIN":
+            return data.min().item()
+        if func == "MAX":
+            return data.max().item()
+        if data.dtype.kind in "iu" and float(np.abs(data).max()) * len(data) >= 2 ** 63:
+            # int64 would overflow; Python ints do not
+            return NotImplemented
+        if func == "SUM":
+            return data.sum().item()
+        return data.mean().item()
+    if vec.kind == "str" and func in ("MIN", "MAX"):
+        codes = np.unique(vec.data[sel])
+        if not len(codes):
+            return None
+        strings = [vec.dictionary[c] for c in codes.tolist()]
+        return min(strings) if func == "MIN" else max(strings)
+    return NotImplemented
@@ -0,0 +1,119 @@
+#Append-only write-ahead log shared by the tables of one database directory
+
+import json, os, time
+
+import datatypes
+
+WAL_FILE = "_wal.log"
+
+
+class WriteAheadLog:
+    """JSON-lines log of table mutations with batched fsync.
+
+    Every entry carries a log sequence number (lsn). Table snapshots record
+    the lsn they include, so replay only applies the entries written after.
+    Processes sharing a log append under the directory's file lock and
+    follow each other's appends with refresh().
+    """
+
+    def __init__(self, path, sync_every=64, sync_interval=1.0):
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.lsn = 0
+        # bytes of the log this process has read or written
+        self.offset = 0
+        self._f = open(path, "a")
+        self.refresh()
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def _read(self, offset=0):
+        # (entry, bytes) of each complete line from a byte offset on
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # torn tail from a crash mid-write
+                    break
+                yield entry, len(line)
+
+    def entries(self, table=None, after=0):
+        for entry, _ in self._read():
+            if entry["lsn"] <= after or entry.get("op") == "checkpoint":
+                continue
+            if table is None or entry["table"] == table:
+                yield entry
+
+    def refresh(self):
+        """Entries appended by others since this log last read or wrote.
+
+        Also returns whether the log was replaced by a checkpoint meanwhile,
+        in which case the older entries are in the table snapshots instead.
+        """
+        try:
+            replaced = os.stat(self.path).st_ino != os.fstat(self._f.fileno()).st_ino
+        except FileNotFoundError:
+            return [], False
+        if replaced:
+            self._f.close()
+            self._f = open(self.path, "a")
+            self.offset = 0
+        new = []
+        for entry, size in self._read(self.offset):
+            self.offset += size
+            # a checkpoint marker carries the lsn to continue from
+            self.lsn = max(self.lsn, entry["lsn"])
+            if entry.get("op") != "checkpoint":
+                new.append(entry)
+        return new, replaced
+
+    def tables(self):
+        return {e["table"] for e in self.entries()}
+
+    def append(self, table, entry):
+        self.lsn += 1
+        entry = dict(entry, lsn=self.lsn, table=table)
+        line = json.dumps(entry, default=datatypes.to_json) + "\n"
+        self._f.write(line)
+        self.offset += len(line.encode())
+        # hand the line to the OS right away; fsync is batched
+        self._f.flush()
+        self._unsynced += 1
+        if self._unsynced >= self.sync_every or time.monotonic() - self._last_sync >= self.sync_interval:
+            self.sync()
+        return self.lsn
+
+    def sync(self):
+        if self._f.closed:
+            return
+        self._f.flush()
+        if self._unsynced:
+            os.fsync(self._f.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def size(self):
+        return self._f.tell()
+
+    def truncate(self):
+        # keep the lsn counter going across checkpoints; the new log replaces
+        # the old one by rename, so other processes notice in refresh()
+        self._f.close()
+        line = json.dumps({"lsn": self.lsn, "op": "checkpoint"}) + "\n"
+        with open(f"{self.path}.tmp", "w") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f"{self.path}.tmp", self.path)
+        self._f = open(self.path, "a")
+        self.offset = len(line.encode())
+        self._unsynced = 0
+
+    def close(self):
+        self.sync()
+        self._f.close()
@@ -1,17 +1,32 @@
-from flask import Flask, request, redirect, url_for, render_template_string
-from db import Database, DATA_DIR
+from flask import Flask, Response, request, redirect, url_for, render_template, stream_with_context, jsonify
+from jinja2 import DictLoader
+from werkzeug.http import is_resource_modified
+from collections import OrderedDict
+from datetime import datetime, timezone
+from itertools import islice
+from db import Database, DATA_DIR, table_names, table_path, where_leaves
+import datatypes
+import json
 import os
+import secrets
 import shutil
+import threading
 
 app = Flask(__name__)
 # Simple secret key for flash-like behavior (not used for production)
 app.secret_key = "dev-secret"
+# seconds between background vacuums of the row versions kept for
+# table pages still streaming from a snapshot
+VACUUM_INTERVAL = 5.0
 
-# default single database instance (for backward compatibility / quick demos)
-db = Database()
+# default single database instance (for backward compatibility / quick demos);
+# mutations are appended to a write-ahead log instead of rewriting table files.
+# Shared mode lets several worker processes serve the same data directory:
+# each write runs in an exclusive block and reads catch up with the others
+db = Database(wal=True, vacuum_interval=VACUUM_INTERVAL, shared=True)
 
 # load users table if it exists on disk, otherwise create it
-if os.path.exists(f"{DATA_DIR}/users.json"):
+if table_path("users", DATA_DIR):
     try:
         db.load("users")
     except Exception:
@@ -19,31 +34,30 @@ if os.path.exists(f"{DATA_DIR}/users.json"):
 else:
     db.create_table("users", ["id", "name", "email"], pk="id", uniques=["email"], if_not_exists=True)
 
-# manager for multiple named databases (stored under DATA_DIR/<dbname>/)
+# manager for multiple named databases (stored under DATA_DIR/<dbname>/);
+# request threads share the instances, so the dict is guarded by a lock
 db_instances = {}
+db_instances_lock = threading.Lock()
 
 def get_db_instance(dbname):
-    """Return a Database object for the given dbname, loading tables from disk if necessary."""
-    if dbname in db_instances:
-        return db_instances[dbname]
-    d = Database()
-    base = os.path.join(DATA_DIR, dbname)
-    if os.path.isdir(base):
-        # load all tables from this database directory
-        for fname in os.listdir(base):
-            if fname.endswith('.json'):
-                tname = fname[:-5]
-                try:
-                    d.load(tname, base_dir=base)
-                except Exception:
-                    # skip invalid tables
-                    pass
-    db_instances[dbname] = d
-    return d
+    """Return a Database object for the given dbname, cataloguing its tables from disk if necessary."""
+    with db_instances_lock:
+        d = db_instances.get(dbname)
+        if d is None:
+            d = Database(wal=True, vacuum_interval=VACUUM_INTERVAL, shared=True)
+            base = os.path.join(DATA_DIR, dbname)
+            if os.path.isdir(base):
+                # catalog the tables of this database; rows load on first access
+                d.open(base)
+            db_instances[dbname] = d
+        return d
+
+# Page templates extend LAYOUT_TEMPLATE ("layout.html") and fill in its
+# content block; they are compiled once, when the module is imported.
 
 # This template renders the default users table (backwards compatible view)
-# Fragment for the users table content
-USERS_TEMPLATE = """
+USERS_TEMPLATE = """{% extends "layout.html" %}
+{% block content %}
 <h1>Users</h1>
 {% if message %}
   <p class="{{ 'error' if error else 'success' }}">{{ message }}</p>
@@ -69,6 +83,11 @@ USERS_TEMPLATE = """
     {% endfor %}
   </tbody>
 </table>
+{% if pager %}
+<p class="pager">{{ pager.total }} row(s)
+  {% for label, href in pager.links %}<a class="btn" href="{{ href }}">{{ label }}</a>{% endfor %}
+</p>
+{% endif %}
 
 <div class="controls">
   <h2>Add User</h2>
@@ -80,9 +99,10 @@ USERS_TEMPLATE = """
   </form>
 </div>
 <p style="margin-top:1rem"><a class="btn" href="{{ url_for('databases_page') }}">Manage Databases</a></p>
+{% endblock %}
 """
 
-# Shared layout that wraps page fragments in a consistent design
+# Shared layout the pages extend for a consistent design
 LAYOUT_TEMPLATE = """
 <!doctype html>
 <html lang=en>
@@ -108,6 +128,7 @@ LAYOUT_TEMPLATE = """
       .form-row { display: flex; align-items: center; gap: 8px; margin-bottom: .5rem; width: 100%; }
       .form-row label { width: 140px; font-weight: 600; }
       .form-row input { padding: 8px; width: 320px; max-width: 100%; border: 1px solid #ccc; border-radius: 4px; }
+      .pager { margin-top: .5rem; color: #666; }
       footer { margin-top: 1rem; font-size: 0.9rem; color: #666; }
     </style>
   </head>
@@ -123,7 +144,7 @@ LAYOUT_TEMPLATE = """
         </nav>
       </header>
       <main>
-        {{ content|safe }}
+        {% block content %}{% endblock %}
       </main>
       <footer>
         Small demo DB - data stored under <code>{{ data_dir }}</code>
@@ -134,8 +155,8 @@ LAYOUT_TEMPLATE = """
 """
 
 # Template to render the list of databases and creation form
-# content fragment for the databases page
-DATABASES_TEMPLATE = """
+DATABASES_TEMPLATE = """{% extends "layout.html" %}
+{% block content %}
 <h1>Databases</h1>
 {% if message %}
   <p class="{{ 'error' if error else 'success' }}">{{ message }}</p>
@@ -160,11 +181,13 @@ DATABASES_TEMPLATE = """
 </form>
 
 <p style="margin-top:1rem"><a class="btn" href="{{ url_for('users_page') }}">Back to users</a></p>
+{% endblock %}
 """
 
 
-# fragment for edit page
-EDIT_TEMPLATE = """
+# edit page of one row
+EDIT_TEMPLATE = """{% extends "layout.html" %}
+{% block content %}
 <h1>Edit Row</h1>
 {% if message %}
   <p class="{{ 'error' if error else 'success' }}">{{ message }}</p>
@@ -178,17 +201,144 @@ EDIT_TEMPLATE = """
     <a class="btn" href="{{ back_url }}">Cancel</a>
   </div>
 </form>
+{% endblock %}
 """
 
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def _int_arg(name, default, low, high=None):
+    try:
+        value = int(request.args.get(name, default))
+    except ValueError:
+        value = default
+    value = max(low, value)
+    return value if high is None else min(value, high)
+
+
+def paginate(t, endpoint, **url_args):
+    """Rows for one page of table `t` and the pager links around it.
+
+    `?page=N&per_page=M` pages by position; `?after=<pk>` pages by primary
+    key (keyset). Keyset pages cost the same however deep they go only
+    when the primary key has a sorted index; otherwise each page scans
+    and sorts the rows after the key.
+    """
+    per_page = _int_arg('per_page', PAGE_SIZE, 1, MAX_PAGE_SIZE)
+    after = request.args.get('after')
+    links = []
+    if after is not None and t.primary_key:
+        rows = list(t.scan(after=after, limit=per_page))
+        links.append(('First', url_for(endpoint, per_page=per_page, **url_args)))
+        if len(rows) == per_page:
+            links.append(('Next', url_for(endpoint, after=rows[-1].get(t.primary_key), per_page=per_page, **url_args)))
+    else:
+        page = _int_arg('page', 1, 1)
+        offset = (page - 1) * per_page
+        rows = list(t.scan(offset, per_page))
+        if page > 1:
+            links.append(('Prev', url_for(endpoint, page=page - 1, per_page=per_page, **url_args)))
+        if offset + per_page < t.row_count():
+            links.append(('Next', url_for(endpoint, page=page + 1, per_page=per_page, **url_args)))
+    return rows, {'total': t.row_count(), 'links': links}
+
+
+def stream_page(template, **context):
+    """Stream a page, rendered as rows are produced."""
+    body = app.jinja_env.get_template(template).generate(**context)
+    return Response(stream_with_context(body), mimetype='text/html')
+
+
+class PageCache:
+    """Rendered table pages by URL, each valid for one version of its table.
+
+    Off (maxsize 0) by default: set page_cache.maxsize to keep that many
+    pages, least recently used first out.
+    """
+
+    def __init__(self, maxsize=0):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        if not self.maxsize:
+            return None
+        with self._lock:
+            entry = self._pages.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._pages.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, version, page):
+        if not self.maxsize:
+            return
+        with self._lock:
+            self._pages[key] = (version, page)
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.maxsize:
+                self._pages.popitem(last=False)
+
+
+page_cache = PageCache()
+# tells this process's ETags apart from those of other (or earlier) processes,
+# whose table serials and versions count independently
+ETAG_PREFIX = secrets.token_hex(4)
+
+
+def table_page(t, render):
+    """The response for a page showing table `t`; render() runs only when needed.
+
+    ETag and Last-Modified follow the table's version, so a client already
+    holding the page gets a 304, and rendered pages come from page_cache
+    while the table is unchanged. Streamed pages are never cached.
+    """
+    # taken before rendering: a write meanwhile only makes the tag stale
+    version = (t.serial, t.version)
+    etag = f"{ETAG_PREFIX}-{version[0]}-{version[1]}"
+    modified = datetime.fromtimestamp(t.modified, timezone.utc)
+    if not is_resource_modified(request.environ, etag=etag, last_modified=modified):
+        response = Response(status=304)
+    else:
+        page = page_cache.get(request.full_path, version)
+        if page is None:
+            page = render()
+            if isinstance(page, str):
+                page_cache.put(request.full_path, version, page)
+        response = app.make_response(page)
+        if response.status_code != 200:
+            return response
+    response.set_etag(etag)
+    response.last_modified = modified
+    # browsers keep the page but ask again each time
+    response.cache_control.no_cache = True
+    return response
+
+
 @app.route('/users', methods=['GET'])
 def users_page():
     # Show the users table (backwards compatible)
+    if 'users' in db.tables:
+        # picks up rows other worker processes added
+        db.refresh('users')
     table = db.tables.get('users')
-    users = table.rows if table else []
-    message = request.args.get('message')
-    error = request.args.get('error') == '1'
-    content = render_template_string(USERS_TEMPLATE, users=users, message=message, error=error)
-    return render_template_string(LAYOUT_TEMPLATE, title='Users', content=content, data_dir=DATA_DIR)
+    context = dict(title='Users', data_dir=DATA_DIR, message=request.args.get('message'), error=request.args.get('error') == '1')
+    if not table:
+        return render_template('users.html', users=[], pager=None, **context)
+
+    def render():
+        if request.args.get('stream') == '1':
+            # whole table, rendered while it is sent
+            return stream_page('users.html', users=table.scan(), pager=None, **context)
+        users, pager = paginate(table, 'users_page')
+        return render_template('users.html', users=users, pager=pager, **context)
+    return table_page(table, render)
 
 
 # Landing page redirects to the databases dashboard
@@ -211,8 +361,7 @@ def databases_page():
     names = get_databases_list()
     message = request.args.get('message')
     error = request.args.get('error') == '1'
-    content = render_template_string(DATABASES_TEMPLATE, databases=names, message=message, error=error)
-    return render_template_string(LAYOUT_TEMPLATE, title='Databases', content=content, data_dir=DATA_DIR)
+    return render_template('databases.html', title='Databases', data_dir=DATA_DIR, databases=names, message=message, error=error)
 
 
 @app.route('/databases', methods=['POST'])
@@ -234,11 +383,15 @@ def drop_database(dbname):
         return redirect(url_for('databases_page', message='Database not found', error=1))
     shutil.rmtree(path)
     # remove instance if loaded
-    db_instances.pop(dbname, None)
+    with db_instances_lock:
+        d = db_instances.pop(dbname, None)
+    if d is not None:
+        d.close()
     return redirect(url_for('databases_page', message='Database dropped'))
 
 
-DB_VIEW_TEMPLATE = """
+DB_VIEW_TEMPLATE = """{% extends "layout.html" %}
+{% block content %}
 <h1>Database: {{ dbname }}</h1>
 {% if message %}<p class="{{ 'error' if error else 'success' }}">{{ message }}</p>{% endif %}
 
@@ -257,12 +410,16 @@ DB_VIEW_TEMPLATE = """
 <h3>Create Table</h3>
 <form method="post" action="{{ url_for('create_table', dbname=dbname) }}">
   <div class="form-row"><label for="tname">Name:</label><input id="tname" name="tname"></div>
-  <div class="form-row"><label for="cols">Columns (comma separated):</label><input id="cols" name="cols"></div>
+  <div class="form-row"><label for="cols">Columns (comma separated, each with an optional type: INTEGER, REAL, TEXT, BOOLEAN or TIMESTAMP):</label><input id="cols" name="cols" placeholder="id INTEGER, name TEXT"></div>
   <div class="form-row"><label for="pk">Primary key (optional):</label><input id="pk" name="pk"></div>
   <div class="form-row"><label for="uniques">Unique keys (comma sep):</label><input id="uniques" name="uniques"></div>
+  <div class="form-row"><label for="engine">Storage:</label>
+    <select id="engine" name="engine"><option value="row">row</option><option value="columnar">columnar</option></select>
+  </div>
   <button class="btn primary" type="submit">Create Table</button>
 </form>
 <p style="margin-top:1rem"><a class="btn" href="{{ url_for('databases_page') }}">Back to databases</a></p>
+{% endblock %}
 """
 
 @app.route('/db/<dbname>', methods=['GET'])
@@ -270,24 +427,31 @@ def view_db(dbname):
     path = os.path.join(DATA_DIR, dbname)
     if not os.path.isdir(path):
         return f"Database {dbname} not found", 404
-    tables = [f[:-5] for f in os.listdir(path) if f.endswith('.json')]
+    tables = table_names(path)
     message = request.args.get('message')
     error = request.args.get('error') == '1'
-    content = render_template_string(DB_VIEW_TEMPLATE, dbname=dbname, tables=tables, message=message, error=error)
-    return render_template_string(LAYOUT_TEMPLATE, title=f"DB: {dbname}", content=content, data_dir=os.path.join(DATA_DIR, dbname))
+    return render_template('db.html', title=f"DB: {dbname}", data_dir=path, dbname=dbname, tables=tables, message=message, error=error)
 
 
 @app.route('/db/<dbname>/tables/create', methods=['POST'])
 def create_table(dbname):
     d = get_db_instance(dbname)
     tname = request.form.get('tname')
-    cols = [c.strip() for c in request.form.get('cols', '').split(',') if c.strip()]
+    specs = [c.split() for c in request.form.get('cols', '').split(',') if c.strip()]
+    cols = [spec[0] for spec in specs]
+    types = {spec[0]: spec[1] for spec in specs if len(spec) == 2}
     pk = request.form.get('pk') or None
     uniques = [u.strip() for u in request.form.get('uniques', '').split(',') if u.strip()]
+    engine = request.form.get('engine') or 'row'
+    base = os.path.join(DATA_DIR, dbname)
     try:
-        d.create_table(tname, cols, pk, uniques)
-        # save immediately
-        d.save(tname, base_dir=os.path.join(DATA_DIR, dbname))
+        bad = [' '.join(spec) for spec in specs if len(spec) > 2]
+        if bad:
+            raise ValueError(f"Invalid column definitions: {bad}")
+        with d.exclusive(base):
+            d.create_table(tname, cols, pk, uniques, engine=engine, types=types)
+            # save immediately
+            d.save(tname, base_dir=base)
         return redirect(url_for('view_db', dbname=dbname, message='Table created'))
     except Exception as e:
         return redirect(url_for('view_db', dbname=dbname, message=str(e), error=1))
@@ -303,7 +467,8 @@ def drop_table(dbname, table):
         return redirect(url_for('view_db', dbname=dbname, message=str(e), error=1))
 
 
-TABLE_TEMPLATE = """
+TABLE_TEMPLATE = """{% extends "layout.html" %}
+{% block content %}
 <h1>DB: {{ dbname }} / Table: {{ table }}</h1>
 {% if message %}<p class="{{ 'error' if error else 'success' }}">{{ message }}</p>{% endif %}
 <table>
@@ -328,6 +493,11 @@ TABLE_TEMPLATE = """
     {% endfor %}
   </tbody>
 </table>
+{% if pager %}
+<p class="pager">{{ pager.total }} row(s)
+  {% for label, href in pager.links %}<a class="btn" href="{{ href }}">{{ label }}</a>{% endfor %}
+</p>
+{% endif %}
 
 <h3>Add Row</h3>
 <form method="post" action="{{ url_for('create_row', dbname=dbname, table=table) }}">
@@ -337,6 +507,7 @@ TABLE_TEMPLATE = """
   <button class="btn primary" type="submit">Add Row</button>
 </form>
 <p style="margin-top:1rem"><a class="btn" href="{{ url_for('view_db', dbname=dbname) }}">Back to DB</a></p>
+{% endblock %}
 """
 
 
@@ -344,19 +515,24 @@ TABLE_TEMPLATE = """
 def view_table(dbname, table):
     d = get_db_instance(dbname)
     try:
-        d.load(table, base_dir=os.path.join(DATA_DIR, dbname))
+        # served from memory unless the table file changed on disk
+        d.refresh(table, base_dir=os.path.join(DATA_DIR, dbname))
     except Exception:
-        # if it's already loaded, ignore
         pass
     if table not in d.tables:
         return "Table not found", 404
     t = d.tables[table]
-    rows = t.rows
     message = request.args.get('message')
     error = request.args.get('error') == '1'
+    context = dict(title=f"Table: {table}", data_dir=os.path.join(DATA_DIR, dbname), dbname=dbname, table=table,
+                   columns=t.columns, primary_key=t.primary_key, message=message, error=error)
 
-    content = render_template_string(TABLE_TEMPLATE, dbname=dbname, table=table, columns=t.columns, rows=rows, primary_key=t.primary_key, message=message, error=error)
-    return render_template_string(LAYOUT_TEMPLATE, title=f"Table: {table}", content=content, data_dir=os.path.join(DATA_DIR, dbname))
+    def render():
+        if request.args.get('stream') == '1':
+            return stream_page('table.html', rows=t.scan(), pager=None, **context)
+        rows, pager = paginate(t, 'view_table', dbname=dbname, table=table)
+        return render_template('table.html', rows=rows, pager=pager, **context)
+    return table_page(t, render)
 
 
 @app.route('/users', methods=['POST'])
@@ -370,8 +546,9 @@ def create():
             'name': request.form.get('name'),
             'email': request.form.get('email')
         }
-        table.insert(record)
-        db.save('users')
+        with db.exclusive():
+            db.tables['users'].insert(record)
+            db.save('users')
         return redirect(url_for('users_page', message='User added'))
     except ValueError as e:
         return str(e), 400
@@ -382,14 +559,13 @@ def edit(id):
     table = db.tables.get('users')
     if not table:
         return "Users table not found", 500
-    user = next((r for r in table.rows if r.get('id') == id), None)
+    user = next(iter(table.select(('id', id))), None)
     if not user:
         return "User not found", 404
     message = request.args.get('message')
     error = request.args.get('error') == '1'
     # render edit template expecting a generic 'row' variable
-    content = render_template_string(EDIT_TEMPLATE, row=user, columns=table.columns, action_url=url_for('update', id=id), back_url=url_for('users_page'), message=message, error=error)
-    return render_template_string(LAYOUT_TEMPLATE, title='Edit User', content=content, data_dir=DATA_DIR)
+    return render_template('edit.html', title='Edit User', data_dir=DATA_DIR, row=user, columns=table.columns, action_url=url_for('update', id=id), back_url=url_for('users_page'), message=message, error=error)
 
 
 # generic row edit for a table in a named database
@@ -397,17 +573,16 @@ def edit(id):
 def edit_row(dbname, table, pk):
     d = get_db_instance(dbname)
     try:
-        d.load(table, base_dir=os.path.join(DATA_DIR, dbname))
+        d.refresh(table, base_dir=os.path.join(DATA_DIR, dbname))
     except Exception:
         pass
     if table not in d.tables:
         return "Table not found", 404
     t = d.tables[table]
-    row = next((r for r in t.rows if (t.primary_key and r.get(t.primary_key) == pk)), None)
+    row = next(iter(t.select((t.primary_key, pk))), None) if t.primary_key else None
     if not row:
         return "Row not found", 404
-    content = render_template_string(EDIT_TEMPLATE, row=row, columns=t.columns, action_url=url_for('update_row', dbname=dbname, table=table, pk=pk), back_url=url_for('view_table', dbname=dbname, table=table))
-    return render_template_string(LAYOUT_TEMPLATE, title=f'Edit {table}', content=content, data_dir=os.path.join(DATA_DIR, dbname))
+    return render_template('edit.html', title=f'Edit {table}', data_dir=os.path.join(DATA_DIR, dbname), row=row, columns=t.columns, action_url=url_for('update_row', dbname=dbname, table=table, pk=pk), back_url=url_for('view_table', dbname=dbname, table=table))
 
 @app.route('/update/<id>', methods=['POST'])
 def update(id):
@@ -420,14 +595,24 @@ def update(id):
             'name': request.form.get('name'),
             'email': request.form.get('email')
         }
-        table.update(('id', id), updates)
-        db.save('users')
+        with db.exclusive():
+            db.tables['users'].update(('id', id), updates)
+            db.save('users')
         return redirect(url_for('users_page', message='User updated'))
     except ValueError as e:
         # return to edit page with error message
         return redirect(url_for('edit', id=id, message=str(e), error=1))
 
 
+def form_record(t):
+    """The posted value of each column; an empty field is NULL in typed columns other than TEXT."""
+    record = {c: request.form.get(c) for c in t.columns}
+    for c, kind in t.types.items():
+        if record[c] == '' and kind != 'TEXT':
+            record[c] = None
+    return record
+
+
 @app.route('/db/<dbname>/tables/<table>/update/<pk>', methods=['POST'])
 def update_row(dbname, table, pk):
     d = get_db_instance(dbname)
@@ -437,10 +622,13 @@ def update_row(dbname, table, pk):
         except Exception:
             return "Table not found", 404
     t = d.tables[table]
-    updates = {c: request.form.get(c) for c in t.columns}
+    updates = form_record(t)
+    base = os.path.join(DATA_DIR, dbname)
     try:
-        t.update((t.primary_key or t.columns[0], pk), updates)
-        d.save(t.name, base_dir=os.path.join(DATA_DIR, dbname))
+        with d.exclusive(base):
+            t = d.tables[table]
+            t.update((t.primary_key or t.columns[0], pk), updates)
+            d.save(t.name, base_dir=base)
         return redirect(url_for('view_table', dbname=dbname, table=table, message='Row updated'))
     except ValueError as e:
         return redirect(url_for('edit_row', dbname=dbname, table=table, pk=pk, message=str(e), error=1))
@@ -450,8 +638,9 @@ def delete(id):
     table = db.tables.get('users')
     if not table:
         return "Users table not found", 500
-    table.delete(('id', id))
-    db.save('users')
+    with db.exclusive():
+        db.tables['users'].delete(('id', id))
+        db.save('users')
     return redirect(url_for('users_page', message='User deleted'))
 
 
@@ -464,10 +653,13 @@ def create_row(dbname, table):
         except Exception:
             return "Table not found", 404
     t = d.tables[table]
-    record = {c: request.form.get(c) for c in t.columns}
+    record = form_record(t)
+    base = os.path.join(DATA_DIR, dbname)
     try:
-        t.insert(record)
-        d.save(t.name, base_dir=os.path.join(DATA_DIR, dbname))
+        with d.exclusive(base):
+            t = d.tables[table]
+            t.insert(record)
+            d.save(t.name, base_dir=base)
         return redirect(url_for('view_table', dbname=dbname, table=table, message='Row added'))
     except ValueError as e:
         return redirect(url_for('view_table', dbname=dbname, table=table, message=str(e), error=1))
@@ -485,10 +677,219 @@ def delete_row(dbname, table):
     pk = request.form.get('pk')
     if not pk:
         return redirect(url_for('view_table', dbname=dbname, table=table, message='Missing PK', error=1))
-    t.delete((t.primary_key, pk))
-    d.save(t.name, base_dir=os.path.join(DATA_DIR, dbname))
+    base = os.path.join(DATA_DIR, dbname)
+    try:
+        with d.exclusive(base):
+            t = d.tables[table]
+            t.delete((t.primary_key, pk))
+            d.save(t.name, base_dir=base)
+    except ValueError as e:
+        return redirect(url_for('view_table', dbname=dbname, table=table, message=str(e), error=1))
     return redirect(url_for('view_table', dbname=dbname, table=table, message='Row deleted'))
 
 
+# JSON API: /api/db/<dbname>/tables/<table>/rows
+#
+# GET returns {"rows": [...], "count": n, "next": url-or-null}, streamed as
+# it is encoded. POST, PATCH and DELETE take a JSON array and apply all of
+# it in one transaction, saved once: any bad row leaves the table as it was.
+# Query parameters other than these name a column to match exactly.
+API_PARAMS = ('where', 'columns', 'order_by', 'desc', 'limit', 'offset', 'after', 'stream')
+
+
+def api_error(message, status=400):
+    return jsonify({'error': message}), status
+
+
+def api_table(dbname, table):
+    """The (Database, Table, base dir) a request names, or None if the table does not exist."""
+    base = os.path.join(DATA_DIR, dbname)
+    if not os.path.isdir(base):
+        return None
+    d = get_db_instance(dbname)
+    try:
+        d.refresh(table, base_dir=base)
+    except Exception:
+        pass
+    if table not in d.tables:
+        return None
+    return d, d.tables[table], base
+
+
+def api_where(t):
+    """The where clause of a GET: `?where=<JSON clause>` AND `?<column>=<value>` for each column given."""
+    terms = []
+    if request.args.get('where'):
+        try:
+            terms.append(json.loads(request.args['where']))
+        except ValueError:
+            raise ValueError("where must be a JSON where clause, e.g. [\"price\", \">\", 100]")
+    for name, value in request.args.items(multi=True):
+        if name not in API_PARAMS:
+            if name not in t.columns:
+                raise ValueError(f"Unknown column: {name}")
+            terms.append((name, value))
+    if len(terms) < 2:
+        return terms[0] if terms else None
+    return ('AND', *terms)
+
+
+def api_rows(t):
+    """(rows, next url) for a GET of table `t`'s rows; the url is known once the rows are read.
+
+    Unordered rows stream from a snapshot; `order_by` (or `after`, which
+    pages by key like the table pages) reads a sorted page. At most
+    MAX_PAGE_SIZE rows are returned unless `?stream=1` asks for them all.
+    """
+    where = api_where(t)
+    columns = request.args['columns'].split(',') if request.args.get('columns') else None
+    stream = request.args.get('stream') == '1'
+    limit = None if stream else _int_arg('limit', PAGE_SIZE, 1, MAX_PAGE_SIZE)
+    offset = _int_arg('offset', 0, 0)
+    descending = request.args.get('desc') == '1'
+    order_by = request.args.get('order_by') or None
+    after = request.args.get('after')
+    key = None
+    if after is not None:
+        key = order_by = order_by or t.primary_key or t.columns[0]
+        page = (key, '<' if descending else '>', after)
+        where = page if where is None else ('AND', where, page)
+    # every column named anywhere must exist, whichever path reads the rows
+    named = (columns or []) + ([order_by] if order_by else []) + [leaf[0] for leaf in (where_leaves(where) if where else ())]
+    unknown = [c for i, c in enumerate(named) if c not in t.columns and c not in named[:i]]
+    if unknown:
+        raise ValueError(f"Unknown columns: {unknown}")
+    if order_by is None:
+        snap = t.snapshot()
+        try:
+            found = snap.rows(where, columns)
+        except ValueError:
+            snap.close()
+            raise
+        rows = islice(found, offset, None if limit is None else offset + limit)
+    else:
+        # a bounded page (by default); select keeps it in the result cache
+        rows = t.select(where, order_by=order_by, descending=descending, limit=limit, offset=0 if key else offset)
+    state = {'count': 0, 'last': None}
+
+    def read():
+        try:
+            for row in rows:
+                state['count'] += 1
+                state['last'] = row
+                yield row if order_by is None or not columns else {c: row.get(c) for c in columns}
+        finally:
+            if order_by is None:
+                snap.close()
+
+    def next_url():
+        if limit is None or state['count'] < limit:
+            return None
+        args = request.args.to_dict()
+        if key is not None:
+            args['after'] = state['last'][key]
+        else:
+            args['offset'] = offset + limit
+        return url_for(request.endpoint, **request.view_args, **args)
+    return read(), next_url
+
+
+def api_stream(rows, next_url):
+    # {"rows": [...], ...} one encoded row at a time
+    dumps = lambda value: json.dumps(value, default=datatypes.to_json)
+    yield '{"rows": ['
+    count = 0
+    for row in rows:
+        yield (',' if count else '') + dumps(row)
+        count += 1
+    yield f'], "count": {count}, "next": {dumps(next_url())}}}'
+
+
+@app.route('/api/db/<dbname>/tables/<table>/rows', methods=['GET'])
+def api_get_rows(dbname, table):
+    found = api_table(dbname, table)
+    if found is None:
+        return api_error("Table not found", 404)
+    t = found[1]
+
+    def render():
+        try:
+            rows, next_url = api_rows(t)
+        except ValueError as e:
+            return api_error(str(e))
+        return Response(stream_with_context(api_stream(rows, next_url)), mimetype='application/json')
+    return table_page(t, render)
+
+
+def _pk_of(t, row, n):
+    if not t.primary_key:
+        raise ValueError("Table has no primary key")
+    if not isinstance(row, dict) or t.primary_key not in row:
+        raise ValueError(f"Record {n}: missing primary key {t.primary_key}")
+    return row[t.primary_key]
+
+
+def insert_rows(t, rows):
+    # POST: an array of complete rows
+    return {'inserted': t.bulk_insert(rows)}
+
+
+def update_rows(t, rows):
+    # PATCH: an array of {primary key, changed columns...}, each updating the row with that key
+    updated = 0
+    for n, row in enumerate(rows, 1):
+        pk = _pk_of(t, row, n)
+        try:
+            updated += t.update((t.primary_key, pk), {c: v for c, v in row.items() if c != t.primary_key})
+        except ValueError as e:
+            raise ValueError(f"Record {n}: {e}")
+    return {'updated': updated}
+
+
+def delete_rows(t, keys):
+    # DELETE: an array of primary keys (or of rows holding them)
+    before = t.row_count()
+    for n, key in enumerate(keys, 1):
+        t.delete((t.primary_key, _pk_of(t, key if isinstance(key, dict) else {t.primary_key: key}, n)))
+    return {'deleted': before - t.row_count()}
+
+
+# method -> (change applied to the table with the posted array, success status);
+# the ASGI app (asgi.py) applies the same changes
+API_WRITES = {'POST': (insert_rows, 201), 'PATCH': (update_rows, 200), 'DELETE': (delete_rows, 200)}
+
+
+@app.route('/api/db/<dbname>/tables/<table>/rows', methods=list(API_WRITES))
+def api_write_rows(dbname, table):
+    """Apply the posted JSON array to the table all-or-nothing, then save the table once."""
+    found = api_table(dbname, table)
+    if found is None:
+        return api_error("Table not found", 404)
+    d, _, base = found
+    rows = request.get_json(silent=True)
+    if not isinstance(rows, list):
+        return api_error("Expected a JSON array")
+    change, status = API_WRITES[request.method]
+    [(ok, result)] = d.apply_all(table, [lambda t: change(t, rows)], base_dir=base)
+    if not ok:
+        if not isinstance(result, ValueError):
+            raise result
+        return api_error(str(result))
+    return jsonify(result), status
+
+
+app.jinja_loader = DictLoader({
+    'layout.html': LAYOUT_TEMPLATE,
+    'users.html': USERS_TEMPLATE,
+    'databases.html': DATABASES_TEMPLATE,
+    'db.html': DB_VIEW_TEMPLATE,
+    'table.html': TABLE_TEMPLATE,
+    'edit.html': EDIT_TEMPLATE,
+})
+# compile every template now rather than on its first request
+for name in app.jinja_loader.list_templates():
+    app.jinja_env.get_template(name)
+
+
 if __name__ == '__main__':
     app.run(debug=True)